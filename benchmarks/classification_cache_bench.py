@@ -0,0 +1,140 @@
+"""
+hCaptcha 模型调用缓存离线模拟：假模型 + 生成的挑战图片
+
+从固定的图片库中按 Zipf 分布抽取挑战（每次重新编码并加入轻微噪声，模拟重复出现的同一张图），
+分别在关闭/开启缓存的情况下运行，对比模型调用次数、耗时和命中率。
+
+用法:
+    python benchmarks/classification_cache_bench.py --images 200 --challenges 2000 --model-time 0.05 \\
+        --failure-rate 0.05 --output classification_cache_output.json
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from PIL import Image, ImageDraw  # noqa: E402
+
+from framework.classification_cache import ClassificationCache  # noqa: E402
+
+PROMPTS = ["Please click each image containing a bicycle", "Please click on the largest animal",
+           "Drag each piece to its matching shadow"]
+
+
+class Answer:
+    """代替 hcaptcha_challenger 的 pydantic 返回值"""
+
+    def __init__(self, answer):
+        self.answer = answer
+
+    def model_dump(self, mode="python"):
+        return {"answer": self.answer}
+
+
+class FakeModel:
+    def __init__(self, model_time: float):
+        self.model_time = model_time
+        self.calls = 0
+
+    def invoke(self, challenge_screenshot, model=None, **kwargs):
+        self.calls += 1
+        time.sleep(self.model_time)
+        return Answer(os.path.basename(str(challenge_screenshot)).split("-")[0])
+
+
+def make_image(index: int, rng: random.Random) -> Image.Image:
+    shapes = random.Random(index)
+    image = Image.new("RGB", (400, 400), tuple(shapes.randrange(256) for _ in range(3)))
+    draw = ImageDraw.Draw(image)
+    for _ in range(12):
+        x, y = shapes.randrange(380), shapes.randrange(380)
+        size = shapes.randrange(20, 160)
+        draw.ellipse((x, y, x + size, y + size), fill=tuple(shapes.randrange(256) for _ in range(3)))
+    # 每次出现都加入少量像素噪声
+    pixels = image.load()
+    for _ in range(200):
+        pixels[rng.randrange(400), rng.randrange(400)] = tuple(rng.randrange(256) for _ in range(3))
+    return image
+
+
+def run_point(args, workdir: str, use_cache: bool) -> dict:
+    rng = random.Random(args.seed)
+    weights = [1 / (i + 1) ** args.zipf for i in range(args.images)]
+    model = FakeModel(args.model_time)
+    cache = ClassificationCache(memory_entries=args.memory_entries,
+                                path=os.path.join(workdir, f"cache-{time.time_ns()}.db")) if use_cache else None
+    wrong = 0
+    started = time.monotonic()
+    for n in range(args.challenges):
+        index = rng.choices(range(args.images), weights)[0]
+        path = os.path.join(workdir, f"{index}-{n}.png")
+        make_image(index, rng).save(path, quality=rng.randrange(80, 95), format="JPEG")
+        prompt = PROMPTS[index % len(PROMPTS)]
+        if cache is None:
+            result = model.invoke(challenge_screenshot=path, model="fake")
+        else:
+            session = cache.session()
+            tool = session.wrap(model, "image_classifier", Answer, lambda: prompt)
+            result = tool.invoke(challenge_screenshot=path, model="fake")
+            # 模拟 hCaptcha 判定失败
+            session.finish(rng.random() >= args.failure_rate)
+        if result.answer != str(index):
+            wrong += 1
+        os.remove(path)
+    elapsed = time.monotonic() - started
+
+    point = {
+        "cache": use_cache,
+        "challenges": args.challenges,
+        "model_calls": model.calls,
+        "wrong_answers": wrong,
+        "elapsed_seconds": round(elapsed, 2),
+    }
+    if cache is not None:
+        point["classification_cache"] = cache.stats()
+    return point
+
+
+def bench_main(args):
+    points = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for use_cache in (False, True):
+            point = run_point(args, workdir, use_cache)
+            print(f"cache={use_cache} model_calls={point['model_calls']} elapsed={point['elapsed_seconds']}s",
+                  file=sys.stderr)
+            points.append(point)
+
+    report = {
+        "benchmark": "classification_cache",
+        "timestamp": time.time(),
+        "profile": {k: v for k, v in vars(args).items() if k != "output"},
+        "results": points,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    print(output)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="hCaptcha 模型调用缓存离线模拟")
+    parser.add_argument("--images", type=int, default=200, help="不同挑战图片的数量")
+    parser.add_argument("--zipf", type=float, default=1.1, help="图片出现频率的 Zipf 指数")
+    parser.add_argument("--challenges", type=int, default=2000, help="模拟的挑战次数")
+    parser.add_argument("--model-time", type=float, default=0.05, help="假模型单次调用耗时(秒)")
+    parser.add_argument("--failure-rate", type=float, default=0.05, help="求解被判定失败的比例")
+    parser.add_argument("--memory-entries", type=int, default=2048, help="内存缓存条数")
+    parser.add_argument("--seed", type=int, default=1, help="随机种子")
+    parser.add_argument("--output", help="结果 JSON 输出路径")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    bench_main(parse_args())
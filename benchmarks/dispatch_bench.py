@@ -0,0 +1,344 @@
+"""
+ws_client 调度链路离线压测：receiver -> task_queue -> task_worker -> ws.send
+
+本脚本启动一个本地 WebSocket 调度服务（模拟服务端），按固定速率推送合成任务，
+每个并发配置启动一个独立的 worker 子进程（真实的 core.ws_client），最后输出 JSON 结果。
+
+用法:
+    python benchmarks/dispatch_bench.py --concurrency 1,4,16 --rate 200 --tasks 2000 \\
+        --latency 0.05 --cpu-ms 1 --failure-rate 0.01 --output bench_output.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import types
+
+import msgpack
+import psutil
+import websockets
+import yaml
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TASK_TYPE = "SyntheticTask"
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, int(round(pct / 100 * (len(values) - 1)))))
+    return round(values[index], 6)
+
+
+def summarize(values) -> dict:
+    return {
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": round(max(values), 6) if values else None,
+        "mean": round(statistics.fmean(values), 6) if values else None,
+    }
+
+
+# ---------- worker 子进程 ----------
+
+def build_synthetic_handler(latency: float, jitter: float, cpu_ms: float, failure_rate: float):
+    """按配置的耗时/CPU/失败率生成合成处理器模块"""
+    module = types.ModuleType(TASK_TYPE)
+
+    async def run(task, proxy, config):
+        started_at = time.time()
+        if cpu_ms:
+            # 模拟在事件循环里驱动页面/解析协议的 Python 开销
+            deadline = time.perf_counter() + cpu_ms / 1000
+            while time.perf_counter() < deadline:
+                pass
+        delay = max(0.0, random.gauss(latency, jitter)) if jitter else latency
+        if delay:
+            await asyncio.sleep(delay)
+        if failure_rate and random.random() < failure_rate:
+            raise RuntimeError("synthetic failure")
+        return {"status": "success", "started_at": started_at, "token": "x" * 32}
+
+    module.run = run
+    return module
+
+
+async def loop_lag_probe(samples: list, interval: float = 0.05):
+    while True:
+        expected = time.perf_counter() + interval
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, time.perf_counter() - expected))
+
+
+async def child_main(args):
+    from core import ws_client
+
+    ws_client.registry.add_module(
+        TASK_TYPE, build_synthetic_handler(args.latency, args.jitter, args.cpu_ms, args.failure_rate)
+    )
+    lag_samples = []
+    probe = asyncio.create_task(loop_lag_probe(lag_samples))
+    try:
+        async with websockets.connect(f"ws://127.0.0.1:{args.port}/worker/bench") as ws:
+            await ws_client.run_session(ws, [TASK_TYPE], "bench")
+    except Exception:
+        pass
+    finally:
+        probe.cancel()
+    print(json.dumps({"loop_lag": summarize(lag_samples)}))
+
+
+# ---------- 模拟调度服务 ----------
+
+class Dispatcher:
+    def __init__(self, args):
+        self.args = args
+        self.sent_at = {}
+        self.queue_wait = []
+        self.end_to_end = []
+        self.failures = 0
+        self.registered = asyncio.Event()
+        self.done = asyncio.Event()
+        self.max_in_flight = 0
+        self.frames = 0
+        self.rejected = 0
+        # credits 模式下 worker 授予的额度
+        self.credits = None
+        self.credit_changed = asyncio.Event()
+
+    def in_flight(self) -> int:
+        return len(self.sent_at)
+
+    def _check_done(self):
+        if self.args.tasks == len(self.end_to_end) + self.rejected:
+            self.done.set()
+
+    def _on_result(self, data: dict, received_at: float):
+        task_id = data.get("taskId")
+        sent_at = self.sent_at.pop(task_id, None)
+        if sent_at is None:
+            return
+        result = data.get("result") or {}
+        self.end_to_end.append(received_at - sent_at)
+        if data.get("errorId") or result.get("status") != "success":
+            self.failures += 1
+        elif result.get("started_at"):
+            self.queue_wait.append(result["started_at"] - sent_at)
+        self._check_done()
+
+    async def _reader(self, ws):
+        async for msg in ws:
+            received_at = time.time()
+            data = msgpack.unpackb(msg, raw=False) if isinstance(msg, bytes) else json.loads(msg)
+            msg_type = data.get("type")
+            if msg_type == "register":
+                if self.args.batch or self.args.codec != "json":
+                    await ws.send(json.dumps({
+                        "type": "register_ack", "codec": self.args.codec, "batch_results": self.args.batch
+                    }))
+                self.registered.set()
+            elif msg_type == "task_result":
+                self.frames += 1
+                self._on_result(data, received_at)
+            elif msg_type == "task_results":
+                self.frames += 1
+                for item in data.get("results") or []:
+                    self._on_result(item, received_at)
+            elif msg_type == "task_rejected":
+                if self.sent_at.pop(data.get("taskId"), None) is not None:
+                    self.rejected += 1
+                    self._check_done()
+            elif msg_type == "credit_update":
+                self.credits = (data.get("credits") or {}).get(TASK_TYPE, 0)
+                self.credit_changed.set()
+
+    async def _writer(self, ws):
+        await self.registered.wait()
+        interval = 1 / self.args.rate if self.args.rate else 0
+        start = time.perf_counter()
+        for i in range(self.args.tasks):
+            if interval:
+                # 按绝对时间排期，避免 sleep 误差累积
+                delay = start + i * interval - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            if self.args.credits:
+                # 只在有额度时派发，额度用完就等 worker 的 credit_update
+                while not self.credits:
+                    self.credit_changed.clear()
+                    await self.credit_changed.wait()
+                self.credits -= 1
+            task_id = f"bench-{i}"
+            self.sent_at[task_id] = time.time()
+            await ws.send(json.dumps({"task": {"type": TASK_TYPE, "taskId": task_id}, "proxy": None}))
+            self.max_in_flight = max(self.max_in_flight, self.in_flight())
+
+    async def handler(self, ws):
+        reader = asyncio.create_task(self._reader(ws))
+        writer = asyncio.create_task(self._writer(ws))
+        try:
+            await asyncio.wait_for(self.done.wait(), timeout=self.args.timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            writer.cancel()
+            reader.cancel()
+            await asyncio.gather(reader, writer, return_exceptions=True)
+            await ws.close()
+
+
+def write_child_config(path: str, workdir: str, concurrency: int, credits: bool):
+    with open(os.path.join(ROOT, "config", "config.yaml"), "r") as f:
+        config = yaml.safe_load(f) or {}
+    config["concurrency"] = concurrency
+    config["camoufox"] = dict(config.get("camoufox") or {}, solver_type=[TASK_TYPE])
+    # 只测调度链路：关闭浏览器相关功能和所有不在测量范围内的后台功能
+    for section in ("adaptive_concurrency", "browser_pool", "resource_cache", "proxy_health", "launch_profile",
+                    "classification_cache", "token_pool"):
+        config[section] = {"enabled": False}
+    config["startup"] = dict(config.get("startup") or {}, warmup=False)
+    config["supervisor"] = dict(config.get("supervisor") or {}, workers=1)
+    config["watchdog"] = dict(config.get("watchdog") or {}, kill_orphans=False, gc_rss_mb=None,
+                              fd_leak_threshold=None)
+    config["metrics"] = dict(config.get("metrics") or {}, port=None)
+    # 子进程以仓库根目录为工作目录，结果日志必须写到临时目录，不能混进真实 worker 的待补发结果
+    config["journal"] = dict(config.get("journal") or {}, path=os.path.join(workdir, "journal", "results.jsonl"))
+    config["flow_control"] = dict(config.get("flow_control") or {}, mode="credits" if credits else "push")
+    with open(path, "w") as f:
+        yaml.safe_dump(config, f, allow_unicode=True)
+
+
+async def sample_rss(proc: psutil.Process, dispatcher: Dispatcher, samples: list):
+    while True:
+        try:
+            samples.append((proc.memory_info().rss, dispatcher.in_flight()))
+        except psutil.Error:
+            return
+        await asyncio.sleep(0.05)
+
+
+async def run_point(args, concurrency: int) -> dict:
+    dispatcher = Dispatcher(args)
+    async with websockets.serve(dispatcher.handler, "127.0.0.1", 0) as server:
+        port = server.sockets[0].getsockname()[1]
+        workdir = tempfile.mkdtemp(prefix="dispatch_bench_")
+        config_path = os.path.join(workdir, "config.yaml")
+        write_child_config(config_path, workdir, concurrency, args.credits)
+        env = dict(os.environ, CONFIG_PATH=config_path, LOG_DIR=workdir, LOG_LEVEL=args.log_level,
+                   PYTHONPATH=ROOT)
+        child_args = [sys.executable, os.path.abspath(__file__), "--child", "--port", str(port)] + [
+            f"--{name.replace('_', '-')}={getattr(args, name)}"
+            for name in ("latency", "jitter", "cpu_ms", "failure_rate")
+        ]
+        proc = await asyncio.create_subprocess_exec(
+            *child_args, cwd=ROOT, env=env, stdout=subprocess.PIPE
+        )
+        rss_samples = []
+        sampler = asyncio.create_task(sample_rss(psutil.Process(proc.pid), dispatcher, rss_samples))
+        await asyncio.wait_for(dispatcher.registered.wait(), timeout=60)
+        baseline_rss = rss_samples[-1][0] if rss_samples else 0
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(dispatcher.done.wait(), timeout=args.timeout)
+        except asyncio.TimeoutError:
+            pass
+        duration = time.perf_counter() - started
+        sampler.cancel()
+        stdout, _ = await proc.communicate()
+
+    child = {}
+    for line in stdout.decode().splitlines()[::-1]:
+        try:
+            child = json.loads(line)
+            break
+        except ValueError:
+            continue
+
+    completed = len(dispatcher.end_to_end)
+    per_task_mem = [
+        (rss - baseline_rss) / in_flight for rss, in_flight in rss_samples if in_flight and rss > baseline_rss
+    ]
+    return {
+        "concurrency": concurrency,
+        "sent": args.tasks,
+        "completed": completed,
+        "failures": dispatcher.failures,
+        "rejected": dispatcher.rejected,
+        "duration_seconds": round(duration, 3),
+        "throughput_per_second": round(completed / duration, 2) if duration else None,
+        "queue_wait_seconds": summarize(dispatcher.queue_wait),
+        "end_to_end_seconds": summarize(dispatcher.end_to_end),
+        "event_loop_lag_seconds": child.get("loop_lag"),
+        "max_in_flight": dispatcher.max_in_flight,
+        "result_frames": dispatcher.frames,
+        "peak_rss_mb": round(max((r for r, _ in rss_samples), default=0) / (1024 ** 2), 2),
+        "memory_per_in_flight_kb": round(statistics.fmean(per_task_mem) / 1024, 2) if per_task_mem else None,
+    }
+
+
+async def bench_main(args):
+    points = []
+    for concurrency in [int(c) for c in args.concurrency.split(",")]:
+        point = await run_point(args, concurrency)
+        print(f"concurrency={concurrency} throughput={point['throughput_per_second']}/s "
+              f"e2e_p99={point['end_to_end_seconds']['p99']}s", file=sys.stderr)
+        points.append(point)
+
+    report = {
+        "benchmark": "dispatch",
+        "timestamp": time.time(),
+        "profile": {
+            "rate": args.rate,
+            "tasks": args.tasks,
+            "latency": args.latency,
+            "jitter": args.jitter,
+            "cpu_ms": args.cpu_ms,
+            "failure_rate": args.failure_rate,
+            "codec": args.codec,
+            "batch": args.batch,
+            "credits": args.credits,
+        },
+        "results": points,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    print(output)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="ws_client 调度链路离线压测")
+    parser.add_argument("--concurrency", default="1,4,16", help="逗号分隔的并发配置")
+    parser.add_argument("--rate", type=float, default=200, help="每秒推送任务数，0 表示不限速")
+    parser.add_argument("--tasks", type=int, default=2000, help="每个并发配置推送的任务数")
+    parser.add_argument("--latency", type=float, default=0.05, help="合成处理器的平均耗时(秒)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="耗时标准差(秒)")
+    parser.add_argument("--cpu-ms", type=float, default=0.0, help="每个任务在事件循环上占用的 CPU 时间(毫秒)")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="合成失败比例")
+    parser.add_argument("--codec", default="json", choices=["json", "msgpack"], help="register_ack 中协商的编码")
+    parser.add_argument("--batch", action="store_true", help="register_ack 中开启结果合并")
+    parser.add_argument("--credits", action="store_true", help="worker 使用 credits 流控，模拟服务端按额度派发")
+    parser.add_argument("--timeout", type=float, default=300, help="单个并发配置的最长运行时间(秒)")
+    parser.add_argument("--log-level", default="WARNING", help="worker 子进程日志级别")
+    parser.add_argument("--output", help="结果 JSON 输出路径")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    cli_args = parse_args()
+    if cli_args.child:
+        sys.path.insert(0, ROOT)
+        asyncio.run(child_main(cli_args))
+    else:
+        asyncio.run(bench_main(cli_args))
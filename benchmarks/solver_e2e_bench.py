@@ -0,0 +1,362 @@
+"""
+打码处理器端到端压测：真实浏览器 + 本地验证码组件替身
+
+通过 resource_cache.stub_routes 拦截 Turnstile 的 api.js，替身组件在点击后延迟 --widget-delay 毫秒给出 token，不访问外网。
+只覆盖 Turnstile：hCaptcha 的挑战流程依赖 hcaptcha_challenger 内部的页面结构，本地替身无法保证与之一致，不在压测范围内。
+按 JSONL 任务流（每行一个任务，可带 "at" 到达时间）或合成的泊松到达回放任务，每个策略组合在独立子进程中运行，
+输出 solves/min、延迟分位数、浏览器启动耗时、峰值 RSS 及单个并发求解的内存占用。
+
+用法:
+    python benchmarks/solver_e2e_bench.py --tasks benchmarks/e2e_tasks.jsonl --speed 2 --concurrency 4 \\
+        --pool on,off --click-interval 1,3 --widget-delay 800 --output e2e_output.json
+    python benchmarks/solver_e2e_bench.py --synthetic 40 --rate 1
+    python benchmarks/solver_e2e_bench.py --tasks benchmarks/e2e_tasks.jsonl --check
+
+需要已安装的 Camoufox 浏览器（python -m camoufox fetch）和 browserforge 数据文件。
+--check 只生成任务流、替身文件和各策略点的配置并打印出来，不启动浏览器，可在没有浏览器的环境中检查参数。
+仓库中没有提交实测结果：加入本脚本时的环境无法下载浏览器，只跑过 --check。
+提交结果时请连同运行命令、机器配置一起附上 --output 生成的 JSON。
+"""
+import argparse
+import asyncio
+import copy
+import itertools
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+TURNSTILE_TYPE = "AntiTurnstileTaskProxyLess"
+
+TURNSTILE_API_JS = """
+(function () {
+    var DELAY = %(delay)d, NEED_CLICK = %(need_click)s, FAILURE_RATE = %(failure_rate)f;
+    function render(el, options) {
+        if (!el || el.__stub) return;
+        options = options || {};
+        el.__stub = true;
+        el.style.width = '300px';
+        el.style.height = '65px';
+        el.style.border = '1px solid #ccc';
+        var input = document.createElement('input');
+        input.type = 'hidden';
+        input.name = 'cf-turnstile-response';
+        el.appendChild(input);
+        var started = false;
+        function solve() {
+            if (started) return;
+            started = true;
+            setTimeout(function () {
+                if (Math.random() < FAILURE_RATE) {
+                    if (options['error-callback']) options['error-callback']('stub');
+                    return;
+                }
+                var token = 'stub.' + Date.now() + '.' + Math.random().toString(36).slice(2);
+                input.value = token;
+                var callback = options.callback || window[el.getAttribute('data-callback')];
+                if (callback) callback(token);
+            }, DELAY);
+        }
+        if (NEED_CLICK) el.addEventListener('click', solve); else solve();
+    }
+    function init() { document.querySelectorAll('.cf-turnstile').forEach(render); }
+    window.turnstile = {
+        render: function (el, options) { render(typeof el === 'string' ? document.querySelector(el) : el, options); },
+        reset: function () {}
+    };
+    if (document.readyState === 'loading') document.addEventListener('DOMContentLoaded', init); else init();
+})();
+"""
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, int(round(pct / 100 * (len(values) - 1)))))
+    return round(values[index], 3)
+
+
+def summarize(values) -> dict:
+    return {
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": round(max(values), 3) if values else None,
+        "mean": round(statistics.fmean(values), 3) if values else None,
+    }
+
+
+# ---------- 组件替身 ----------
+
+def write_stubs(stub_dir: str, args) -> list:
+    """生成替身文件，返回 resource_cache.stub_routes 配置"""
+    files = {
+        "turnstile_api.js": TURNSTILE_API_JS % {
+            "delay": args.widget_delay, "need_click": "true" if args.require_click else "false",
+            "failure_rate": args.widget_failure_rate,
+        },
+    }
+    for name, body in files.items():
+        with open(os.path.join(stub_dir, name), "w") as f:
+            f.write(body)
+
+    def route(pattern, name, content_type):
+        return {"pattern": pattern, "file": os.path.join(stub_dir, name), "content_type": content_type}
+
+    return [
+        route("https://challenges.cloudflare.com/turnstile/v0/api.js*", "turnstile_api.js", "application/javascript"),
+        # 其余 Cloudflare 请求一律不出网
+        {"pattern": "https://challenges.cloudflare.com/*", "status": 404, "body": ""},
+    ]
+
+
+# ---------- 任务流 ----------
+
+def load_tasks(args) -> list:
+    """返回 [(到达时间, task)]；JSONL 中未给出 at 的任务按 --rate 泊松到达补齐"""
+    rng = random.Random(args.seed)
+    if args.tasks:
+        with open(args.tasks) as f:
+            tasks = [json.loads(line) for line in f if line.strip()]
+    else:
+        tasks = [{"type": TURNSTILE_TYPE} for _ in range(args.synthetic)]
+
+    arrivals = []
+    clock = 0.0
+    for i, task in enumerate(tasks):
+        task = dict(task)
+        task.setdefault("type", TURNSTILE_TYPE)
+        if task["type"] != TURNSTILE_TYPE:
+            raise SystemExit(f"第 {i + 1} 个任务类型不受支持: {task['type']}（只有 {TURNSTILE_TYPE} 有本地替身）")
+        task.setdefault("taskId", f"bench-{i}")
+        task.setdefault("websiteURL", f"https://bench-{i % 10}.example")
+        task.setdefault("websiteKey", "0x4AAAAAAAbench")
+        if "at" in task:
+            clock = float(task.pop("at"))
+        else:
+            clock += rng.expovariate(args.rate)
+        arrivals.append((clock / args.speed, task))
+    return sorted(arrivals, key=lambda item: item[0])
+
+
+# ---------- 单个策略点（子进程） ----------
+
+def build_config(args, point: dict, stub_routes: list, cache_dir: str) -> dict:
+    from common.config import load_config
+
+    config = copy.deepcopy(load_config(os.path.join(ROOT, "config", "config.yaml")))
+    config.setdefault("camoufox", {}).update(headless="true" if args.headless else "false", geoip=False)
+    config.setdefault("browser_pool", {})["enabled"] = point["pool"]
+    config.setdefault("browser_pool", {})["max_browsers"] = args.concurrency
+    config.setdefault("launch_profile", {})["enabled"] = False
+    config.setdefault("turnstile", {})["click_interval"] = point["click_interval"]
+    config["turnstile"]["batch"] = {"enabled": point.get("batch", 0) > 1, "window_ms": args.batch_window,
+                                    "max_size": point.get("batch", 1)}
+    config["resource_cache"] = dict(config.get("resource_cache") or {}, enabled=True, dir=cache_dir,
+                                    stub_routes=stub_routes)
+    return config
+
+
+async def run_point(args, point: dict) -> dict:
+    import psutil
+
+    from common.metrics import metrics, start_trace, finish_trace
+    from core.handler_registry import HandlerRegistry
+    from framework.batch_solver import batch_stats
+    from framework.browser_pool import get_browser_pool, pool_stats
+
+    with tempfile.TemporaryDirectory() as workdir:
+        config = build_config(args, point, write_stubs(workdir, args), os.path.join(workdir, "cache"))
+        arrivals = load_tasks(args)
+        registry = HandlerRegistry(os.path.join(ROOT, "task_handlers"))
+        for task_type in {task["type"] for _, task in arrivals}:
+            registry.register(task_type)
+
+        process = psutil.Process()
+        semaphore = asyncio.Semaphore(args.concurrency)
+        active = 0
+        peak = {"rss_mb": 0.0, "rss_per_solve_mb": 0.0, "active": 0}
+        latencies, solve_times, statuses = [], [], {}
+
+        def sample():
+            rss = process.memory_info().rss
+            for child in process.children(recursive=True):
+                try:
+                    rss += child.memory_info().rss
+                except psutil.Error:
+                    pass
+            return rss / (1024 ** 2)
+
+        async def monitor():
+            while True:
+                rss_mb = await asyncio.to_thread(sample)
+                peak["rss_mb"] = max(peak["rss_mb"], rss_mb)
+                peak["active"] = max(peak["active"], active)
+                if active:
+                    peak["rss_per_solve_mb"] = max(peak["rss_per_solve_mb"], rss_mb / active)
+                await asyncio.sleep(args.sample_interval)
+
+        async def handle(task: dict, arrived: float):
+            nonlocal active
+            entry = registry.get(task["type"])
+            async with semaphore:
+                active += 1
+                started = time.monotonic()
+                start_trace(task["type"], None)
+                status = "error"
+                try:
+                    result = await entry.run(task, None, config)
+                    status = "success" if isinstance(result, dict) and result.get("status") == "success" else "failure"
+                except Exception as e:
+                    print(f"任务异常: {e}", file=sys.stderr)
+                finally:
+                    finish_trace(status)
+                    active -= 1
+            now = time.monotonic()
+            statuses[status] = statuses.get(status, 0) + 1
+            if status == "success":
+                latencies.append(now - arrived)
+                solve_times.append(now - started)
+
+        baseline_mb = sample()
+        sampler = asyncio.create_task(monitor())
+        began = time.monotonic()
+        handlers = []
+        for at, task in arrivals:
+            delay = began + at - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            handlers.append(asyncio.create_task(handle(task, time.monotonic())))
+        await asyncio.gather(*handlers)
+        wall = time.monotonic() - began
+        sampler.cancel()
+
+        pool = get_browser_pool(config)
+        browser_pool = pool_stats()
+        if pool is not None:
+            await pool.close()
+
+    launches = [h for (phase, _, _), h in metrics.histograms.items() if phase == "browser_launch"]
+    launch_count = sum(h.count for h in launches)
+    return dict(
+        point,
+        tasks=len(arrivals),
+        statuses=statuses,
+        wall_seconds=round(wall, 2),
+        solves_per_minute=round(statuses.get("success", 0) / wall * 60, 2) if wall else None,
+        latency_seconds=summarize(latencies),
+        solve_seconds=summarize(solve_times),
+        browser_launches=launch_count,
+        avg_browser_launch_seconds=round(sum(h.sum for h in launches) / launch_count, 3) if launch_count else None,
+        browser_pool=browser_pool,
+        batch=batch_stats(),
+        memory={
+            "baseline_mb": round(baseline_mb, 1),
+            "peak_mb": round(peak["rss_mb"], 1),
+            "peak_active": peak["active"],
+            "peak_per_solve_mb": round(peak["rss_per_solve_mb"], 1),
+        },
+        phases=metrics.summary(),
+    )
+
+
+# ---------- 主进程 ----------
+
+def check_main(args, points: list):
+    """不启动浏览器，只检查任务流、替身路由和各策略点的配置"""
+    arrivals = load_tasks(args)
+    with tempfile.TemporaryDirectory() as workdir:
+        stub_routes = write_stubs(workdir, args)
+        configs = [build_config(args, point, stub_routes, os.path.join(workdir, "cache")) for point in points]
+    print(json.dumps({
+        "tasks": len(arrivals),
+        "duration_seconds": round(arrivals[-1][0], 2) if arrivals else 0,
+        "stub_routes": [route["pattern"] for route in stub_routes],
+        "points": [
+            dict(point, browser_pool=config["browser_pool"], turnstile=config["turnstile"])
+            for point, config in zip(points, configs)
+        ],
+    }, indent=2, ensure_ascii=False))
+
+
+def bench_main(args):
+    points = [
+        {"pool": pool == "on", "click_interval": float(interval), "batch": int(batch)}
+        for pool, interval, batch in itertools.product(args.pool.split(","), args.click_interval.split(","),
+                                                       args.batch.split(","))
+    ]
+    if args.tasks:
+        # 子进程在仓库根目录运行
+        args.tasks = os.path.abspath(args.tasks)
+    if args.check:
+        check_main(args, points)
+        return
+
+    results = []
+    for point in points:
+        # 浏览器池 / 缓存都是进程级单例，每个策略点使用独立子进程；参数整体以 JSON 传入，不重复拼接命令行
+        child = {"point": point, "args": {k: v for k, v in vars(args).items() if k not in ("output", "point")}}
+        cmd = [sys.executable, os.path.abspath(__file__), "--point", json.dumps(child)]
+        proc = subprocess.run(cmd, cwd=ROOT, capture_output=True, text=True)
+        if proc.returncode != 0:
+            print(proc.stderr[-2000:], file=sys.stderr)
+            results.append(dict(point, error=f"exit {proc.returncode}"))
+            continue
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        print(f"pool={point['pool']} click_interval={point['click_interval']} batch={point['batch']} "
+              f"solves/min={result['solves_per_minute']} p50={result['latency_seconds']['p50']}s "
+              f"peak/solve={result['memory']['peak_per_solve_mb']}MB", file=sys.stderr)
+        results.append(result)
+
+    report = {
+        "benchmark": "solver_e2e",
+        "timestamp": time.time(),
+        "profile": {k: v for k, v in vars(args).items() if k not in ("output", "point")},
+        "results": results,
+    }
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    print(output)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="打码处理器端到端压测（本地组件替身）")
+    parser.add_argument("--tasks", help="JSONL 任务流，每行一个任务（type/websiteURL/websiteKey，可选 at 秒）")
+    parser.add_argument("--synthetic", type=int, default=20, help="未指定 --tasks 时合成的任务数")
+    parser.add_argument("--rate", type=float, default=1.0, help="未给出 at 的任务的平均到达率(任务/秒)")
+    parser.add_argument("--speed", type=float, default=1.0, help="回放倍速，>1 时到达更密集")
+    parser.add_argument("--concurrency", type=int, default=4, help="同时求解的任务数")
+    parser.add_argument("--pool", default="on,off", help="浏览器池策略: on / off，逗号分隔对比")
+    parser.add_argument("--click-interval", default="3", help="Turnstile 轮询/点击间隔(秒)，逗号分隔对比")
+    parser.add_argument("--batch", default="1", help="Turnstile 批量求解的最大组件数，1 为不合并，逗号分隔对比")
+    parser.add_argument("--batch-window", type=int, default=500, help="批量求解的收集窗口(毫秒)")
+    parser.add_argument("--widget-delay", type=int, default=800, help="替身组件给出 token 的延迟(毫秒)")
+    parser.add_argument("--widget-failure-rate", type=float, default=0.0, help="替身组件不给 token 的比例")
+    parser.add_argument("--require-click", action=argparse.BooleanOptionalAction, default=True,
+                        help="替身组件是否需要点击才开始求解")
+    parser.add_argument("--headless", action=argparse.BooleanOptionalAction, default=True, help="无头模式")
+    parser.add_argument("--sample-interval", type=float, default=0.25, help="内存采样间隔(秒)")
+    parser.add_argument("--seed", type=int, default=1, help="随机种子")
+    parser.add_argument("--output", help="结果 JSON 输出路径")
+    parser.add_argument("--check", action="store_true", help="只检查任务流和配置，不启动浏览器")
+    parser.add_argument("--point", help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.point:
+        os.chdir(ROOT)
+        child = json.loads(args.point)
+        print(json.dumps(asyncio.run(run_point(argparse.Namespace(**child["args"]), child["point"]))))
+    else:
+        bench_main(args)
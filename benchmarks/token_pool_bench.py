@@ -0,0 +1,164 @@
+"""
+token 预求解池离线模拟：假求解器 + 泊松到达 + Zipf 分布的 sitekey
+
+同一到达序列分别在关闭/开启预求解池的情况下运行，对比任务延迟、命中率和过期浪费。
+
+用法:
+    python benchmarks/token_pool_bench.py --keys 20 --rate 5 --duration 60 --solve-time 3 \\
+        --concurrency 8 --max-age 30 --output token_pool_output.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from core.concurrency import ConcurrencyLimiter  # noqa: E402
+from core.token_pool import TokenPool  # noqa: E402
+
+TASK_TYPE = "AntiTurnstileTaskProxyLess"
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, int(round(pct / 100 * (len(values) - 1)))))
+    return round(values[index], 4)
+
+
+def make_arrivals(args) -> list:
+    """预先生成 (到达时间, key 序号)，两轮模拟使用同一序列"""
+    rng = random.Random(args.seed)
+    weights = [1 / (i + 1) ** args.zipf for i in range(args.keys)]
+    arrivals = []
+    t = 0.0
+    while True:
+        t += rng.expovariate(args.rate)
+        if t >= args.duration:
+            return arrivals
+        arrivals.append((t, rng.choices(range(args.keys), weights)[0]))
+
+
+async def run_point(args, arrivals: list, use_pool: bool) -> dict:
+    rng = random.Random(args.seed + 1)
+    limiter = ConcurrencyLimiter(args.concurrency)
+    waiting = 0
+    latencies = []
+    solves = 0
+
+    async def fake_solve(task: dict) -> dict:
+        nonlocal solves
+        solves += 1
+        await asyncio.sleep(max(0.0, rng.gauss(args.solve_time, args.solve_jitter)))
+        if rng.random() < args.failure_rate:
+            return {"token": None, "status": "failure", "type": "turnstile"}
+        return {"token": f"fake-{task['websiteKey']}-{solves}", "status": "success", "type": "turnstile"}
+
+    async def presolve(task: dict):
+        if not limiter.try_acquire():
+            return None
+        try:
+            return await fake_solve(task)
+        finally:
+            await limiter.release()
+
+    def has_capacity() -> bool:
+        return waiting == 0 and limiter.in_use + args.reserve < limiter.limit
+
+    pool = TokenPool(
+        presolve, has_capacity, task_types=[TASK_TYPE], max_age=args.max_age, window=args.window,
+        hot_threshold=args.hot_threshold, refill_horizon=args.refill_horizon, max_per_key=args.max_per_key,
+        max_inflight=args.max_inflight, interval=0.2,
+    )
+    refill = asyncio.create_task(pool.run()) if use_pool else None
+
+    async def handle(task: dict, arrived: float):
+        nonlocal waiting
+        if use_pool and pool.take(task) is not None:
+            latencies.append(time.monotonic() - arrived)
+            return
+        waiting += 1
+        async with limiter:
+            waiting -= 1
+            await fake_solve(task)
+        latencies.append(time.monotonic() - arrived)
+
+    start = time.monotonic()
+    handlers = []
+    for at, key in arrivals:
+        delay = start + at - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        task = {"type": TASK_TYPE, "websiteURL": f"https://site-{key}.example", "websiteKey": f"0x4AAA{key:04d}"}
+        handlers.append(asyncio.create_task(handle(task, time.monotonic())))
+    await asyncio.gather(*handlers)
+    if refill is not None:
+        refill.cancel()
+
+    point = {
+        "pool": use_pool,
+        "tasks": len(arrivals),
+        "solves": solves,
+        "latency_seconds": {
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "mean": round(sum(latencies) / len(latencies), 4) if latencies else None,
+        },
+    }
+    if use_pool:
+        point["token_pool"] = pool.stats()
+    return point
+
+
+async def bench_main(args):
+    arrivals = make_arrivals(args)
+    points = []
+    for use_pool in (False, True):
+        point = await run_point(args, arrivals, use_pool)
+        print(f"pool={use_pool} p50={point['latency_seconds']['p50']}s solves={point['solves']}", file=sys.stderr)
+        points.append(point)
+
+    report = {
+        "benchmark": "token_pool",
+        "timestamp": time.time(),
+        "profile": {k: v for k, v in vars(args).items() if k != "output"},
+        "results": points,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    print(output)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="token 预求解池离线模拟")
+    parser.add_argument("--keys", type=int, default=20, help="不同 sitekey 的数量")
+    parser.add_argument("--zipf", type=float, default=1.2, help="key 热度的 Zipf 指数，越大越集中")
+    parser.add_argument("--rate", type=float, default=5, help="平均到达率(任务/秒)")
+    parser.add_argument("--duration", type=float, default=60, help="模拟时长(秒)")
+    parser.add_argument("--solve-time", type=float, default=3, help="假求解器平均耗时(秒)")
+    parser.add_argument("--solve-jitter", type=float, default=0.5, help="求解耗时标准差(秒)")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="求解失败比例")
+    parser.add_argument("--concurrency", type=int, default=8, help="执行位数量")
+    parser.add_argument("--reserve", type=int, default=1, help="预求解至少留出的空闲执行位")
+    parser.add_argument("--max-age", type=float, default=30, help="token 可用时长(秒)")
+    parser.add_argument("--window", type=float, default=30, help="到达率统计窗口(秒)")
+    parser.add_argument("--hot-threshold", type=int, default=3, help="窗口内到达次数达到该值视为热点")
+    parser.add_argument("--refill-horizon", type=float, default=10, help="目标库存 = 到达率 * 该值")
+    parser.add_argument("--max-per-key", type=int, default=5, help="单个 key 最多库存")
+    parser.add_argument("--max-inflight", type=int, default=2, help="同时进行的预求解数量")
+    parser.add_argument("--seed", type=int, default=1, help="随机种子")
+    parser.add_argument("--output", help="结果 JSON 输出路径")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(bench_main(parse_args()))
@@ -0,0 +1,20 @@
+import os
+from typing import Optional
+
+import yaml
+
+_configs: dict = {}
+
+
+def config_path() -> str:
+    return os.getenv("CONFIG_PATH", "config/config.yaml")
+
+
+def load_config(path: Optional[str] = None) -> dict:
+    """读取 config.yaml，同一进程内只解析一次"""
+    path = path or config_path()
+    config = _configs.get(path)
+    if config is None:
+        with open(path, "r") as f:
+            config = _configs[path] = yaml.safe_load(f) or {}
+    return config
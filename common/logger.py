@@ -1,46 +1,319 @@
+import atexit
+import copy
+import json
 import logging
 import os
-from logging.handlers import RotatingFileHandler
+import queue
+import threading
+import time
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Optional
 
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
 LOG_DIR = os.getenv("LOG_DIR", "./logs")
 os.makedirs(LOG_DIR, exist_ok=True)
 
+TEXT_FORMAT = "[%(asctime)s] [%(levelname)s] [%(name)s] %(message)s"
+CONTEXT_FIELDS = ("taskId", "type", "proxy")
+
+EMOJI_TAGS = {
+    "DEBUG": "🐞",
+    "INFO": "ℹ️",
+    "SUCCESS": "✅",
+    "WARNING": "⚠️",
+    "ERROR": "❌",
+    "CRITICAL": "🔥",
+    "TASK": "📌",
+    "GETTASK": "📥",
+    "STARTUP": "🚀",
+    "SHUTDOWN": "🛑",
+    "NETWORK": "🌐",
+    "DB": "🗃️",
+    "WAIT": "⏳",
+}
+_TAG_BY_EMOJI = {icon: tag for tag, icon in EMOJI_TAGS.items()}
+
+# 当前任务的关联字段（taskId / type / proxy），每个 asyncio 任务独立
+_log_context: ContextVar[dict] = ContextVar("log_context", default={})
+
+
+def _proxy_label(proxy) -> Optional[str]:
+    """只保留代理地址，去掉用户名密码"""
+    if not proxy:
+        return None
+    server = proxy.get("server") if isinstance(proxy, dict) else str(proxy)
+    return (server or "").rsplit("@", 1)[-1] or None
+
+
+def set_log_context(task_id=None, task_type=None, proxy=None):
+    """设置当前任务的日志关联字段，返回用于 reset_log_context 的 token"""
+    return _log_context.set({"taskId": task_id, "type": task_type, "proxy": _proxy_label(proxy)})
+
+
+def reset_log_context(token):
+    _log_context.reset(token)
+
+
+def split_emoji(message: str) -> tuple:
+    """把 emoji() 生成的消息拆成 (标签, 正文)"""
+    icon, sep, text = message.partition(" ")
+    tag = _TAG_BY_EMOJI.get(icon)
+    return (tag, text) if sep and tag else (None, message)
+
+
+# ---------- 过滤器（在调用方线程执行，必须足够轻） ----------
+
+class ContextFilter(logging.Filter):
+    def filter(self, record):
+        context = _log_context.get()
+        for field in CONTEXT_FIELDS:
+            if not hasattr(record, field):
+                setattr(record, field, context.get(field))
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    按调用位置（文件 + 行号）的令牌桶限流，规则按级别配置：{级别: (每秒条数, 突发条数)}
+    被丢弃的条数在该位置下一次放行时附在日志上
+    """
+
+    def __init__(self, rules: Optional[dict] = None):
+        super().__init__()
+        self.rules = rules or {}
+        self._buckets: dict = {}
+        self._lock = threading.Lock()
+        self.suppressed_total = 0
+
+    def filter(self, record):
+        rule = self.rules.get(record.levelno)
+        if rule is None:
+            return True
+        rate, burst = rule
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated, suppressed = self._buckets.get(key, (burst, now, 0))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            if tokens < 1:
+                self._buckets[key] = (tokens, now, suppressed + 1)
+                self.suppressed_total += 1
+                return False
+            self._buckets[key] = (tokens - 1, now, 0)
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+# ---------- 格式 ----------
+
+class TextFormatter(logging.Formatter):
+    """原有的文本格式；use_emoji=False 时去掉消息前的 emoji"""
+
+    def __init__(self, use_emoji: bool = True):
+        super().__init__(TEXT_FORMAT)
+        self.use_emoji = use_emoji
+
+    def formatMessage(self, record):
+        message = record.message
+        if not self.use_emoji:
+            message = split_emoji(message)[1]
+        if getattr(record, "taskId", None):
+            message = f"[{record.taskId}] {message}"
+        if getattr(record, "suppressed", None):
+            message = f"{message} (此处已抑制 {record.suppressed} 条)"
+        return f"[{record.asctime}] [{record.levelname}] [{record.name}] {message}"
+
+
+class JsonFormatter(logging.Formatter):
+    """JSON lines：每条日志一行，带任务关联字段"""
+
+    def format(self, record):
+        tag, text = split_emoji(record.getMessage())
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": text,
+        }
+        if tag:
+            entry["tag"] = tag
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value:
+                entry[field] = value
+        if getattr(record, "suppressed", None):
+            entry["suppressed"] = record.suppressed
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def _formatter(name: str) -> logging.Formatter:
+    if name == "json":
+        return JsonFormatter()
+    return TextFormatter(use_emoji=name != "plain")
+
+
+# ---------- 输出端 ----------
+
+class ModuleFileHandler(logging.Handler):
+    """按 logger 名称写入 LOG_DIR/<name>.log，文件按需打开"""
+
+    def __init__(self, max_bytes: int = 10 * 1024 * 1024, backup_count: int = 3):
+        super().__init__()
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self._files: dict = {}
+
+    def _file(self, name: str) -> RotatingFileHandler:
+        handler = self._files.get(name)
+        if handler is None:
+            handler = RotatingFileHandler(f"{LOG_DIR}/{name}.log", maxBytes=self.max_bytes,
+                                          backupCount=self.backup_count, encoding="utf-8")
+            handler.setFormatter(self.formatter)
+            self._files[name] = handler
+        return handler
+
+    def setFormatter(self, fmt):
+        super().setFormatter(fmt)
+        for handler in self._files.values():
+            handler.setFormatter(fmt)
+
+    def emit(self, record):
+        self._file(record.name).emit(record)
+
+    def close(self):
+        for handler in self._files.values():
+            handler.close()
+        super().close()
+
+
+class _DispatchHandler(logging.Handler):
+    """同步模式：在调用方线程直接写入各输出端"""
+
+    def __init__(self, sinks: list):
+        super().__init__()
+        self.sinks = sinks
+
+    def emit(self, record):
+        for sink in self.sinks:
+            sink.handle(record)
+
+
+class _DeferredQueueHandler(QueueHandler):
+    """只合并消息参数，格式化（时间、异常堆栈、JSON）留给后台线程"""
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        return record
+
+
+class LogPipeline:
+    """
+    所有模块 logger 共用的日志管线：
+    - queue：调用方只把记录放进队列，控制台/文件写入和日志轮转在后台线程完成
+    - sync：调用方线程直接写入（原有行为）
+    """
+
+    def __init__(self):
+        self.console = logging.StreamHandler()
+        self.files = ModuleFileHandler()
+        self.sampling = SamplingFilter()
+        self.context = ContextFilter()
+        self.backend = None
+        self.front: Optional[logging.Handler] = None
+        self.listener: Optional[QueueListener] = None
+        self._loggers: list = []
+        self.configure()
+
+    def configure(self, backend: str = "sync", console_format: str = "emoji", file_format: str = "emoji",
+                  sampling: Optional[dict] = None):
+        self.sampling.rules = {
+            logging.getLevelName(level.upper()): (float(rule.get("rate", 10)), float(rule.get("burst", 20)))
+            for level, rule in (sampling or {}).items()
+        }
+        if backend != self.backend:
+            # 先排空旧队列，已入队的记录仍按旧格式输出
+            self._switch(backend)
+        self.console.setFormatter(_formatter(console_format))
+        self.files.setFormatter(_formatter(file_format))
+
+    def _switch(self, backend: str):
+        old_front, old_listener = self.front, self.listener
+        if backend == "sync":
+            front = _DispatchHandler([self.console, self.files])
+            self.listener = None
+        else:
+            log_queue = queue.SimpleQueue()
+            front = _DeferredQueueHandler(log_queue)
+            self.listener = QueueListener(log_queue, self.console, self.files, respect_handler_level=True)
+            self.listener.start()
+        # 先限流再补关联字段，被丢弃的记录不做多余的工作
+        front.addFilter(self.sampling)
+        front.addFilter(self.context)
+        self.front = front
+        self.backend = backend
+        for logger in self._loggers:
+            if old_front is not None:
+                logger.removeHandler(old_front)
+            logger.addHandler(front)
+        # 所有 logger 都切换后再停掉旧线程，确保已入队的记录都被写出
+        if old_listener is not None:
+            old_listener.stop()
+
+    def attach(self, logger: logging.Logger):
+        logger.addHandler(self.front)
+        self._loggers.append(logger)
+
+    def _stop_listener(self):
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+
+    def close(self):
+        self._stop_listener()
+        try:
+            self.console.flush()
+        except ValueError:
+            # 退出时 stdout/stderr 可能已被宿主（例如 pytest 的输出捕获）关闭
+            pass
+        self.files.close()
+
+
+_pipeline = LogPipeline()
+atexit.register(_pipeline.close)
+
+
+def configure_logging(config: dict):
+    """按 config 中的 logging 配置切换后端、格式和限流规则，已创建的 logger 同步生效"""
+    log_cfg = (config or {}).get("logging") or {}
+    _pipeline.configure(
+        backend=log_cfg.get("backend", "sync"),
+        console_format=log_cfg.get("console_format", "emoji"),
+        file_format=log_cfg.get("file_format", "emoji"),
+        sampling=log_cfg.get("sampling"),
+    )
+
+
+def logging_stats() -> dict:
+    return {"backend": _pipeline.backend, "suppressed": _pipeline.sampling.suppressed_total}
+
+
 def get_logger(name: str) -> logging.Logger:
     logger = logging.getLogger(name)
     if logger.hasHandlers():
         return logger
 
     logger.setLevel(LOG_LEVEL)
+    _pipeline.attach(logger)
+    return logger
 
-    formatter = logging.Formatter("[%(asctime)s] [%(levelname)s] [%(name)s] %(message)s")
-
-    # 控制台输出
-    ch = logging.StreamHandler()
-    ch.setFormatter(formatter)
-    logger.addHandler(ch)
-
-    # 文件输出（按模块名称区分）
-    fh = RotatingFileHandler(f"{LOG_DIR}/{name}.log", maxBytes=10 * 1024 * 1024, backupCount=3)
-    fh.setFormatter(formatter)
-    logger.addHandler(fh)
 
-    return logger
 # common/emoji_log.py
 def emoji(level: str, message: str) -> str:
-    tags = {
-        "DEBUG": "🐞",
-        "INFO": "ℹ️",
-        "SUCCESS": "✅",
-        "WARNING": "⚠️",
-        "ERROR": "❌",
-        "CRITICAL": "🔥",
-        "TASK": "📌",
-        "GETTASK":"📥",
-        "STARTUP": "🚀",
-        "SHUTDOWN": "🛑",
-        "NETWORK": "🌐",
-        "DB": "🗃️",
-        "WAIT":"⏳",
-    }
-    return f"{tags.get(level.upper(), '')} {message}"
\ No newline at end of file
+    return f"{EMOJI_TAGS.get(level.upper(), '')} {message}"
@@ -0,0 +1,255 @@
+import asyncio
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from common.logger import get_logger, emoji
+
+logger = get_logger("metrics")
+
+# 秒级直方图分桶，覆盖从毫秒级调度开销到 5 分钟的 hCaptcha 求解
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                return
+        self.counts[-1] += 1
+
+    def merge(self, counts: list, total: float, count: int):
+        self.counts = [a + b for a, b in zip(self.counts, counts)]
+        self.sum += total
+        self.count += count
+
+    def quantile(self, q: float) -> Optional[float]:
+        """按分桶估算分位数（返回所在桶的上界）"""
+        if not self.count:
+            return None
+        target = q * self.count
+        seen = 0
+        for i, bound in enumerate(self.buckets):
+            seen += self.counts[i]
+            if seen >= target:
+                return bound
+        return float("inf")
+
+
+def proxy_label(proxy) -> str:
+    if not proxy:
+        return "direct"
+    if isinstance(proxy, dict):
+        return str(proxy.get("server") or "direct")
+    return str(proxy)
+
+
+class TaskTrace:
+    def __init__(self, task_type: str, proxy):
+        self.task_type = task_type or "unknown"
+        self.proxy = proxy_label(proxy)
+        self.started = time.monotonic()
+        self.spans: dict = {}
+
+    def record(self, phase: str, seconds: float):
+        self.spans[phase] = self.spans.get(phase, 0.0) + seconds
+
+
+class Metrics:
+    """任务各阶段耗时，按 (阶段, 任务类型, 代理) 分别统计直方图"""
+
+    def __init__(self):
+        self.histograms: dict = {}
+        self.tasks_total: dict = {}
+        # 与任务无关的耗时（例如出站发送），按名称统计
+        self.values: dict = {}
+
+    def observe(self, phase: str, task_type: str, proxy: str, seconds: float):
+        key = (phase, task_type, proxy)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        histogram.observe(seconds)
+
+    def observe_value(self, name: str, seconds: float):
+        histogram = self.values.get(name)
+        if histogram is None:
+            histogram = self.values[name] = Histogram()
+        histogram.observe(seconds)
+
+    def finish(self, trace: TaskTrace, status: str):
+        for phase, seconds in trace.spans.items():
+            self.observe(phase, trace.task_type, trace.proxy, seconds)
+        self.observe("total", trace.task_type, trace.proxy, time.monotonic() - trace.started)
+        self.count_task(trace.task_type, status)
+
+    def count_task(self, task_type: str, status: str):
+        key = (task_type or "unknown", status)
+        self.tasks_total[key] = self.tasks_total.get(key, 0) + 1
+
+    def summary(self) -> dict:
+        """心跳中的精简汇总：按任务类型合并代理，给出总耗时分位数和各阶段平均耗时"""
+        merged: dict = {}
+        for (phase, task_type, _), histogram in self.histograms.items():
+            phases = merged.setdefault(task_type, {})
+            target = phases.get(phase)
+            if target is None:
+                target = phases[phase] = Histogram(histogram.buckets)
+            target.merge(histogram.counts, histogram.sum, histogram.count)
+
+        summary = {}
+        for task_type, phases in merged.items():
+            total = phases.get("total")
+            summary[task_type] = {
+                "count": total.count if total else 0,
+                "p50": total.quantile(0.5) if total else None,
+                "p95": total.quantile(0.95) if total else None,
+                "phases": {
+                    phase: round(h.sum / h.count, 3)
+                    for phase, h in phases.items() if phase != "total" and h.count
+                },
+            }
+        return summary
+
+    def snapshot(self) -> dict:
+        """可序列化的完整状态，供分片子进程上报给主进程"""
+        return {
+            "histograms": {k: (h.counts, h.sum, h.count) for k, h in self.histograms.items()},
+            "values": {k: (h.counts, h.sum, h.count) for k, h in self.values.items()},
+            "tasks_total": dict(self.tasks_total),
+        }
+
+    def merge(self, snapshot: dict):
+        for attr in ("histograms", "values"):
+            target = getattr(self, attr)
+            for key, (counts, total, count) in snapshot.get(attr, {}).items():
+                histogram = target.get(key)
+                if histogram is None:
+                    histogram = target[key] = Histogram()
+                histogram.merge(counts, total, count)
+        for key, count in snapshot.get("tasks_total", {}).items():
+            self.tasks_total[key] = self.tasks_total.get(key, 0) + count
+
+    def reset(self):
+        self.histograms.clear()
+        self.values.clear()
+        self.tasks_total.clear()
+
+    def render(self) -> str:
+        """Prometheus 文本格式"""
+        lines = [
+            "# HELP capsolver_task_phase_seconds Time spent in each task phase.",
+            "# TYPE capsolver_task_phase_seconds histogram",
+        ]
+        for (phase, task_type, proxy), histogram in sorted(self.histograms.items()):
+            labels = f'phase="{_escape(phase)}",task_type="{_escape(task_type)}",proxy="{_escape(proxy)}"'
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                lines.append(f'capsolver_task_phase_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'capsolver_task_phase_seconds_bucket{{{labels},le="+Inf"}} {histogram.count}')
+            lines.append(f"capsolver_task_phase_seconds_sum{{{labels}}} {histogram.sum}")
+            lines.append(f"capsolver_task_phase_seconds_count{{{labels}}} {histogram.count}")
+
+        lines.append("# HELP capsolver_tasks_total Finished tasks by type and status.")
+        lines.append("# TYPE capsolver_tasks_total counter")
+        for (task_type, status), count in sorted(self.tasks_total.items()):
+            lines.append(f'capsolver_tasks_total{{task_type="{_escape(task_type)}",status="{_escape(status)}"}} {count}')
+
+        for name, histogram in sorted(self.values.items()):
+            lines.append(f"# TYPE capsolver_{name} histogram")
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                lines.append(f'capsolver_{name}_bucket{{le="{bound}"}} {cumulative}')
+            lines.append(f'capsolver_{name}_bucket{{le="+Inf"}} {histogram.count}')
+            lines.append(f"capsolver_{name}_sum {histogram.sum}")
+            lines.append(f"capsolver_{name}_count {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+metrics = Metrics()
+_current_trace: ContextVar[Optional[TaskTrace]] = ContextVar("current_trace", default=None)
+
+
+def start_trace(task_type: str, proxy) -> TaskTrace:
+    trace = TaskTrace(task_type, proxy)
+    _current_trace.set(trace)
+    return trace
+
+
+def finish_trace(status: str):
+    trace = _current_trace.get()
+    if trace is not None:
+        metrics.finish(trace, status)
+        _current_trace.set(None)
+
+
+def record_span(phase: str, seconds: float):
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.record(phase, seconds)
+
+
+@contextmanager
+def span(phase: str):
+    """记录当前任务某个阶段的耗时；不在任务上下文中时不做任何事"""
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        record_span(phase, time.monotonic() - started)
+
+
+async def _handle_http(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        request_line = await reader.readline()
+        # 读完请求头
+        while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+            pass
+        parts = request_line.decode(errors="ignore").split()
+        if len(parts) >= 2 and parts[1].split("?")[0] == "/metrics":
+            body = metrics.render().encode()
+            status = "200 OK"
+        else:
+            body = b"not found\n"
+            status = "404 Not Found"
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+    except Exception as e:
+        logger.debug("指标请求处理失败: %s", e)
+    finally:
+        writer.close()
+
+
+async def start_metrics_server(config: dict):
+    """按 config 中的 metrics 配置启动本地 /metrics 端点，未配置端口时不启动"""
+    metrics_cfg = (config or {}).get("metrics") or {}
+    port = metrics_cfg.get("port")
+    if not port:
+        return None
+    host = metrics_cfg.get("host", "127.0.0.1")
+    try:
+        server = await asyncio.start_server(_handle_http, host, port)
+    except OSError as e:
+        logger.warning(emoji("WARNING", f"指标端点启动失败: {e}"))
+        return None
+    logger.info(emoji("NETWORK", f"指标端点: http://{host}:{port}/metrics"))
+    return server
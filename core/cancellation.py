@@ -0,0 +1,182 @@
+import asyncio
+import math
+import time
+from typing import Callable, Optional
+
+from common.logger import get_logger, emoji
+from common.metrics import metrics
+
+logger = get_logger("cancellation")
+
+CANCELLED = "cancelled"
+TIMEOUT = "timeout"
+TIMEOUT_ERROR_CODE = "ERROR_TASK_TIMEOUT"
+
+
+class TaskInterrupted(Exception):
+    """执行中的任务被服务端取消（reason=cancelled）或超过硬超时（reason=timeout）"""
+
+    def __init__(self, reason: str, seconds: float):
+        super().__init__("任务已被取消" if reason == CANCELLED else f"任务执行超时({seconds:.1f}s)")
+        self.reason = reason
+        self.seconds = seconds
+
+
+class RunningTask:
+    __slots__ = ("item", "runner", "started", "limit", "reason", "cancelled")
+
+    def __init__(self, item, runner: asyncio.Task, limit: Optional[float]):
+        self.item = item
+        self.runner = runner
+        self.started = time.monotonic()
+        self.limit = limit
+        self.reason: Optional[str] = None
+        # 服务端取消时置位，execute 据此从等待中醒来，不再等到硬超时
+        self.cancelled = asyncio.Event()
+
+
+class CancellationManager:
+    """
+    服务端取消（task_cancel）与按类型的硬超时：
+    - 排队中的任务直接从调度器移除（on_dequeue 回调释放额度）
+    - 执行中的任务在独立协程中运行，取消/超时时中断该协程，浏览器页面和 cleanup 钩子在各自的 finally 中照常收尾
+    - 中断后最多等待 grace 秒收尾，处理器忽略取消时放弃该协程，执行位照常释放
+    - 硬超时 = min(类型超时, 任务截止时间剩余)，均未设置时不限
+    - 回收时间：被取消的任务在硬超时内本可继续占用的秒数
+    - 执行位释放后通知心跳立即上报状态（credits 模式下 credit_update 已即时发送）
+    """
+
+    def __init__(self, scheduler, hard_timeouts: Optional[dict] = None, default_timeout: Optional[float] = None,
+                 enforce_deadline: bool = True, grace: float = 10,
+                 on_dequeue: Optional[Callable] = None):
+        self.scheduler = scheduler
+        self.hard_timeouts = hard_timeouts or {}
+        self.default_timeout = default_timeout
+        self.enforce_deadline = enforce_deadline
+        self.grace = grace
+        self.on_dequeue = on_dequeue
+        self.running: dict = {}
+        self._freed = asyncio.Event()
+
+        self.cancelled_queued = 0
+        self.cancelled_running = 0
+        self.cancel_misses = 0
+        self.timeouts = 0
+        self.stuck = 0
+        self.reclaimed_seconds = 0.0
+
+    def timeout_for(self, item) -> Optional[float]:
+        limit = self.hard_timeouts.get(item.task_type, self.default_timeout)
+        if self.enforce_deadline and item.deadline != math.inf:
+            remaining = item.deadline - time.monotonic()
+            limit = remaining if limit is None else min(limit, remaining)
+        return max(0.0, limit) if limit is not None else None
+
+    def _reclaim(self, seconds: float):
+        if seconds > 0:
+            self.reclaimed_seconds += seconds
+            metrics.observe_value("cancel_reclaimed_seconds", seconds)
+
+    # ---------- 取消 ----------
+
+    def cancel(self, task_id) -> str:
+        """取消任务，返回任务所处的状态：queued / running / unknown"""
+        item = self.scheduler.cancel(task_id)
+        if item is not None:
+            self.cancelled_queued += 1
+            self._reclaim(self.timeout_for(item) or 0.0)
+            logger.info(emoji("TASK", f"已取消排队任务: {item.task_type} - {task_id}"))
+            if self.on_dequeue is not None:
+                self.on_dequeue(item)
+            self.notify()
+            return "queued"
+        entry = self.running.get(task_id)
+        if entry is not None and entry.reason is None and entry.runner.cancel():
+            entry.reason = CANCELLED
+            entry.cancelled.set()
+            logger.info(emoji("TASK", f"中断执行中的任务: {entry.item.task_type} - {task_id}"))
+            return "running"
+        self.cancel_misses += 1
+        return "unknown"
+
+    # ---------- 执行 ----------
+
+    async def _interrupt(self, entry: RunningTask):
+        entry.runner.cancel()
+        # 等待页面/浏览器收尾；超过 grace 仍未结束的不再等待，执行位照常释放
+        done, _ = await asyncio.wait({entry.runner}, timeout=self.grace)
+        if not done:
+            self.stuck += 1
+            # 最终结束时取走异常，避免 "exception was never retrieved"
+            entry.runner.add_done_callback(lambda runner: runner.cancelled() or runner.exception())
+            logger.warning(emoji("WARNING", f"任务中断后 {self.grace}s 仍未结束收尾: {entry.item.task.get('taskId')}"))
+
+    async def execute(self, item, coro):
+        """在独立协程中执行 coro；被取消或超过硬超时时抛出 TaskInterrupted"""
+        task_id = item.task.get("taskId")
+        entry = RunningTask(item, asyncio.create_task(coro), self.timeout_for(item))
+        self.running[task_id] = entry
+        cancelled = asyncio.ensure_future(entry.cancelled.wait())
+        try:
+            try:
+                done, _ = await asyncio.wait({entry.runner, cancelled}, timeout=entry.limit,
+                                             return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                cancelled.cancel()
+            if entry.runner not in done:
+                # 超时；或服务端已取消但处理器尚未结束：最多再等 grace 秒收尾，之后放弃该协程并释放执行位
+                entry.reason = entry.reason or TIMEOUT
+                await self._interrupt(entry)
+            if entry.reason is None:
+                return entry.runner.result()
+
+            elapsed = time.monotonic() - entry.started
+            if entry.reason == TIMEOUT:
+                self.timeouts += 1
+                logger.warning(emoji("TASK", f"任务超过硬超时 {entry.limit:.1f}s，已中断: {item.task_type} - {task_id}"))
+            else:
+                self.cancelled_running += 1
+                if entry.limit is not None:
+                    self._reclaim(entry.limit - elapsed)
+            raise TaskInterrupted(entry.reason, elapsed)
+        finally:
+            self.running.pop(task_id, None)
+            if not entry.runner.done():
+                # worker 自身被取消时不留下孤儿协程
+                entry.runner.cancel()
+
+    # ---------- 上报 ----------
+
+    def notify(self):
+        self._freed.set()
+
+    async def wait_freed(self, timeout: float):
+        """等待执行位因取消/超时被释放，最多 timeout 秒"""
+        try:
+            await asyncio.wait_for(self._freed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._freed.clear()
+
+    def stats(self) -> dict:
+        return {
+            "cancelled_queued": self.cancelled_queued,
+            "cancelled_running": self.cancelled_running,
+            "cancel_misses": self.cancel_misses,
+            "timeouts": self.timeouts,
+            "stuck": self.stuck,
+            "reclaimed_seconds": round(self.reclaimed_seconds, 1),
+            "running": len(self.running),
+        }
+
+
+def create_cancellation(config: dict, scheduler, on_dequeue=None) -> CancellationManager:
+    cancel_cfg = (config or {}).get("cancellation") or {}
+    return CancellationManager(
+        scheduler,
+        hard_timeouts=cancel_cfg.get("hard_timeouts") or {},
+        default_timeout=cancel_cfg.get("default_hard_timeout"),
+        enforce_deadline=cancel_cfg.get("enforce_deadline", True),
+        grace=cancel_cfg.get("grace", 10),
+        on_dequeue=on_dequeue,
+    )
@@ -0,0 +1,180 @@
+import asyncio
+import time
+from collections import deque
+from typing import Awaitable, Callable, Optional
+
+import psutil
+
+from core.shard_worker import shard_share
+from core.system_resources import browser_rss_mb, resource_ceiling
+from common.logger import get_logger, emoji
+
+logger = get_logger("concurrency")
+
+
+class ConcurrencyLimiter:
+    """可在运行时调整上限的信号量"""
+
+    def __init__(self, limit: int):
+        self.limit = max(1, limit)
+        self.in_use = 0
+        self._cond = asyncio.Condition()
+
+    async def __aenter__(self):
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.in_use < self.limit)
+            self.in_use += 1
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.release()
+
+    def try_acquire(self) -> bool:
+        """非阻塞占用一个执行位，供调度器在出队时同时占位"""
+        if self.in_use >= self.limit:
+            return False
+        self.in_use += 1
+        return True
+
+    async def release(self):
+        async with self._cond:
+            self.in_use -= 1
+            self._cond.notify()
+
+    async def set_limit(self, limit: int):
+        async with self._cond:
+            self.limit = max(1, limit)
+            self._cond.notify_all()
+
+
+class AdaptiveConcurrency:
+    """
+    基于反馈的并发控制（AIMD）：
+    - 周期采样 CPU、可用内存、浏览器进程 RSS，以及近期求解耗时和失败率
+    - CPU 使用 EWMA 平滑后再判断，单次采样的尖峰不会触发下调
+    - 资源或质量出现压力时按比例下调，空闲且满载运行时逐个上调
+    - 上限始终在 [floor, ceiling] 内；ceiling 未配置时按 CPU 数和总内存推算，且不低于初始并发
+    """
+
+    def __init__(self, limiter: ConcurrencyLimiter, floor: int = 1, ceiling: Optional[int] = None,
+                 interval: float = 5.0, max_cpu_percent: float = 90.0, min_available_mb: int = 1024,
+                 max_browser_rss_mb: Optional[int] = None, max_latency_seconds: Optional[float] = None,
+                 max_failure_rate: float = 0.5, decrease_factor: float = 0.5, window: int = 50,
+                 cpu_smoothing: float = 0.5, browser_mb: int = 512, watchdog=None):
+        self.limiter = limiter
+        # 有资源巡检时直接使用其采样结果，不再重复遍历浏览器进程树
+        self.watchdog = watchdog
+        self.floor = max(1, floor)
+        if not ceiling:
+            # 未配置时按整机资源推算（分片模式下均分），不低于初始并发
+            ceiling = max(limiter.limit, shard_share(resource_ceiling(browser_mb, min_available_mb)))
+        self.ceiling = max(self.floor, ceiling)
+        self.interval = interval
+        self.max_cpu_percent = max_cpu_percent
+        self.min_available_mb = min_available_mb
+        self.max_browser_rss_mb = max_browser_rss_mb
+        self.max_latency_seconds = max_latency_seconds
+        self.max_failure_rate = max_failure_rate
+        self.decrease_factor = decrease_factor
+        # 新采样的权重，越小越平滑
+        self.cpu_smoothing = min(1.0, max(0.01, cpu_smoothing))
+        self._cpu_ewma: Optional[float] = None
+        self._outcomes = deque(maxlen=window)
+        self.last_sample: dict = {}
+
+    def record(self, latency: float, success: bool):
+        self._outcomes.append((latency, success))
+
+    def _quality(self):
+        if not self._outcomes:
+            return None, 0.0
+        latencies = sorted(o[0] for o in self._outcomes)
+        p50 = latencies[len(latencies) // 2]
+        failure_rate = sum(1 for o in self._outcomes if not o[1]) / len(self._outcomes)
+        return p50, failure_rate
+
+    def _smooth_cpu(self, cpu_percent: float) -> float:
+        if self._cpu_ewma is None:
+            self._cpu_ewma = cpu_percent
+        else:
+            self._cpu_ewma += self.cpu_smoothing * (cpu_percent - self._cpu_ewma)
+        return round(self._cpu_ewma, 1)
+
+    def _sample(self) -> dict:
+        sample = {
+            "cpu_percent": psutil.cpu_percent(interval=None),
+            "available_mb": round(psutil.virtual_memory().available / (1024 ** 2)),
+        }
+        resources = self.watchdog.last_sample if self.watchdog is not None else None
+        if resources:
+            sample["browser_rss_mb"] = round(resources["browser_rss_mb"])
+            sample["fd_leak"] = self.watchdog.fd_leak()
+        else:
+            sample["browser_rss_mb"] = round(browser_rss_mb())
+        return sample
+
+    def _pressure(self, sample: dict) -> Optional[str]:
+        cpu = sample.get("cpu_smoothed", sample["cpu_percent"])
+        if cpu >= self.max_cpu_percent:
+            return f"CPU {cpu}%（平滑后）"
+        if sample["available_mb"] < self.min_available_mb:
+            return f"可用内存 {sample['available_mb']}MB"
+        if self.max_browser_rss_mb and sample["browser_rss_mb"] > self.max_browser_rss_mb:
+            return f"浏览器内存 {sample['browser_rss_mb']}MB"
+        if sample.get("fd_leak"):
+            return f"fd 泄漏 {sample['fd_leak']}"
+        p50, failure_rate = sample["latency_p50"], sample["failure_rate"]
+        if len(self._outcomes) >= 5 and failure_rate > self.max_failure_rate:
+            return f"失败率 {failure_rate:.0%}"
+        if self.max_latency_seconds and p50 is not None and p50 > self.max_latency_seconds:
+            return f"耗时 p50 {p50:.1f}s"
+        return None
+
+    def next_limit(self, sample: dict) -> int:
+        current = self.limiter.limit
+        reason = self._pressure(sample)
+        if reason:
+            new = max(self.floor, int(current * self.decrease_factor))
+            if new != current:
+                logger.warning(emoji("WARNING", f"并发下调 {current} -> {new}: {reason}"))
+            return new
+        # 只有在当前上限被用满时才继续加
+        if self.limiter.in_use >= current and current < self.ceiling:
+            return current + 1
+        return current
+
+    async def run(self, on_change: Callable[[int], Awaitable[None]]):
+        psutil.cpu_percent(interval=None)
+        while True:
+            await asyncio.sleep(self.interval)
+            sample = await asyncio.to_thread(self._sample)
+            sample["cpu_smoothed"] = self._smooth_cpu(sample["cpu_percent"])
+            sample["latency_p50"], sample["failure_rate"] = self._quality()
+            sample["timestamp"] = time.time()
+            self.last_sample = sample
+            new = self.next_limit(sample)
+            if new != self.limiter.limit:
+                await self.limiter.set_limit(new)
+                # 调整后清空历史，按新的并发重新观察
+                self._outcomes.clear()
+                await on_change(new)
+
+
+def create_controller(config: dict, limiter: ConcurrencyLimiter, watchdog=None) -> Optional[AdaptiveConcurrency]:
+    adaptive_cfg = (config or {}).get("adaptive_concurrency") or {}
+    if not adaptive_cfg.get("enabled"):
+        return None
+    return AdaptiveConcurrency(
+        limiter,
+        floor=adaptive_cfg.get("min", 1),
+        ceiling=adaptive_cfg.get("max"),
+        interval=adaptive_cfg.get("interval", 5.0),
+        max_cpu_percent=adaptive_cfg.get("max_cpu_percent", 90.0),
+        min_available_mb=adaptive_cfg.get("min_available_mb", 1024),
+        max_browser_rss_mb=adaptive_cfg.get("max_browser_rss_mb"),
+        max_latency_seconds=adaptive_cfg.get("max_latency_seconds"),
+        max_failure_rate=adaptive_cfg.get("max_failure_rate", 0.5),
+        cpu_smoothing=adaptive_cfg.get("cpu_smoothing", 0.5),
+        browser_mb=adaptive_cfg.get("browser_mb", 512),
+        watchdog=watchdog,
+    )
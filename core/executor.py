@@ -0,0 +1,236 @@
+import asyncio
+import base64
+import binascii
+import importlib
+import multiprocessing
+import sys
+import traceback
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+from typing import Optional
+
+from common.logger import get_logger, emoji
+
+logger = get_logger("executor")
+
+# 任务中可能携带 base64 图片的字段（ImageToTextTask 的 body，批量任务的 images）
+IMAGE_FIELDS = ("body", "images")
+
+
+def _strip_data_url(data: str) -> str:
+    if data.startswith("data:") and "," in data:
+        return data.split(",", 1)[1]
+    return data
+
+
+def decode_images(task: dict) -> list:
+    """解码任务中的 base64 图片，返回 bytes 列表（在线程中调用，避免阻塞事件循环）"""
+    images = []
+    for field in IMAGE_FIELDS:
+        value = task.get(field)
+        if not value:
+            continue
+        for item in value if isinstance(value, list) else [value]:
+            if not isinstance(item, str):
+                continue
+            try:
+                images.append(base64.b64decode(_strip_data_url(item)))
+            except (binascii.Error, ValueError):
+                logger.debug("跳过无法解码的图片字段: %s", field)
+    return images
+
+
+def _decode_to_shm(task: dict) -> list:
+    """解码图片并写入共享内存，返回 (name, size) 描述符，子进程直接映射读取"""
+    descriptors = []
+    for data in decode_images(task):
+        shm = shared_memory.SharedMemory(create=True, size=max(1, len(data)))
+        shm.buf[:len(data)] = data
+        descriptors.append((shm.name, len(data)))
+        shm.close()
+    return descriptors
+
+
+def _release_shm(descriptors: list):
+    for name, _ in descriptors:
+        try:
+            shm = shared_memory.SharedMemory(name=name)
+            shm.close()
+            shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def _attach_shm(name: str) -> shared_memory.SharedMemory:
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    shm = shared_memory.SharedMemory(name=name)
+    # 3.13 之前子进程 attach 也会登记到 resource_tracker，由父进程负责 unlink
+    try:
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(shm._name, "shared_memory")
+    except Exception:
+        pass
+    return shm
+
+
+# ---------- 子进程侧 ----------
+
+_process_handlers: dict = {}
+
+
+def _load_handler(task_type: str):
+    module = _process_handlers.get(task_type)
+    if module is None:
+        module = importlib.import_module(f"task_handlers.{task_type}")
+        _process_handlers[task_type] = module
+    return module
+
+
+def _init_process(task_types: list):
+    """子进程初始化：每个进程只加载一次处理器和模型"""
+    for task_type in task_types:
+        try:
+            module = _load_handler(task_type)
+            warmup = getattr(module, "warmup", None)
+            if callable(warmup):
+                warmup()
+        except Exception:
+            traceback.print_exc()
+
+
+def _ping() -> bool:
+    return True
+
+
+def _run_in_process(task_type: str, task: dict, descriptors: list):
+    module = _load_handler(task_type)
+    segments = [(_attach_shm(name), size) for name, size in descriptors]
+    try:
+        if descriptors:
+            task["decoded_images"] = [shm.buf[:size] for shm, size in segments]
+        return module.run(task)
+    finally:
+        task.pop("decoded_images", None)
+        for shm, _ in segments:
+            try:
+                shm.close()
+            except BufferError:
+                # 处理器仍持有 memoryview 引用，交给进程退出时回收
+                pass
+
+
+# ---------- 主进程侧 ----------
+
+class ExecutionEngine:
+    """
+    同步处理器的执行层：
+    - thread: 专用线程池，适合 IO 型同步处理器
+    - process: 进程池，适合 CPU 密集型处理器（ImageToTextTask 等），避免占用 GIL 阻塞事件循环
+    每个池都有有界的提交队列，图片通过共享内存传给子进程
+    """
+
+    def __init__(self, thread_workers: int = 4, process_workers: int = 2, max_pending: int = 32,
+                 start_method: str = "spawn", handler_modes: Optional[dict] = None):
+        self.thread_workers = max(1, thread_workers)
+        self.process_workers = max(1, process_workers)
+        self.max_pending = max(1, max_pending)
+        self.start_method = start_method
+        self.handler_modes = handler_modes or {}
+
+        self._thread_pool: Optional[ThreadPoolExecutor] = None
+        self._process_pool: Optional[ProcessPoolExecutor] = None
+        self._process_types: list = []
+        self._thread_slots = asyncio.Semaphore(self.max_pending)
+        self._process_slots = asyncio.Semaphore(self.max_pending)
+
+    def mode_for(self, handler) -> str:
+        """配置优先，其次是处理器模块中的 EXECUTOR 声明，默认 thread"""
+        mode = self.handler_modes.get(handler.task_type) or getattr(handler.module, "EXECUTOR", "thread")
+        return "process" if mode == "process" else "thread"
+
+    def _threads(self) -> ThreadPoolExecutor:
+        if self._thread_pool is None:
+            self._thread_pool = ThreadPoolExecutor(max_workers=self.thread_workers, thread_name_prefix="handler")
+        return self._thread_pool
+
+    def _processes(self) -> ProcessPoolExecutor:
+        if self._process_pool is None:
+            self._process_pool = ProcessPoolExecutor(
+                max_workers=self.process_workers,
+                mp_context=multiprocessing.get_context(self.start_method),
+                initializer=_init_process,
+                initargs=(list(self._process_types),),
+            )
+        return self._process_pool
+
+    async def _start_processes(self) -> ProcessPoolExecutor:
+        loop = asyncio.get_running_loop()
+        pool = self._processes()
+        await asyncio.gather(*(loop.run_in_executor(pool, _ping) for _ in range(self.process_workers)))
+        return pool
+
+    async def warm_up(self, handlers: list):
+        """启动所有子进程并预加载处理器（模型在每个进程中只加载一次）"""
+        self._process_types = [h.task_type for h in handlers if self.mode_for(h) == "process"]
+        if not self._process_types:
+            return
+        await self._start_processes()
+        logger.info(emoji("STARTUP", f"进程池已预热: {self.process_workers} 个进程 -> {self._process_types}"))
+
+    async def _restart_processes(self, broken: ProcessPoolExecutor):
+        """子进程崩溃后进程池不可再用：丢弃旧池并重新预热，并发任务只有第一个会触发重建"""
+        if self._process_pool is broken:
+            self._process_pool = None
+            broken.shutdown(wait=False, cancel_futures=True)
+            logger.warning(emoji("WARNING", "进程池已损坏（子进程异常退出），正在重建"))
+        await self._start_processes()
+
+    async def run(self, handler, task: dict):
+        loop = asyncio.get_running_loop()
+        if self.mode_for(handler) == "process":
+            async with self._process_slots:
+                descriptors = await loop.run_in_executor(self._threads(), _decode_to_shm, task)
+                try:
+                    payload = {k: v for k, v in task.items() if not descriptors or k not in IMAGE_FIELDS}
+                    pool = self._processes()
+                    try:
+                        return await loop.run_in_executor(
+                            pool, _run_in_process, handler.task_type, payload, descriptors
+                        )
+                    except BrokenProcessPool:
+                        # 重建后只重试一次，处理器本身导致崩溃时不会反复拉起进程
+                        await self._restart_processes(pool)
+                        return await loop.run_in_executor(
+                            self._processes(), _run_in_process, handler.task_type, payload, descriptors
+                        )
+                finally:
+                    _release_shm(descriptors)
+
+        async with self._thread_slots:
+            return await loop.run_in_executor(self._threads(), self._run_in_thread, handler, task)
+
+    @staticmethod
+    def _run_in_thread(handler, task: dict):
+        images = decode_images(task)
+        if images:
+            task = dict(task, decoded_images=images)
+        return handler.run(task)
+
+    def shutdown(self):
+        if self._process_pool is not None:
+            self._process_pool.shutdown(wait=False, cancel_futures=True)
+        if self._thread_pool is not None:
+            self._thread_pool.shutdown(wait=False, cancel_futures=True)
+
+
+def create_engine(config: dict) -> ExecutionEngine:
+    exec_cfg = (config or {}).get("executor") or {}
+    return ExecutionEngine(
+        thread_workers=exec_cfg.get("thread_workers", 4),
+        process_workers=exec_cfg.get("process_workers", 2),
+        max_pending=exec_cfg.get("max_pending", 32),
+        start_method=exec_cfg.get("start_method", "spawn"),
+        handler_modes=exec_cfg.get("handlers") or {},
+    )
@@ -0,0 +1,117 @@
+import asyncio
+import time
+from typing import Optional
+
+from common.logger import get_logger, emoji
+
+logger = get_logger("flow_control")
+
+
+class CreditManager:
+    """
+    基于额度的流控：
+    - 按任务类型向服务端授予额度（空闲执行位），任务占用额度直到执行结束
+    - 额度变化时立即发送 credit_update（限频合并）
+    - credits 模式下超出额度的任务直接退回，不在本地排队
+    """
+
+    def __init__(self, limiter, task_types: list, type_limits: Optional[dict] = None, enabled: bool = False,
+                 min_interval: float = 0.1):
+        self.limiter = limiter
+        self.task_types = list(task_types or [])
+        self.type_limits = type_limits or {}
+        self.enabled = enabled
+        self.min_interval = min_interval
+        self.outstanding: dict = {}
+        self.rejected = 0
+        self.updates_sent = 0
+        self._changed = asyncio.Event()
+        self._freed = asyncio.Event()
+
+    def set_task_types(self, task_types: list):
+        self.task_types = list(task_types or [])
+        self.notify()
+
+    def total_outstanding(self) -> int:
+        return sum(self.outstanding.values())
+
+    def credits(self) -> dict:
+        free = max(0, self.limiter.limit - self.total_outstanding())
+        result = {}
+        for task_type in self.task_types:
+            type_limit = self.type_limits.get(task_type)
+            if type_limit is None:
+                result[task_type] = free
+            else:
+                result[task_type] = max(0, min(free, type_limit - self.outstanding.get(task_type, 0)))
+        return result
+
+    def try_acquire(self, task_type: str) -> bool:
+        """占用一个额度；credits 模式下没有额度时返回 False"""
+        if self.enabled and self.credits().get(task_type, 0) <= 0:
+            self.rejected += 1
+            return False
+        self.outstanding[task_type] = self.outstanding.get(task_type, 0) + 1
+        self.notify()
+        return True
+
+    def release(self, task_type: str):
+        count = self.outstanding.get(task_type, 0) - 1
+        if count > 0:
+            self.outstanding[task_type] = count
+        else:
+            self.outstanding.pop(task_type, None)
+        self._freed.set()
+        self.notify()
+
+    def notify(self):
+        self._changed.set()
+
+    async def run(self, outbound):
+        """当前连接的额度推送循环，连接建立后先发一次完整额度"""
+        if not self.enabled:
+            return
+        last_sent_at = 0.0
+        self._changed.set()
+        while True:
+            await self._changed.wait()
+            # 有执行位释放时立即上报；仅占用额度的变化限频合并。
+            # 即使合并后额度与上次相同也要发送，服务端在此期间已经按旧额度派发过任务
+            wait = self.min_interval - (time.monotonic() - last_sent_at)
+            if wait > 0 and not self._freed.is_set():
+                try:
+                    await asyncio.wait_for(self._freed.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+            self._changed.clear()
+            self._freed.clear()
+            await outbound.send({
+                "type": "credit_update",
+                "credits": self.credits(),
+                "running": self.limiter.in_use,
+                "outstanding": self.total_outstanding(),
+            })
+            last_sent_at = time.monotonic()
+            self.updates_sent += 1
+
+    def stats(self) -> dict:
+        return {
+            "mode": "credits" if self.enabled else "push",
+            "credits": self.credits(),
+            "rejected": self.rejected,
+            "updates_sent": self.updates_sent,
+        }
+
+
+def create_credit_manager(config: dict, limiter) -> CreditManager:
+    flow_cfg = (config or {}).get("flow_control") or {}
+    manager = CreditManager(
+        limiter,
+        task_types=[],
+        type_limits=(config or {}).get("type_concurrency") or {},
+        enabled=flow_cfg.get("mode") == "credits",
+        min_interval=flow_cfg.get("min_update_interval_ms", 100) / 1000,
+    )
+    if manager.enabled:
+        logger.info(emoji("NETWORK", "流控模式: credits"))
+    return manager
@@ -0,0 +1,160 @@
+import asyncio
+import importlib
+import importlib.util
+import os
+import sys
+import time
+import traceback
+from typing import Optional
+
+from common.logger import get_logger, emoji
+
+logger = get_logger("handler_registry")
+
+
+class HandlerEntry:
+    def __init__(self, task_type: str, module, path: str, mtime: float):
+        self.task_type = task_type
+        self.module = module
+        self.path = path
+        self.mtime = mtime
+        self.checked_at = time.monotonic()
+        self.run = module.run
+        self.run_is_coroutine = asyncio.iscoroutinefunction(module.run)
+        cleanup = getattr(module, "cleanup", None)
+        self.cleanup = cleanup if callable(cleanup) else None
+        self.cleanup_is_coroutine = asyncio.iscoroutinefunction(cleanup) if cleanup else False
+        # 可选的启动预热钩子：async def warm_up(config, proxy=None)
+        warm_up = getattr(module, "warm_up", None)
+        self.warm_up = warm_up if asyncio.iscoroutinefunction(warm_up) else None
+
+
+class HandlerRegistry:
+    """
+    任务处理器注册表：
+    - 启动时预加载并校验 solver_type 中的每个类型
+    - 每个任务只做一次字典查找
+    - 仅在处理器文件 mtime 变化时重新加载
+    """
+
+    def __init__(self, handler_dir: str = "task_handlers", check_interval: float = 2.0):
+        self.handler_dir = handler_dir
+        self.package = os.path.basename(os.path.normpath(handler_dir))
+        self.check_interval = check_interval
+        self._entries: dict = {}
+
+    def _path(self, task_type: str) -> str:
+        return os.path.join(self.handler_dir, f"{task_type}.py")
+
+    def _load_module(self, task_type: str, previous=None):
+        if previous is not None:
+            return importlib.reload(previous)
+
+        try:
+            return importlib.import_module(f"{self.package}.{task_type}")
+        except ModuleNotFoundError:
+            pass
+
+        path = self._path(task_type)
+        spec = importlib.util.spec_from_file_location(task_type, path)
+        if not spec:
+            raise RuntimeError("创建模块 spec 失败")
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[task_type] = module
+        spec.loader.exec_module(module)
+        return module
+
+    def register(self, task_type: str) -> HandlerEntry:
+        """加载并校验处理器，失败时抛出 RuntimeError"""
+        path = self._path(task_type)
+        if not os.path.exists(path):
+            raise RuntimeError(f"文件不存在: {path}")
+
+        previous = self._entries.get(task_type)
+        mtime = os.path.getmtime(path)
+        try:
+            module = self._load_module(task_type, previous.module if previous else None)
+        except Exception as e:
+            logger.debug(traceback.format_exc())
+            raise RuntimeError(f"模块加载失败: {task_type}: {e}") from e
+
+        if not callable(getattr(module, "run", None)):
+            raise RuntimeError(f"处理器缺少 run 函数: {task_type}")
+
+        entry = HandlerEntry(task_type, module, path, mtime)
+        self._entries[task_type] = entry
+        return entry
+
+    def add_module(self, task_type: str, module) -> HandlerEntry:
+        """直接注册一个已加载的模块（不走文件加载，也不参与热更新）"""
+        if not callable(getattr(module, "run", None)):
+            raise RuntimeError(f"处理器缺少 run 函数: {task_type}")
+        entry = HandlerEntry(task_type, module, getattr(module, "__file__", "") or "", 0)
+        entry.checked_at = float("inf")
+        self._entries[task_type] = entry
+        return entry
+
+    def preload(self, task_types) -> list:
+        """预加载所有类型，返回加载成功的类型列表"""
+        loaded = []
+        for task_type in task_types or []:
+            try:
+                self.register(task_type)
+                loaded.append(task_type)
+                logger.info(emoji("SUCCESS", f"已加载处理器: {task_type}"))
+            except Exception as e:
+                logger.error(emoji("ERROR", f"处理器不可用: {e}"))
+        return loaded
+
+    async def preload_parallel(self, task_types) -> list:
+        """在线程中并行导入各处理器（camoufox / hcaptcha_challenger 等重依赖的导入互相重叠），返回加载成功的类型"""
+        task_types = list(task_types or [])
+        results = await asyncio.gather(
+            *(asyncio.to_thread(self.register, task_type) for task_type in task_types), return_exceptions=True
+        )
+        loaded = []
+        for task_type, result in zip(task_types, results):
+            if isinstance(result, Exception):
+                # 并行导入偶尔会因模块锁冲突失败，顺序重试一次
+                try:
+                    self.register(task_type)
+                except Exception as e:
+                    logger.error(emoji("ERROR", f"处理器不可用: {e}"))
+                    continue
+            loaded.append(task_type)
+            logger.info(emoji("SUCCESS", f"已加载处理器: {task_type}"))
+        return loaded
+
+    def _maybe_reload(self, entry: HandlerEntry) -> HandlerEntry:
+        now = time.monotonic()
+        if now - entry.checked_at < self.check_interval:
+            return entry
+        entry.checked_at = now
+        try:
+            mtime = os.path.getmtime(entry.path)
+        except OSError:
+            return entry
+        if mtime == entry.mtime:
+            return entry
+
+        try:
+            entry = self.register(entry.task_type)
+            logger.info(emoji("SUCCESS", f"处理器已热更新: {entry.task_type}"))
+        except Exception as e:
+            # 新版本有问题时继续使用旧版本
+            entry.mtime = mtime
+            logger.error(emoji("ERROR", f"处理器热更新失败，继续使用旧版本: {e}"))
+        return entry
+
+    def get(self, task_type: str) -> Optional[HandlerEntry]:
+        entry = self._entries.get(task_type)
+        if entry is None:
+            try:
+                return self.register(task_type)
+            except Exception as e:
+                logger.error(emoji("ERROR", str(e)))
+                return None
+        return self._maybe_reload(entry)
+
+    def task_types(self) -> list:
+        return list(self._entries)
@@ -0,0 +1,162 @@
+import asyncio
+import json
+import os
+import random
+from collections import OrderedDict, deque
+from typing import Optional
+
+from common.logger import get_logger, emoji
+
+logger = get_logger("journal")
+
+
+class ResultJournal:
+    """
+    待发送结果的日志：任务完成后先写入这里，真正写到 socket 后才移除
+    - 断线期间结果留在日志中，重新 register 后重放
+    - 按 taskId 去重
+    - 有界，可选追加写入磁盘文件，进程重启后继续补发
+    """
+
+    def __init__(self, max_entries: int = 1000, path: Optional[str] = None, recent_size: int = 5000):
+        self.max_entries = max(1, max_entries)
+        self.path = path
+        self.pending: "OrderedDict[str, dict]" = OrderedDict()
+        # taskId -> (任务类型, 代理)，只在内存中保留，出站发送耗时按它统计
+        self._labels: dict = {}
+        # 最近已送达的 taskId，用于丢弃重复结果
+        self._recent = deque(maxlen=recent_size)
+        self._recent_ids = set()
+        self._changed = asyncio.Event()
+        self._file = None
+        self._lines = 0
+        self.dropped = 0
+        self.replayed = 0
+        if path:
+            self._load()
+
+    # ---------- 磁盘 ----------
+
+    def _load(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        if os.path.exists(self.path):
+            with open(self.path, "r") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    if record.get("op") == "add":
+                        message = record["message"]
+                        self.pending[message.get("taskId")] = message
+                    elif record.get("op") == "done":
+                        self.pending.pop(record.get("taskId"), None)
+            while len(self.pending) > self.max_entries:
+                self.pending.popitem(last=False)
+            if self.pending:
+                logger.info(emoji("DB", f"从日志恢复 {len(self.pending)} 个待发送结果"))
+        self._compact()
+
+    def _append(self, record: dict):
+        if self._file is None:
+            return
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+        self._lines += 1
+        if self._lines > self.max_entries * 4:
+            self._compact()
+
+    def _compact(self):
+        if not self.path:
+            return
+        if self._file is not None:
+            self._file.close()
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            for message in self.pending.values():
+                f.write(json.dumps({"op": "add", "message": message}, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, self.path)
+        self._file = open(self.path, "a")
+        self._lines = len(self.pending)
+
+    # ---------- 结果 ----------
+
+    def seen(self, task_id) -> bool:
+        return task_id in self.pending or task_id in self._recent_ids
+
+    def add(self, message: dict, labels: Optional[tuple] = None):
+        task_id = message.get("taskId")
+        if task_id in self._recent_ids:
+            logger.debug("丢弃重复结果: %s", task_id)
+            return
+        if task_id not in self.pending and len(self.pending) >= self.max_entries:
+            old_id, _ = self.pending.popitem(last=False)
+            self._labels.pop(old_id, None)
+            self.dropped += 1
+            self._append({"op": "done", "taskId": old_id})
+            logger.warning(emoji("WARNING", f"结果日志已满，丢弃最早的结果: {old_id}"))
+        self.pending[task_id] = message
+        if labels is not None:
+            self._labels[task_id] = labels
+        self._append({"op": "add", "message": message})
+        self._changed.set()
+
+    def mark_sent(self, messages: list):
+        for message in messages:
+            task_id = message.get("taskId")
+            self._labels.pop(task_id, None)
+            if self.pending.pop(task_id, None) is None:
+                continue
+            self._append({"op": "done", "taskId": task_id})
+            if len(self._recent) == self._recent.maxlen:
+                self._recent_ids.discard(self._recent[0])
+            self._recent.append(task_id)
+            self._recent_ids.add(task_id)
+
+    async def pump(self, outbound):
+        """当前连接的发送循环：先重放所有未送达结果，再持续转发新结果"""
+        handed = set()
+        first = True
+        while True:
+            self._changed.clear()
+            for task_id, message in list(self.pending.items()):
+                if task_id in handed:
+                    continue
+                handed.add(task_id)
+                if first:
+                    self.replayed += 1
+                await outbound.send_result(message, self._labels.get(task_id))
+            if first and handed:
+                logger.info(emoji("NETWORK", f"重放 {len(handed)} 个未送达结果"))
+            first = False
+            handed.intersection_update(self.pending.keys())
+            await self._changed.wait()
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self.pending),
+            "dropped": self.dropped,
+            "replayed": self.replayed,
+        }
+
+
+class Backoff:
+    """指数退避 + 全抖动"""
+
+    def __init__(self, base: float = 1.0, maximum: float = 60.0):
+        self.base = base
+        self.maximum = maximum
+        self.attempt = 0
+
+    def reset(self):
+        self.attempt = 0
+
+    def next_delay(self) -> float:
+        delay = random.uniform(0, min(self.maximum, self.base * (2 ** min(self.attempt, 16))))
+        self.attempt += 1
+        return delay
+
+
+def create_journal(config: dict) -> ResultJournal:
+    journal_cfg = (config or {}).get("journal") or {}
+    return ResultJournal(max_entries=journal_cfg.get("max_entries", 1000), path=journal_cfg.get("path"))
@@ -0,0 +1,173 @@
+import asyncio
+import json
+import time
+from typing import Callable, Optional
+
+from common.logger import get_logger, emoji
+from common.metrics import metrics
+
+logger = get_logger("outbound")
+
+try:
+    import orjson
+except ImportError:  # orjson 在 requirements 中，缺失时退回标准库
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+class Codec:
+    name = "json"
+
+    def encode(self, message: dict):
+        if orjson is not None:
+            return orjson.dumps(message)
+        return json.dumps(message)
+
+    def decode(self, payload):
+        if orjson is not None:
+            return orjson.loads(payload)
+        return json.loads(payload)
+
+
+class MsgpackCodec(Codec):
+    name = "msgpack"
+
+    def encode(self, message: dict):
+        return msgpack.packb(message, use_bin_type=True)
+
+    def decode(self, payload):
+        return msgpack.unpackb(payload, raw=False)
+
+
+def available_codecs() -> list:
+    return ["msgpack", "json"] if msgpack is not None else ["json"]
+
+
+def get_codec(name: Optional[str]) -> Codec:
+    if name == "msgpack" and msgpack is not None:
+        return MsgpackCodec()
+    return Codec()
+
+
+def decode_message(msg) -> dict:
+    """text 帧按 JSON 解析，binary 帧按 msgpack 解析"""
+    if isinstance(msg, (bytes, bytearray)) and msgpack is not None:
+        return msgpack.unpackb(msg, raw=False)
+    return Codec().decode(msg)
+
+
+class OutboundWriter:
+    """
+    单写者出站通道：连接上所有发送都经过这里
+    - 结果在 batch_window 内合并为一个 task_results 帧（服务端在 register_ack 中确认支持后开启）
+    - 状态/控制消息单独发送
+    """
+
+    def __init__(self, ws, batch_window: float = 0.005, max_batch: int = 50, max_queue: int = 1000,
+                 on_sent: Optional[Callable[[list], None]] = None):
+        self.ws = ws
+        # 结果真正写到 socket 后回调（用于从结果日志中移除）
+        self.on_sent = on_sent
+        self.batch_window = batch_window
+        self.max_batch = max(1, max_batch)
+        self.codec: Codec = Codec()
+        self.batch_results = False
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self._deferred = None
+
+        self.frames_sent = 0
+        self.results_sent = 0
+        self.bytes_sent = 0
+
+    def configure(self, codec: Optional[str] = None, batch_results: Optional[bool] = None):
+        """根据服务端的 register_ack 协商结果调整编码和合并策略"""
+        if codec:
+            self.codec = get_codec(codec)
+        if batch_results is not None:
+            self.batch_results = bool(batch_results)
+        logger.info(emoji("NETWORK", f"出站协议: codec={self.codec.name}, batch_results={self.batch_results}"))
+
+    async def send_result(self, message: dict, labels: Optional[tuple] = None):
+        """labels=(任务类型, 代理)：编码和发送耗时记到该任务的类型/代理直方图上"""
+        await self._queue.put((True, message, time.monotonic(), labels))
+
+    async def send(self, message: dict):
+        await self._queue.put((False, message, time.monotonic(), None))
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    async def _collect_batch(self, first) -> list:
+        batch = [first]
+        # 队列里没有其他结果时在窗口内等一小会儿，让同时完成的结果一起发送
+        if self._queue.empty() and self.batch_window:
+            await asyncio.sleep(self.batch_window)
+        while len(batch) < self.max_batch and not self._queue.empty():
+            item = self._queue.get_nowait()
+            if not item[0]:
+                # 控制消息不参与合并，先发当前批次再发它
+                self._deferred = item
+                break
+            batch.append(item)
+        return batch
+
+    async def _write(self, message: dict, items: list, results: Optional[list] = None):
+        started = time.monotonic()
+        payload = self.codec.encode(message)
+        encoded = time.monotonic() - started
+        metrics.observe_value("outbound_encode_seconds", encoded)
+        if isinstance(payload, bytes) and self.codec.name == "json":
+            await self.ws.send(payload, text=True)
+        else:
+            await self.ws.send(payload)
+        now = time.monotonic()
+        for _, _, enqueued_at, labels in items:
+            metrics.observe_value("outbound_send_seconds", now - enqueued_at)
+            if labels is not None:
+                # 合并发送时每个结果都记整帧的编码耗时
+                task_type, proxy = labels
+                metrics.observe("serialization", task_type, proxy, encoded)
+                metrics.observe("send", task_type, proxy, now - enqueued_at)
+        self.frames_sent += 1
+        self.bytes_sent += len(payload)
+        if results and self.on_sent is not None:
+            self.on_sent(results)
+
+    async def run(self):
+        while True:
+            if self._deferred is not None:
+                item, self._deferred = self._deferred, None
+            else:
+                item = await self._queue.get()
+            is_result, message = item[0], item[1]
+
+            if not is_result:
+                await self._write(message, [item])
+                continue
+
+            if not self.batch_results:
+                await self._write(message, [item], [message])
+                self.results_sent += 1
+                continue
+
+            batch = await self._collect_batch(item)
+            if len(batch) == 1:
+                await self._write(message, batch, [message])
+            else:
+                results = [m for _, m, _, _ in batch]
+                await self._write({"type": "task_results", "results": results}, batch, results)
+            self.results_sent += len(batch)
+
+    def stats(self) -> dict:
+        return {
+            "codec": self.codec.name,
+            "batch_results": self.batch_results,
+            "frames_sent": self.frames_sent,
+            "results_sent": self.results_sent,
+            "bytes_sent": self.bytes_sent,
+            "pending": self.pending(),
+        }
@@ -0,0 +1,276 @@
+import asyncio
+import base64
+import ssl
+import time
+from collections import OrderedDict
+from typing import Optional
+from urllib.parse import unquote, urlsplit
+
+from common.logger import get_logger, emoji
+from framework.browser_pool import proxy_key
+
+logger = get_logger("proxy_health")
+
+# 代理不可用时返回给服务端的错误码，与任务本身失败（-1）区分
+PROXY_ERROR_ID = -2
+PROXY_ERROR_CODE = "ERROR_PROXY_UNAVAILABLE"
+# 能够探测的代理协议，其他协议（如 socks4）不探测，直接交给浏览器
+SUPPORTED_SCHEMES = ("http", "https", "socks5", "socks5h")
+DEFAULT_TARGET = "challenges.cloudflare.com:443"
+
+
+class ProxyUnavailable(Exception):
+    pass
+
+
+def _parse(proxy) -> tuple:
+    """Playwright 格式的 dict 或 URL 字符串 -> (scheme, host, port, username, password)"""
+    if isinstance(proxy, dict):
+        server = proxy.get("server") or ""
+        username, password = proxy.get("username"), proxy.get("password")
+    else:
+        server, username, password = str(proxy), None, None
+    if "://" not in server:
+        server = f"http://{server}"
+    parts = urlsplit(server)
+    scheme = parts.scheme.lower()
+    port = parts.port or {"http": 80, "https": 443}.get(scheme, 1080)
+    username = username or (unquote(parts.username) if parts.username else None)
+    password = password or (unquote(parts.password) if parts.password else None)
+    return scheme, parts.hostname, port, username, password
+
+
+async def _probe_http(reader, writer, target: str, username, password):
+    headers = f"CONNECT {target} HTTP/1.1\r\nHost: {target}\r\n"
+    if username:
+        credentials = base64.b64encode(f"{username}:{password or ''}".encode()).decode()
+        headers += f"Proxy-Authorization: Basic {credentials}\r\n"
+    writer.write(f"{headers}\r\n".encode())
+    await writer.drain()
+    status_line = await reader.readline()
+    parts = status_line.split()
+    code = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else 0
+    if code == 407:
+        raise ProxyUnavailable("代理认证失败")
+    if code != 200:
+        raise ProxyUnavailable(f"CONNECT 返回 {code or status_line[:40]!r}")
+
+
+async def _probe_socks5(reader, writer, target: str, username, password):
+    host, _, port = target.rpartition(":")
+    writer.write(b"\x05\x01\x02" if username else b"\x05\x01\x00")
+    await writer.drain()
+    _, method = await reader.readexactly(2)
+    if method == 0x02:
+        user, pwd = (username or "").encode(), (password or "").encode()
+        writer.write(bytes([1, len(user)]) + user + bytes([len(pwd)]) + pwd)
+        await writer.drain()
+        if (await reader.readexactly(2))[1] != 0:
+            raise ProxyUnavailable("代理认证失败")
+    elif method != 0x00:
+        raise ProxyUnavailable("SOCKS5 无可用认证方式")
+    writer.write(b"\x05\x01\x00\x03" + bytes([len(host)]) + host.encode() + int(port).to_bytes(2, "big"))
+    await writer.drain()
+    reply = await reader.readexactly(4)
+    if reply[1] != 0:
+        raise ProxyUnavailable(f"SOCKS5 连接目标失败: {reply[1]}")
+
+
+def supported(proxy) -> bool:
+    return _parse(proxy)[0] in SUPPORTED_SCHEMES
+
+
+async def _tunnel(scheme: str, host: str, port: int, target: str, username, password):
+    reader, writer = await asyncio.open_connection(
+        host, port, ssl=ssl.create_default_context() if scheme == "https" else None
+    )
+    try:
+        if scheme.startswith("socks5"):
+            await _probe_socks5(reader, writer, target, username, password)
+        else:
+            await _probe_http(reader, writer, target, username, password)
+    finally:
+        writer.close()
+
+
+async def probe(proxy, target: str, timeout: float) -> float:
+    """
+    通过代理建立到 target 的隧道（HTTP CONNECT / SOCKS5 握手），不发送实际请求
+    成功返回耗时（秒），失败抛出 ProxyUnavailable
+    """
+    scheme, host, port, username, password = _parse(proxy)
+    if not host:
+        raise ProxyUnavailable("代理地址无效")
+    if scheme not in SUPPORTED_SCHEMES:
+        raise ValueError(f"不支持探测的代理协议: {scheme}")
+    started = time.perf_counter()
+    try:
+        await asyncio.wait_for(_tunnel(scheme, host, port, target, username, password), timeout)
+    except asyncio.TimeoutError:
+        raise ProxyUnavailable(f"探测超时({timeout}s)") from None
+    except (OSError, asyncio.IncompleteReadError, ValueError) as e:
+        raise ProxyUnavailable(f"连接失败: {e.__class__.__name__}: {e}") from None
+    return time.perf_counter() - started
+
+
+def _label(key: str) -> str:
+    """上报/日志中使用的代理名称，去掉 URL 里的密码"""
+    if "@" not in key:
+        return key
+    scheme, _, rest = key.rpartition("://")
+    userinfo, _, host = rest.rpartition("@")
+    user = userinfo.split(":", 1)[0]
+    return f"{scheme + '://' if scheme else ''}{user}@{host}"
+
+
+class ProxyStats:
+    def __init__(self):
+        self.latency: Optional[float] = None
+        # 探测成功率的指数滑动平均
+        self.score = 1.0
+        self.probes = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.last_error: Optional[str] = None
+        self.healthy_until = 0.0
+        self.dead_until = 0.0
+
+    def state(self, now: float) -> str:
+        if self.dead_until > now:
+            return "dead"
+        if self.healthy_until > now:
+            return "ok"
+        return "unknown"
+
+
+class ProxyHealth:
+    """
+    启动浏览器前的代理存活检查：
+    - 按任务类型选择探测目标（probe_targets），未配置的类型使用 target
+    - 探测结果按 (代理, 目标) 缓存：成功 ok_ttl 秒内不再探测，失败在 fail_ttl 秒内直接判定不可用（连续失败时加倍，不超过 max_fail_ttl）
+    - 同一代理的并发检查只探测一次
+    - 不支持的代理协议（如 socks4）不探测，直接放行
+    - 记录每个代理的延迟和成功率，随状态上报给服务端
+    """
+
+    def __init__(self, target: str = DEFAULT_TARGET, timeout: float = 5, ok_ttl: float = 60,
+                 fail_ttl: float = 15, max_fail_ttl: float = 120, max_entries: int = 1024, max_report: int = 20,
+                 alpha: float = 0.3, targets: Optional[dict] = None):
+        self.target = target
+        self.targets = targets or {}
+        self.timeout = timeout
+        self.ok_ttl = ok_ttl
+        self.fail_ttl = fail_ttl
+        self.max_fail_ttl = max_fail_ttl
+        self.max_entries = max(1, max_entries)
+        self.max_report = max_report
+        self.alpha = alpha
+
+        self._proxies: "OrderedDict[str, ProxyStats]" = OrderedDict()
+        self._probes: dict = {}
+
+        self.probes = 0
+        self.probe_failures = 0
+        self.fast_failures = 0
+        self.skipped = 0
+
+    def target_for(self, task_type: Optional[str]) -> str:
+        return self.targets.get(task_type) or self.target
+
+    def _stats(self, key: tuple) -> ProxyStats:
+        stats = self._proxies.get(key)
+        if stats is None:
+            stats = self._proxies[key] = ProxyStats()
+            while len(self._proxies) > self.max_entries:
+                self._proxies.popitem(last=False)
+        self._proxies.move_to_end(key)
+        return stats
+
+    async def _probe(self, key: tuple, proxy, stats: ProxyStats):
+        self.probes += 1
+        stats.probes += 1
+        try:
+            latency = await probe(proxy, key[1], self.timeout)
+        except ProxyUnavailable as e:
+            self.probe_failures += 1
+            stats.failures += 1
+            stats.consecutive_failures += 1
+            stats.last_error = str(e)
+            stats.score *= 1 - self.alpha
+            ttl = min(self.max_fail_ttl, self.fail_ttl * 2 ** (stats.consecutive_failures - 1))
+            stats.dead_until = time.monotonic() + ttl
+            logger.warning(emoji("NETWORK", f"代理不可用 {_label(key[0])} -> {key[1]}: {e}，{ttl:.0f}s 内不再使用"))
+            raise
+        stats.consecutive_failures = 0
+        stats.latency = latency if stats.latency is None else stats.latency + self.alpha * (latency - stats.latency)
+        stats.score += self.alpha * (1 - stats.score)
+        stats.healthy_until = time.monotonic() + self.ok_ttl
+
+    def _probe_done(self, key: tuple, future: asyncio.Future):
+        self._probes.pop(key, None)
+        # 等待方都被取消时也要取走异常，避免 "exception was never retrieved"
+        if not future.cancelled():
+            future.exception()
+
+    async def ensure(self, proxy, task_type: Optional[str] = None):
+        """代理可用时返回，不可用时抛出 ProxyUnavailable；没有代理或协议不支持探测时直接返回"""
+        if not proxy:
+            return
+        if not supported(proxy):
+            self.skipped += 1
+            return
+        key = (proxy_key(proxy), self.target_for(task_type))
+        stats = self._stats(key)
+        now = time.monotonic()
+        if stats.dead_until > now:
+            self.fast_failures += 1
+            raise ProxyUnavailable(stats.last_error or "代理不可用")
+        if stats.healthy_until > now:
+            return
+        pending = self._probes.get(key)
+        if pending is None:
+            pending = self._probes[key] = asyncio.ensure_future(self._probe(key, proxy, stats))
+            pending.add_done_callback(lambda future: self._probe_done(key, future))
+        await asyncio.shield(pending)
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        # 只上报最差的若干个代理，供服务端停止分配
+        worst = sorted(self._proxies.items(), key=lambda item: (item[1].score, -(item[1].latency or 0)))
+        return {
+            "tracked": len(self._proxies),
+            "dead": sum(1 for s in self._proxies.values() if s.dead_until > now),
+            "probes": self.probes,
+            "probe_failures": self.probe_failures,
+            "fast_failures": self.fast_failures,
+            "skipped": self.skipped,
+            "proxies": [
+                {
+                    "proxy": _label(key[0]),
+                    "target": key[1],
+                    "state": stats.state(now),
+                    "score": round(stats.score, 3),
+                    "latency_ms": round(stats.latency * 1000) if stats.latency is not None else None,
+                    "probes": stats.probes,
+                    "failures": stats.failures,
+                    "last_error": stats.last_error,
+                }
+                for key, stats in worst[:self.max_report]
+            ],
+        }
+
+
+def create_proxy_health(config: dict) -> Optional[ProxyHealth]:
+    health_cfg = (config or {}).get("proxy_health") or {}
+    if not health_cfg.get("enabled"):
+        return None
+    return ProxyHealth(
+        target=health_cfg.get("probe_target", DEFAULT_TARGET),
+        targets=health_cfg.get("probe_targets"),
+        timeout=health_cfg.get("timeout", 5),
+        ok_ttl=health_cfg.get("ok_ttl", 60),
+        fail_ttl=health_cfg.get("fail_ttl", 15),
+        max_fail_ttl=health_cfg.get("max_fail_ttl", 120),
+        max_entries=health_cfg.get("max_entries", 1024),
+        max_report=health_cfg.get("max_report", 20),
+    )
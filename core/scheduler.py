@@ -0,0 +1,269 @@
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from collections import deque
+from typing import Callable, Optional
+
+from common.logger import get_logger, emoji
+
+logger = get_logger("scheduler")
+
+EXPIRED = "expired"
+INFEASIBLE = "infeasible"
+
+
+def _seconds(value) -> Optional[float]:
+    """任务中的 deadline / timeout 字段转为秒数，缺失或无法解析时返回 None"""
+    if value is None or value == "":
+        return None
+    try:
+        seconds = float(value)
+    except (TypeError, ValueError):
+        return None
+    return seconds if math.isfinite(seconds) and seconds > 0 else None
+
+
+class ScheduledTask:
+    __slots__ = ("deadline", "seq", "task", "proxy", "received_at", "task_type", "blocked_at")
+
+    def __init__(self, deadline: float, seq: int, task: dict, proxy, received_at: float):
+        self.deadline = deadline
+        self.seq = seq
+        self.task = task
+        self.proxy = proxy
+        self.received_at = received_at
+        self.task_type = task.get("type")
+        # 排到队首、只差全局执行位的时刻；用于区分排队等待和执行位等待
+        self.blocked_at: Optional[float] = None
+
+    def __lt__(self, other: "ScheduledTask") -> bool:
+        return (self.deadline, self.seq) < (other.deadline, other.seq)
+
+
+class DeadlineScheduler:
+    """
+    按任务类型分配执行预算的 EDF 调度器：
+    - 每个类型独立排队，截止时间最早的任务优先执行，没有截止时间的任务按到达顺序排在后面
+    - 类型预算来自 type_concurrency，未配置的类型只受全局并发上限约束
+    - 已过期或按近期耗时估算无法按时完成的任务直接丢弃（on_drop 回调上报失败），不占用浏览器
+    """
+
+    def __init__(self, limiter, type_limits: Optional[dict] = None, type_timeouts: Optional[dict] = None,
+                 default_timeout: Optional[float] = None, max_queue: int = 100,
+                 on_drop: Optional[Callable[[ScheduledTask, str], None]] = None,
+                 min_samples: int = 10, window: int = 50):
+        self.limiter = limiter
+        self.type_limits = type_limits or {}
+        self.type_timeouts = type_timeouts or {}
+        self.default_timeout = default_timeout
+        self.max_queue = max(1, max_queue)
+        self.on_drop = on_drop
+        self.min_samples = min_samples
+        self.window = window
+
+        self.queues: dict = {}
+        self.running: dict = {}
+        self.dropped: dict = {}
+        self._durations: dict = {}
+        self._seq = itertools.count()
+        self._cond = asyncio.Condition()
+
+    # ---------- 截止时间 ----------
+
+    def deadline_for(self, task: dict, received_at: float) -> float:
+        """
+        截止时间（monotonic）：
+        - task["deadline"]: 绝对时间戳（秒或毫秒）
+        - task["timeout"]: 相对接收时刻的秒数
+        - 否则使用配置中该类型的默认超时，均未设置时为无穷大
+        字段无法解析时忽略该字段，回退到类型默认值
+        """
+        deadline = _seconds(task.get("deadline"))
+        if deadline:
+            if deadline > 1e11:
+                deadline /= 1000
+            return received_at + (deadline - time.time())
+        timeout = _seconds(task.get("timeout")) or _seconds(
+            self.type_timeouts.get(task.get("type"), self.default_timeout)
+        )
+        if timeout:
+            return received_at + timeout
+        return math.inf
+
+    @staticmethod
+    def validate(task: dict) -> Optional[str]:
+        """接收任务前的校验，返回问题描述；字段有问题的任务不占用额度、不记录 taskId"""
+        if not isinstance(task, dict):
+            return "任务格式错误"
+        if task.get("taskId") is None or not task.get("type"):
+            return "缺少 taskId 或 type"
+        for field in ("deadline", "timeout"):
+            if task.get(field) not in (None, "") and _seconds(task.get(field)) is None:
+                logger.warning(emoji("TASK", f"忽略无效的 {field}={task.get(field)!r}: {task.get('taskId')}"))
+        return None
+
+    def record(self, task_type: str, seconds: float):
+        """记录成功任务的执行耗时，用于判断剩余时间是否还够完成"""
+        durations = self._durations.get(task_type)
+        if durations is None:
+            durations = self._durations[task_type] = deque(maxlen=self.window)
+        durations.append(seconds)
+
+    def estimate(self, task_type: str) -> float:
+        """近期执行耗时的 10 分位数，样本不足时不做估算"""
+        durations = self._durations.get(task_type)
+        if not durations or len(durations) < self.min_samples:
+            return 0.0
+        return sorted(durations)[len(durations) // 10]
+
+    def _late_reason(self, item: ScheduledTask, now: float) -> Optional[str]:
+        if item.deadline <= now:
+            return EXPIRED
+        if now + self.estimate(item.task_type) > item.deadline:
+            return INFEASIBLE
+        return None
+
+    def _drop(self, item: ScheduledTask, reason: str):
+        counts = self.dropped.setdefault(item.task_type, {EXPIRED: 0, INFEASIBLE: 0})
+        counts[reason] += 1
+        logger.warning(emoji("TASK", f"丢弃任务({reason}): {item.task_type} - {item.task.get('taskId')}"))
+        if self.on_drop is not None:
+            self.on_drop(item, reason)
+
+    # ---------- 入队 / 出队 ----------
+
+    def queued(self) -> int:
+        return sum(len(q) for q in self.queues.values())
+
+    def _type_limit(self, task_type: str) -> int:
+        return self.type_limits.get(task_type) or self.limiter.limit
+
+    async def submit(self, task: dict, proxy, received_at: Optional[float] = None) -> bool:
+        """排队一个任务；已经过期或来不及完成时直接丢弃并返回 False"""
+        received_at = received_at if received_at is not None else time.monotonic()
+        item = ScheduledTask(self.deadline_for(task, received_at), next(self._seq), task, proxy, received_at)
+        reason = self._late_reason(item, time.monotonic())
+        if reason:
+            self._drop(item, reason)
+            return False
+        async with self._cond:
+            # 本地排队有上限，满了就阻塞接收，让服务端感知到背压
+            await self._cond.wait_for(lambda: self.queued() < self.max_queue)
+            heapq.heappush(self.queues.setdefault(item.task_type, []), item)
+            self._cond.notify_all()
+        return True
+
+    def cancel(self, task_id) -> Optional[ScheduledTask]:
+        """从队列中移除指定任务，不在队列中时返回 None"""
+        for queue in self.queues.values():
+            for index, item in enumerate(queue):
+                if item.task.get("taskId") == task_id:
+                    queue[index] = queue[-1]
+                    queue.pop()
+                    heapq.heapify(queue)
+                    return item
+        return None
+
+    def _drop_late(self, now: float):
+        # 队首截止时间最早，同类型估算耗时相同，只需检查队首
+        for queue in self.queues.values():
+            while queue:
+                reason = self._late_reason(queue[0], now)
+                if not reason:
+                    break
+                self._drop(heapq.heappop(queue), reason)
+
+    def _next_drop_at(self) -> float:
+        """最早一个队首任务会被判定过期或来不及完成的时刻，没有排队任务时为无穷大"""
+        return min(
+            (queue[0].deadline - self.estimate(task_type) for task_type, queue in self.queues.items() if queue),
+            default=math.inf,
+        )
+
+    def _pick(self) -> Optional[ScheduledTask]:
+        best = None
+        for task_type, queue in self.queues.items():
+            if not queue or self.running.get(task_type, 0) >= self._type_limit(task_type):
+                continue
+            if best is None or queue[0] < best:
+                best = queue[0]
+        return best
+
+    async def get(self) -> ScheduledTask:
+        """取出下一个可执行的任务，同时占用全局和类型执行位，结束后必须调用 done()"""
+        async with self._cond:
+            while True:
+                self._drop_late(time.monotonic())
+                item = self._pick()
+                if item is not None and self.limiter.try_acquire():
+                    heapq.heappop(self.queues[item.task_type])
+                    self.running[item.task_type] = self.running.get(item.task_type, 0) + 1
+                    self._cond.notify_all()
+                    return item
+                if item is not None and item.blocked_at is None:
+                    item.blocked_at = time.monotonic()
+                # 空闲时也要按时丢弃过期任务，等到最早的丢弃时刻就醒来重新检查
+                timeout = self._next_drop_at() - time.monotonic()
+                if timeout == math.inf:
+                    await self._cond.wait()
+                    continue
+                try:
+                    await asyncio.wait_for(self._cond.wait(), timeout=max(timeout, 0))
+                except asyncio.TimeoutError:
+                    pass
+
+    def try_start(self, task: dict, proxy) -> Optional[ScheduledTask]:
+        """
+        不经排队直接占用全局和类型执行位（预求解等后台任务），没有空闲执行位时返回 None
+        与 get() 出队的任务一样计入 running，结束后必须调用 done()
+        """
+        task_type = task.get("type")
+        if self.running.get(task_type, 0) >= self._type_limit(task_type) or not self.limiter.try_acquire():
+            return None
+        now = time.monotonic()
+        self.running[task_type] = self.running.get(task_type, 0) + 1
+        return ScheduledTask(self.deadline_for(task, now), next(self._seq), task, proxy, now)
+
+    async def done(self, item: ScheduledTask):
+        await self.limiter.release()
+        async with self._cond:
+            count = self.running.get(item.task_type, 0) - 1
+            if count > 0:
+                self.running[item.task_type] = count
+            else:
+                self.running.pop(item.task_type, None)
+            self._cond.notify_all()
+
+    async def notify(self):
+        """全局上限变化后唤醒等待中的 worker"""
+        async with self._cond:
+            self._cond.notify_all()
+
+    def stats(self) -> dict:
+        types = set(self.queues) | set(self.running) | set(self.dropped)
+        return {
+            task_type: {
+                "queued": len(self.queues.get(task_type, ())),
+                "running": self.running.get(task_type, 0),
+                "limit": self._type_limit(task_type),
+                "dropped": self.dropped.get(task_type, {EXPIRED: 0, INFEASIBLE: 0}),
+            }
+            for task_type in sorted(t for t in types if t)
+        }
+
+
+def create_scheduler(config: dict, limiter, max_queue: int, on_drop=None) -> DeadlineScheduler:
+    scheduler_cfg = (config or {}).get("scheduler") or {}
+    scheduler = DeadlineScheduler(
+        limiter,
+        type_limits=(config or {}).get("type_concurrency") or {},
+        type_timeouts=scheduler_cfg.get("type_timeouts") or {},
+        default_timeout=scheduler_cfg.get("default_timeout"),
+        max_queue=scheduler_cfg.get("max_queue") or max_queue,
+        on_drop=on_drop,
+    )
+    if scheduler.type_limits:
+        logger.info(emoji("TASK", f"按类型并发预算: {scheduler.type_limits}"))
+    return scheduler
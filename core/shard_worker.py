@@ -0,0 +1,104 @@
+"""
+分片子进程入口。
+
+本模块在子进程中最先被导入，顶层只依赖标准库：日志目录、分片号等环境变量
+必须在导入 common.logger / core.ws_client 之前设置好。
+"""
+import asyncio
+import copy
+import os
+
+STATUS_INTERVAL = 5
+
+
+def shard_env() -> tuple:
+    return int(os.getenv("WORKER_SHARD", "0")), int(os.getenv("WORKER_SHARDS", "1"))
+
+
+def shard_share(total: int) -> int:
+    """把整机预算平均分给各分片，余数分给编号靠前的分片，每个分片至少 1"""
+    shard, shards = shard_env()
+    if shards <= 1 or not total:
+        return total
+    return max(1, total // shards + (1 if shard < total % shards else 0))
+
+
+def apply_shard(config: dict) -> dict:
+    """按分片号改写配置：独立的 worker 名称、结果日志文件，整机预算按分片均分"""
+    shard, shards = shard_env()
+    if shards <= 1:
+        return config
+    config = copy.deepcopy(config)
+    worker_cfg = config.setdefault("worker", {})
+    worker_cfg["name"] = f"{worker_cfg.get('name', 'worker')}-{shard}"
+
+    journal_cfg = config.get("journal") or {}
+    if journal_cfg.get("path"):
+        root, ext = os.path.splitext(journal_cfg["path"])
+        journal_cfg["path"] = f"{root}-{shard}{ext}"
+
+    # 指标由主进程汇总后统一暴露
+    if config.get("metrics"):
+        config["metrics"]["port"] = None
+
+    if config.get("concurrency"):
+        config["concurrency"] = shard_share(config["concurrency"])
+    adaptive_cfg = config.get("adaptive_concurrency") or {}
+    if adaptive_cfg.get("max"):
+        adaptive_cfg["max"] = shard_share(adaptive_cfg["max"])
+    pool_cfg = config.get("browser_pool") or {}
+    if pool_cfg.get("max_browsers"):
+        pool_cfg["max_browsers"] = shard_share(pool_cfg["max_browsers"])
+    type_limits = config.get("type_concurrency") or {}
+    for task_type, limit in type_limits.items():
+        type_limits[task_type] = shard_share(limit)
+    return config
+
+
+async def _report(status_queue, parent_pid: int):
+    from core import ws_client
+    from common.metrics import metrics
+
+    shard, _ = shard_env()
+    while True:
+        # 主进程异常退出时子进程跟着退出，避免留下孤儿 worker
+        if os.getppid() != parent_pid:
+            ws_client.logger.warning(f"主进程已退出，分片 {shard} 停止")
+            os._exit(0)
+        try:
+            status_queue.put_nowait({
+                "shard": shard,
+                "pid": os.getpid(),
+                "status": ws_client.build_status(),
+                "metrics": metrics.snapshot(),
+            })
+        except Exception:
+            pass
+        await asyncio.sleep(STATUS_INTERVAL)
+
+
+async def _main(status_queue, parent_pid: int):
+    from core.ws_client import worker_main
+
+    reporter = asyncio.create_task(_report(status_queue, parent_pid))
+    try:
+        await worker_main()
+    finally:
+        reporter.cancel()
+
+
+def run(shard: int, shards: int, cpus: list, status_queue, parent_pid: int):
+    os.environ["WORKER_SHARD"] = str(shard)
+    os.environ["WORKER_SHARDS"] = str(shards)
+    os.environ["LOG_DIR"] = os.path.join(os.getenv("LOG_DIR", "./logs"), f"shard-{shard}")
+    if cpus:
+        import psutil
+        try:
+            # 浏览器子进程会继承这里的 CPU 亲和性
+            psutil.Process().cpu_affinity(cpus)
+        except (AttributeError, psutil.Error, OSError):
+            pass
+    try:
+        asyncio.run(_main(status_queue, parent_pid))
+    except KeyboardInterrupt:
+        pass
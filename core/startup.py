@@ -0,0 +1,85 @@
+import asyncio
+import os
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+import psutil
+
+from common.logger import get_logger, emoji
+
+logger = get_logger("startup")
+
+
+class StartupReport:
+    """记录启动各阶段耗时，注册前输出一份汇总"""
+
+    def __init__(self):
+        # 从进程创建开始计时，包含解释器启动和模块导入
+        self.process_started = psutil.Process(os.getpid()).create_time()
+        self.phases: dict = {"imports": round(time.time() - self.process_started, 3)}
+        self.warmup: dict = {}
+        self.ready_seconds: Optional[float] = None
+
+    def record(self, phase: str, seconds: float):
+        self.phases[phase] = round(seconds, 3)
+
+    @contextmanager
+    def phase(self, phase: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(phase, time.perf_counter() - started)
+
+    def ready(self):
+        self.ready_seconds = round(time.time() - self.process_started, 3)
+        phases = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in self.phases.items())
+        logger.info(emoji("STARTUP", f"启动完成，用时 {self.ready_seconds:.2f}s: {phases}"))
+        for task_type, result in self.warmup.items():
+            logger.info(emoji("STARTUP", f"  预热 {task_type}: {result}"))
+
+    def stats(self) -> dict:
+        return {"ready_seconds": self.ready_seconds, "phases": self.phases, "warmup": self.warmup}
+
+
+async def _warm_one(entry, config: dict, proxy, timeout: float) -> tuple:
+    started = time.perf_counter()
+    try:
+        await asyncio.wait_for(entry.warm_up(config, proxy), timeout)
+        return True, f"ok {time.perf_counter() - started:.2f}s"
+    except asyncio.TimeoutError:
+        return False, f"超时 {timeout}s"
+    except Exception as e:
+        return False, f"失败: {e}"
+
+
+async def warm_up_handlers(entries: list, config: dict, report: StartupReport) -> list:
+    """
+    并行执行各处理器的 warm_up 钩子（预先启动浏览器、解析出口 IP / 指纹）
+    返回可以注册的类型；drop_failed 为 true 时预热失败的类型不注册（默认关闭：
+    出口 IP 查询超时、首次启动过慢等临时失败不应让该类型在整个进程生命周期内下线）
+    """
+    startup_cfg = (config or {}).get("startup") or {}
+    task_types = [entry.task_type for entry in entries]
+    if not startup_cfg.get("warmup"):
+        return task_types
+    proxy = startup_cfg.get("warmup_proxy")
+    targets = [entry for entry in entries if entry.warm_up is not None]
+    if not proxy:
+        # 浏览器按 (代理, 启动参数) 复用，direct 预热的浏览器匹配不到带代理的任务，只占内存
+        for entry in targets:
+            report.warmup[entry.task_type] = "跳过: 未配置 warmup_proxy"
+        return task_types
+    results = await asyncio.gather(*(
+        _warm_one(entry, config, proxy, startup_cfg.get("warmup_timeout", 60)) for entry in targets
+    ))
+    failed = set()
+    for entry, (ok, detail) in zip(targets, results):
+        report.warmup[entry.task_type] = detail
+        if not ok:
+            failed.add(entry.task_type)
+            logger.warning(emoji("WARNING", f"处理器预热失败: {entry.task_type} {detail}"))
+    if failed and startup_cfg.get("drop_failed", False):
+        return [t for t in task_types if t not in failed]
+    return task_types
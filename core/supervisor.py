@@ -0,0 +1,179 @@
+import asyncio
+import multiprocessing
+import os
+import queue
+import time
+from typing import Optional
+
+import psutil
+
+from core import shard_worker
+from core.journal import Backoff
+from common.logger import get_logger, emoji
+from common.metrics import metrics, start_metrics_server
+
+logger = get_logger("supervisor")
+
+STABLE_SECONDS = 30
+
+
+def cpu_sets(shards: int) -> list:
+    """把当前进程可用的 CPU 按分片切成连续的若干组"""
+    try:
+        cpus = sorted(psutil.Process().cpu_affinity())
+    except (AttributeError, psutil.Error, OSError):
+        cpus = list(range(psutil.cpu_count(logical=True) or 1))
+    if shards > len(cpus):
+        return [[cpus[i % len(cpus)]] for i in range(shards)]
+    return [cpus[i * len(cpus) // shards:(i + 1) * len(cpus) // shards] for i in range(shards)]
+
+
+class Shard:
+    def __init__(self, index: int, cpus: list):
+        self.index = index
+        self.cpus = cpus
+        self.process: Optional[multiprocessing.Process] = None
+        self.started_at = 0.0
+        self.restart_at: Optional[float] = None
+        self.restarts = 0
+        self.backoff = Backoff(1, 60)
+        self.last_report: Optional[dict] = None
+
+
+class Supervisor:
+    """
+    多进程分片模式：
+    - 启动 N 个子进程，每个子进程独立事件循环、独立注册，分到整机并发的 1/N
+    - 子进程可绑定到不同的 CPU 组，浏览器进程随之继承
+    - 子进程异常退出后按退避重启
+    - 汇总各分片上报的状态和指标，由主进程统一暴露 /metrics
+    """
+
+    def __init__(self, config: dict, workers: int, pin_cpus: bool = True, status_interval: float = 30):
+        self.config = config
+        self.workers = max(1, workers)
+        self.status_interval = status_interval
+        self._ctx = multiprocessing.get_context("spawn")
+        self._status_queue = self._ctx.Queue()
+        sets = cpu_sets(self.workers) if pin_cpus else [[] for _ in range(self.workers)]
+        self.shards = [Shard(i, sets[i]) for i in range(self.workers)]
+
+    def _start(self, shard: Shard):
+        shard.process = self._ctx.Process(
+            target=shard_worker.run,
+            args=(shard.index, self.workers, shard.cpus, self._status_queue, os.getpid()),
+            name=f"shard-{shard.index}",
+        )
+        shard.process.start()
+        shard.started_at = time.monotonic()
+        shard.restart_at = None
+        cpus = f", CPU {shard.cpus}" if shard.cpus else ""
+        logger.info(emoji("STARTUP", f"启动分片 {shard.index} (pid {shard.process.pid}{cpus})"))
+
+    def _check(self, shard: Shard):
+        now = time.monotonic()
+        if shard.process is not None and shard.process.is_alive():
+            return
+        if shard.restart_at is None:
+            # 刚发现退出：稳定运行过一段时间才重置退避
+            if now - shard.started_at >= STABLE_SECONDS:
+                shard.backoff.reset()
+            delay = shard.backoff.next_delay()
+            shard.restart_at = now + delay
+            shard.last_report = None
+            logger.warning(emoji("ERROR", f"分片 {shard.index} 退出(exitcode={shard.process.exitcode})，{delay:.1f}s 后重启"))
+        elif now >= shard.restart_at:
+            shard.restarts += 1
+            self._start(shard)
+
+    def _drain_reports(self) -> bool:
+        changed = False
+        while True:
+            try:
+                report = self._status_queue.get_nowait()
+            except queue.Empty:
+                return changed
+            index = report.get("shard", -1)
+            if 0 <= index < len(self.shards):
+                self.shards[index].last_report = report
+                changed = True
+
+    def _merge_metrics(self):
+        metrics.reset()
+        for shard in self.shards:
+            if shard.last_report:
+                metrics.merge(shard.last_report["metrics"])
+
+    def status(self) -> dict:
+        """各分片状态汇总"""
+        alive = [s for s in self.shards if s.process is not None and s.process.is_alive()]
+        reports = [s.last_report["status"] for s in self.shards if s.last_report]
+        return {
+            "shards": self.workers,
+            "alive": len(alive),
+            "restarts": sum(s.restarts for s in self.shards),
+            "current_tasks": sum(r.get("current_tasks", 0) for r in reports),
+            "pending_tasks": sum(r.get("pending_tasks", 0) for r in reports),
+            "per_shard": {
+                s.index: {
+                    "pid": s.process.pid if s.process else None,
+                    "alive": s in alive,
+                    "restarts": s.restarts,
+                    "current_tasks": (s.last_report or {}).get("status", {}).get("current_tasks"),
+                }
+                for s in self.shards
+            },
+        }
+
+    async def run(self):
+        logger.info(emoji("STARTUP", f"分片模式: {self.workers} 个子进程"))
+        for shard in self.shards:
+            self._start(shard)
+        await start_metrics_server(self.config)
+        last_status = time.monotonic()
+        try:
+            while True:
+                await asyncio.sleep(1)
+                for shard in self.shards:
+                    self._check(shard)
+                if self._drain_reports():
+                    self._merge_metrics()
+                if time.monotonic() - last_status >= self.status_interval:
+                    last_status = time.monotonic()
+                    status = self.status()
+                    logger.info(emoji("TASK", (
+                        f"分片在线 {status['alive']}/{status['shards']}，执行 {status['pending_tasks']} 个，"
+                        f"总任务 {status['current_tasks']} 个，累计重启 {status['restarts']} 次"
+                    )))
+        finally:
+            self.stop()
+
+    def stop(self):
+        for shard in self.shards:
+            if shard.process is not None and shard.process.is_alive():
+                shard.process.terminate()
+        for shard in self.shards:
+            if shard.process is None:
+                continue
+            shard.process.join(timeout=10)
+            if shard.process.is_alive():
+                shard.process.kill()
+
+
+def supervisor_workers(config: dict) -> int:
+    """supervisor.workers：1 为单进程模式，0 表示按物理核心数"""
+    workers = ((config or {}).get("supervisor") or {}).get("workers", 1)
+    if workers == 0:
+        workers = psutil.cpu_count(logical=False) or 1
+    return workers or 1
+
+
+async def run_supervisor(config: dict):
+    supervisor_cfg = (config or {}).get("supervisor") or {}
+    supervisor = Supervisor(
+        config,
+        workers=supervisor_workers(config),
+        pin_cpus=supervisor_cfg.get("pin_cpus", True),
+        status_interval=supervisor_cfg.get("status_interval", 30),
+    )
+    await supervisor.run()
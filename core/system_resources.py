@@ -13,4 +13,45 @@ def auto_concurrency():
     max_concurrency = physical_cpu * 2
 
     # min(逻辑核, 内存估算, 最大限制)，最少为 1
-    return max(1, min(logical_cpu, mem_based, max_concurrency))
\ No newline at end of file
+    return max(1, min(logical_cpu, mem_based, max_concurrency))
+
+
+def resource_ceiling(browser_mb: int = 512, reserve_mb: int = 1024):
+    """自适应并发的默认上限：比 auto_concurrency 宽松，实际并发由反馈控制在上限内调整"""
+    logical_cpu = psutil.cpu_count(logical=True) or 1
+    total_mb = psutil.virtual_memory().total / (1024 ** 2)
+
+    # 每个并发按一个浏览器 browser_mb 估算，预留 reserve_mb 给系统
+    mem_based = int((total_mb - reserve_mb) / max(1, browser_mb))
+
+    return max(1, min(logical_cpu * 2, mem_based))
+
+
+BROWSER_PROCESS_NAMES = ("firefox", "camoufox")
+
+
+def browser_processes():
+    """当前进程下的所有浏览器子进程（Camoufox / Firefox）"""
+    procs = []
+    try:
+        children = psutil.Process(os.getpid()).children(recursive=True)
+    except psutil.Error:
+        return procs
+    for proc in children:
+        try:
+            name = proc.name().lower()
+        except psutil.Error:
+            continue
+        if any(n in name for n in BROWSER_PROCESS_NAMES):
+            procs.append(proc)
+    return procs
+
+
+def browser_rss_mb():
+    total = 0
+    for proc in browser_processes():
+        try:
+            total += proc.memory_info().rss
+        except psutil.Error:
+            continue
+    return total / (1024 ** 2)
@@ -0,0 +1,210 @@
+import asyncio
+import itertools
+import math
+import time
+from collections import deque
+from typing import Awaitable, Callable, Optional
+
+from common.logger import get_logger, emoji
+
+logger = get_logger("token_pool")
+
+
+def task_key(task: dict) -> tuple:
+    """(类型, websiteURL, websiteKey, action) 相同的任务可以共用预先求解的 token"""
+    return (
+        task.get("type"),
+        task.get("websiteURL"),
+        task.get("websiteKey"),
+        (task.get("metadata") or {}).get("action"),
+    )
+
+
+class PooledToken:
+    __slots__ = ("result", "solved_at")
+
+    def __init__(self, result: dict, solved_at: float):
+        self.result = result
+        self.solved_at = solved_at
+
+
+class KeyState:
+    def __init__(self):
+        self.tokens: deque = deque()
+        self.arrivals: deque = deque()
+        self.inflight = 0
+
+
+class TokenPool:
+    """
+    热点 sitekey 的 token 预求解池：
+    - 配置的热点 key，或近期到达次数超过阈值的 key 会被预先求解
+    - 只使用空闲执行位（has_capacity），不与正常任务抢资源
+    - 目标库存按观测到的到达率计算：rate * refill_horizon，且不超过 max_per_key
+    - token 超过 max_age 不再使用，记为浪费
+    """
+
+    def __init__(self, solve: Callable[[dict], Awaitable[Optional[dict]]], has_capacity: Callable[[], bool],
+                 task_types: Optional[list] = None, hot_keys: Optional[list] = None, max_age: float = 240,
+                 window: float = 300, hot_threshold: int = 5, refill_horizon: float = 30, max_per_key: int = 5,
+                 max_inflight: int = 2, interval: float = 1.0):
+        self.solve = solve
+        self.has_capacity = has_capacity
+        self.task_types = set(task_types or ["AntiTurnstileTaskProxyLess"])
+        default_type = sorted(self.task_types)[0]
+        self.hot_keys = {
+            (k.get("type", default_type), k.get("websiteURL"), k.get("websiteKey"), k.get("action"))
+            for k in (hot_keys or [])
+        }
+        self.max_age = max_age
+        self.window = window
+        self.hot_threshold = hot_threshold
+        self.refill_horizon = refill_horizon
+        self.max_per_key = max_per_key
+        self.max_inflight = max(1, max_inflight)
+        self.interval = interval
+
+        self.keys: dict = {key: KeyState() for key in self.hot_keys}
+        self.inflight = 0
+        self._ids = itertools.count()
+        self._tasks: set = set()
+
+        self.hits = 0
+        self.misses = 0
+        self.wasted = 0
+        self.presolved = 0
+        self.presolve_failures = 0
+
+    def _state(self, key: tuple) -> KeyState:
+        state = self.keys.get(key)
+        if state is None:
+            state = self.keys[key] = KeyState()
+        return state
+
+    def _trim(self, state: KeyState, now: float):
+        while state.arrivals and now - state.arrivals[0] > self.window:
+            state.arrivals.popleft()
+        while state.tokens and now - state.tokens[0].solved_at >= self.max_age:
+            state.tokens.popleft()
+            self.wasted += 1
+
+    def rate(self, key: tuple) -> float:
+        """近期到达率（次/秒）"""
+        state = self.keys.get(key)
+        return len(state.arrivals) / self.window if state else 0.0
+
+    def hot(self, key: tuple) -> bool:
+        state = self.keys.get(key)
+        return key in self.hot_keys or (state is not None and len(state.arrivals) >= self.hot_threshold)
+
+    def target(self, key: tuple) -> int:
+        if not self.hot(key):
+            return 0
+        return min(self.max_per_key, max(1, math.ceil(self.rate(key) * self.refill_horizon)))
+
+    # ---------- 取用 ----------
+
+    def take(self, task: dict) -> Optional[dict]:
+        """有新鲜 token 时直接返回求解结果，同时记录到达用于估算热度"""
+        if task.get("type") not in self.task_types:
+            return None
+        key = task_key(task)
+        now = time.monotonic()
+        state = self._state(key)
+        state.arrivals.append(now)
+        self._trim(state, now)
+        if state.tokens:
+            # 先用最旧的，减少过期浪费
+            token = state.tokens.popleft()
+            self.hits += 1
+            return dict(token.result, pooled=True, token_age=round(now - token.solved_at, 1))
+        self.misses += 1
+        return None
+
+    # ---------- 预求解 ----------
+
+    async def _presolve(self, key: tuple):
+        task_type, url, sitekey, action = key
+        task = {
+            "type": task_type,
+            "taskId": f"presolve-{next(self._ids)}",
+            "websiteURL": url,
+            "websiteKey": sitekey,
+            "metadata": {"action": action} if action else {},
+        }
+        state = self._state(key)
+        try:
+            result = await self.solve(task)
+        except Exception as e:
+            result = None
+            logger.debug("预求解异常: %s", e)
+        finally:
+            state.inflight -= 1
+            self.inflight -= 1
+        if isinstance(result, dict) and result.get("status") == "success" and result.get("token"):
+            state.tokens.append(PooledToken(result, time.monotonic()))
+            self.presolved += 1
+        else:
+            self.presolve_failures += 1
+
+    def _refill(self):
+        now = time.monotonic()
+        deficits = []
+        for key, state in list(self.keys.items()):
+            self._trim(state, now)
+            if not state.arrivals and not state.tokens and not state.inflight and key not in self.hot_keys:
+                # 长时间没有到达的 key 不再跟踪；仍有预求解在进行时保留，结果要回到同一个 KeyState
+                del self.keys[key]
+                continue
+            deficit = self.target(key) - len(state.tokens) - state.inflight
+            if deficit > 0:
+                deficits.append((deficit, key))
+        # 缺口最大的 key 优先补充
+        for deficit, key in sorted(deficits, key=lambda d: d[0], reverse=True):
+            for _ in range(deficit):
+                if self.inflight >= self.max_inflight or not self.has_capacity():
+                    return
+                state = self._state(key)
+                state.inflight += 1
+                self.inflight += 1
+                task = asyncio.create_task(self._presolve(key))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+
+    async def run(self):
+        logger.info(emoji("TASK", f"token 预求解已开启: {sorted(self.task_types)}"))
+        while True:
+            self._refill()
+            await asyncio.sleep(self.interval)
+
+    def stats(self) -> dict:
+        requests = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / requests, 3) if requests else 0.0,
+            "presolved": self.presolved,
+            "presolve_failures": self.presolve_failures,
+            "wasted": self.wasted,
+            "inflight": self.inflight,
+            "hot_keys": sum(1 for key in self.keys if self.hot(key)),
+            "pooled": sum(len(s.tokens) for s in self.keys.values()),
+        }
+
+
+def create_token_pool(config: dict, solve, has_capacity) -> Optional[TokenPool]:
+    pool_cfg = (config or {}).get("token_pool") or {}
+    if not pool_cfg.get("enabled"):
+        return None
+    return TokenPool(
+        solve,
+        has_capacity,
+        task_types=pool_cfg.get("task_types"),
+        hot_keys=pool_cfg.get("hot_keys"),
+        max_age=pool_cfg.get("max_age", 240),
+        window=pool_cfg.get("window", 300),
+        hot_threshold=pool_cfg.get("hot_threshold", 5),
+        refill_horizon=pool_cfg.get("refill_horizon", 30),
+        max_per_key=pool_cfg.get("max_per_key", 5),
+        max_inflight=pool_cfg.get("max_inflight", 2),
+    )
@@ -0,0 +1,197 @@
+import asyncio
+import gc
+import os
+import threading
+import time
+from typing import Optional
+
+import psutil
+
+from core.system_resources import browser_processes
+from common.logger import get_logger, emoji
+from framework.browser_pool import add_launch_listener
+
+logger = get_logger("watchdog")
+
+
+def _cmdline(proc: psutil.Process) -> str:
+    try:
+        return " ".join(proc.cmdline())[:300] or proc.name()
+    except psutil.Error:
+        return "?"
+
+
+class ResourceWatchdog:
+    """
+    后台资源巡检，代替每个任务结束后的 gc / 堆遍历 / fd 列举：
+    - 定期采样本进程 RSS、fd 数量，以及整个浏览器进程树的 RSS
+    - 只清理本进程启动过（启动后和每次采样时记录在案）、之后脱离了进程树的 Firefox/Camoufox 进程，
+      连续两次采样仍存在时才清理；其他进程即使看起来像孤儿也不动
+    - fd 数量相对基线持续增长时视为泄漏
+    - 可选（gc_enabled，默认关闭）：RSS 或 fd 超过阈值时触发 gc.collect()，两次之间至少间隔 gc_min_interval；
+      完整 gc 会暂停事件循环，只在确认有循环引用泄漏时开启
+    """
+
+    def __init__(self, interval: float = 15, gc_enabled: bool = False, gc_rss_mb: Optional[int] = 1024,
+                 gc_min_interval: float = 300, fd_leak_threshold: Optional[int] = 200, kill_orphans: bool = True):
+        self.interval = interval
+        self.gc_enabled = gc_enabled
+        self.gc_rss_mb = gc_rss_mb
+        self.gc_min_interval = gc_min_interval
+        self.fd_leak_threshold = fd_leak_threshold
+        self.kill_orphans = kill_orphans
+
+        self._process = psutil.Process(os.getpid())
+        # 曾出现在本进程树中的浏览器进程 pid -> create_time，只有它们可能被当作孤儿清理
+        self._known_browsers: dict = {}
+        # track_browsers（浏览器启动回调）和 sample 在不同线程中更新 _known_browsers
+        self._lock = threading.Lock()
+        self._suspects: set = set()
+        self._fd_baseline: Optional[int] = None
+        self._last_gc: Optional[float] = None
+
+        self.last_sample: dict = {}
+        self.gc_runs = 0
+        self.orphans_killed = 0
+
+    # ---------- 采样 ----------
+
+    def _num_fds(self) -> Optional[int]:
+        try:
+            return self._process.num_fds()
+        except (AttributeError, psutil.Error):
+            return None
+
+    def track_browsers(self) -> dict:
+        """在线程中执行：记录当前进程树下的浏览器进程，返回 pid -> create_time"""
+        tree = {}
+        for proc in browser_processes():
+            try:
+                tree[proc.pid] = proc.create_time()
+            except psutil.Error:
+                continue
+        with self._lock:
+            self._known_browsers.update(tree)
+        return tree
+
+    def _find_orphans(self, tree_pids: set) -> list:
+        orphans = []
+        with self._lock:
+            known = list(self._known_browsers.items())
+        for pid, create_time in known:
+            try:
+                proc = psutil.Process(pid)
+                # pid 已被其他进程复用
+                if proc.create_time() != create_time or proc.status() == psutil.STATUS_ZOMBIE:
+                    continue
+                # 浏览器总是由 Playwright driver 启动：仍在进程树中且父进程不是本进程时正常运行；
+                # 父进程是本进程说明 driver 已退出、浏览器被收养（容器中本进程为 PID 1）
+                if pid in tree_pids and proc.ppid() != self._process.pid:
+                    continue
+            except psutil.Error:
+                continue
+            orphans.append(proc)
+        return orphans
+
+    def sample(self) -> dict:
+        """在线程中执行：遍历进程树和进程表"""
+        browser_rss = 0
+        tree = {}
+        for proc in browser_processes():
+            try:
+                browser_rss += proc.memory_info().rss
+                tree[proc.pid] = proc.create_time()
+            except psutil.Error:
+                continue
+        with self._lock:
+            self._known_browsers.update(tree)
+        tree_pids = set(tree)
+
+        orphans = self._find_orphans(tree_pids) if self.kill_orphans else []
+        killed = set()
+        for proc in orphans:
+            # 连续两次采样都是孤儿才清理，避免误杀正在退出的进程
+            if proc.pid not in self._suspects:
+                continue
+            cmdline = _cmdline(proc)
+            try:
+                proc.kill()
+            except psutil.Error:
+                continue
+            killed.add(proc.pid)
+            logger.warning(emoji("WARNING", f"清理孤儿浏览器进程: pid={proc.pid} {cmdline}"))
+        self._suspects = {p.pid for p in orphans} - killed
+        self.orphans_killed += len(killed)
+        # 已退出或已清理的浏览器不再跟踪
+        with self._lock:
+            self._known_browsers = {pid: ct for pid, ct in self._known_browsers.items()
+                                    if pid not in killed and psutil.pid_exists(pid)}
+
+        fds = self._num_fds()
+        return {
+            "rss_mb": round(self._process.memory_info().rss / (1024 ** 2), 1),
+            "fds": fds,
+            "browser_processes": len(tree_pids),
+            "browser_rss_mb": round(browser_rss / (1024 ** 2), 1),
+            "orphans": len(self._suspects),
+            "timestamp": time.time(),
+        }
+
+    def fd_leak(self) -> Optional[int]:
+        """fd 数量比基线多出的部分，超过阈值时返回"""
+        fds = self.last_sample.get("fds")
+        if fds is None or self._fd_baseline is None or not self.fd_leak_threshold:
+            return None
+        growth = fds - self._fd_baseline
+        return growth if growth > self.fd_leak_threshold else None
+
+    def _maybe_collect(self, sample: dict):
+        if not self.gc_enabled:
+            return
+        reason = None
+        if self.gc_rss_mb and sample["rss_mb"] > self.gc_rss_mb:
+            reason = f"RSS {sample['rss_mb']}MB"
+        elif self.fd_leak() is not None:
+            # 未关闭的 socket / 文件对象往往要等 gc 才会释放
+            reason = f"fd 增长 {self.fd_leak()}"
+        if not reason or (self._last_gc is not None and time.monotonic() - self._last_gc < self.gc_min_interval):
+            return
+        self._last_gc = time.monotonic()
+        collected = gc.collect()
+        self.gc_runs += 1
+        logger.info(emoji("INFO", f"触发 gc({reason})，回收 {collected} 个对象"))
+
+    async def run(self):
+        while True:
+            try:
+                sample = await asyncio.to_thread(self.sample)
+            except Exception as e:
+                logger.debug("资源采样失败: %s", e)
+            else:
+                if sample["fds"] is not None:
+                    self._fd_baseline = sample["fds"] if self._fd_baseline is None else min(self._fd_baseline, sample["fds"])
+                self.last_sample = sample
+                leak = self.fd_leak()
+                if leak is not None:
+                    logger.warning(emoji("WARNING", f"疑似 fd 泄漏: 当前 {sample['fds']}，比基线多 {leak}"))
+                self._maybe_collect(sample)
+            await asyncio.sleep(self.interval)
+
+    def stats(self) -> dict:
+        return dict(self.last_sample, gc_runs=self.gc_runs, orphans_killed=self.orphans_killed)
+
+
+def create_watchdog(config: dict) -> ResourceWatchdog:
+    watchdog_cfg = (config or {}).get("watchdog") or {}
+    watchdog = ResourceWatchdog(
+        interval=watchdog_cfg.get("interval", 15),
+        gc_enabled=watchdog_cfg.get("gc_enabled", False),
+        gc_rss_mb=watchdog_cfg.get("gc_rss_mb", 1024),
+        gc_min_interval=watchdog_cfg.get("gc_min_interval", 300),
+        fd_leak_threshold=watchdog_cfg.get("fd_leak_threshold", 200),
+        kill_orphans=watchdog_cfg.get("kill_orphans", True),
+    )
+    if watchdog.kill_orphans:
+        # 浏览器启动后立即记录，不等下一次采样（两次采样之间启动又脱离的浏览器也能识别）
+        add_launch_listener(watchdog.track_browsers)
+    return watchdog
@@ -1,153 +1,429 @@
 import asyncio
-import os
 import ssl
-import sys
+import time
 import websockets
-import json
-import yaml
-import importlib
-import traceback
 from framework.solver_core import get_solver_config
+from framework.batch_solver import batch_stats
+from framework.browser_pool import pool_stats
+from framework.classification_cache import classification_stats
+from framework.launch_profile import profile_stats
+from framework.resource_cache import traffic_stats
 from core.system_resources import auto_concurrency
-from common.logger import get_logger, emoji
+from core.handler_registry import HandlerRegistry
+from core.executor import create_engine
+from core.concurrency import ConcurrencyLimiter, create_controller
+from core.outbound import OutboundWriter, available_codecs, decode_message
+from core.journal import Backoff, create_journal
+from core.flow_control import create_credit_manager
+from core.scheduler import create_scheduler
+from core.shard_worker import apply_shard, shard_share
+from core.watchdog import create_watchdog
+from core.token_pool import create_token_pool
+from core.startup import StartupReport, warm_up_handlers
+from core.cancellation import CANCELLED, TIMEOUT, TIMEOUT_ERROR_CODE, TaskInterrupted, create_cancellation
+from core.proxy_health import PROXY_ERROR_CODE, PROXY_ERROR_ID, ProxyUnavailable, create_proxy_health
+from common.config import load_config
+from common.logger import get_logger, emoji, configure_logging, logging_stats, set_log_context, reset_log_context
+from common.metrics import metrics, proxy_label, span, start_trace, finish_trace, start_metrics_server
 
 logger = get_logger("ws_client")
+startup_report = StartupReport()
 
-with open("config/config.yaml", "r") as f:
-    config = yaml.safe_load(f)
+# 与 run_client / solver_core 共用同一份解析结果
+config = load_config()
+# 分片子进程：按分片号改写名称、日志路径和各项预算
+config = apply_shard(config)
+configure_logging(config)
 
-MAX_CONCURRENCY = config.get("concurrency") or auto_concurrency()
-task_queue = asyncio.Queue(maxsize=MAX_CONCURRENCY * 2)
-semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
+MAX_CONCURRENCY = config.get("concurrency") or shard_share(auto_concurrency())
+limiter = ConcurrencyLimiter(MAX_CONCURRENCY)
+watchdog = create_watchdog(config)
+controller = create_controller(config, limiter, watchdog)
+# 开启自适应并发时按上限启动 worker，实际并发由 limiter 控制
+WORKER_COUNT = controller.ceiling if controller else MAX_CONCURRENCY
 
 logger.info(emoji("TASK", f"最大允许线程数:{MAX_CONCURRENCY}"))
 
-def safe_import_handler(module_name: str, filename: str):
-    try:
-        return importlib.import_module(f"task_handlers.{module_name}")
-    except Exception:
-        pass
+outbound_cfg = config.get("outbound") or {}
+reconnect_cfg = config.get("reconnect") or {}
+STABLE_CONNECTION_SECONDS = 30
 
-    try:
-        path = os.path.join("task_handlers", filename)
-        if not os.path.exists(path):
-            logger.error(f"❌ 文件不存在: {path}")
-            return None
-        spec = importlib.util.spec_from_file_location(module_name, path)
-        if not spec:
-            logger.error("❌ 创建模块 spec 失败")
-            return None
-        module = importlib.util.module_from_spec(spec)
-        sys.modules[module_name] = module
-        spec.loader.exec_module(module)
-        return module
-    except Exception as e:
-        logger.error(f"❌ 模块加载失败: {e}")
-        logger.debug(traceback.format_exc())
-        return None
+journal = create_journal(config)
+credits = create_credit_manager(config, limiter)
+workers = []
+background_tasks = []
+active_task_ids = set()
+
+def drop_task(item, reason: str):
+    """截止时间已过或来不及完成的任务直接上报失败"""
+    task = item.task
+    journal.add({
+        "type": "task_result",
+        "taskId": task.get("taskId"),
+        "errorId": -1,
+        "result": {"error": "任务已超过截止时间" if reason == "expired" else "剩余时间不足以完成任务",
+                   "reason": reason}
+    }, (task.get("type"), proxy_label(item.proxy)))
+    metrics.count_task(task.get("type"), reason)
+    active_task_ids.discard(task.get("taskId"))
+    credits.release(task.get("type"))
+
+scheduler = create_scheduler(config, limiter, max_queue=WORKER_COUNT * 2, on_drop=drop_task)
+
+def release_cancelled(item):
+    """服务端取消了仍在排队的任务：不上报结果，只释放额度"""
+    task = item.task
+    metrics.count_task(task.get("type"), "cancelled")
+    active_task_ids.discard(task.get("taskId"))
+    credits.release(task.get("type"))
+
+cancellation = create_cancellation(config, scheduler, on_dequeue=release_cancelled)
+token_pool_cfg = config.get("token_pool") or {}
+
+proxy_health = create_proxy_health(config)
+
+registry = HandlerRegistry()
+engine = create_engine(config)
 
 async def run_task(task, proxy):
     module_name = task["type"]
-    filename = f"{module_name}.py"
-    handler = safe_import_handler(module_name, filename)
+    with span("handler_lookup"):
+        handler = registry.get(module_name)
     if not handler:
         raise RuntimeError(f"无法加载 handler: {module_name}")
 
     try:
-        if asyncio.iscoroutinefunction(handler.run):
+        if handler.run_is_coroutine:
             result = await handler.run(task, proxy,config)
             while asyncio.iscoroutine(result):
                 result = await result
             return result
         else:
-            loop = asyncio.get_event_loop()
-            return await loop.run_in_executor(None, handler.run, task)
+            # 同步处理器交给执行层（线程池 / 进程池）
+            return await engine.run(handler, task)
     finally:
         # 自动清理钩子
-        if hasattr(handler, "cleanup") and asyncio.iscoroutinefunction(handler.cleanup):
+        if handler.cleanup_is_coroutine:
             try:
                 await handler.cleanup()
             except Exception as e:
                 logger.warning(f"⚠️ cleanup 执行失败: {e}")
 
-async def task_worker(ws):
+async def execute_task(task, proxy):
+    if proxy_health is not None:
+        # 启动浏览器前先确认代理可用，坏代理直接失败
+        with span("proxy_check"):
+            await proxy_health.ensure(proxy, task.get("type"))
+    return await run_task(task, proxy)
+
+async def task_worker():
     while True:
-        task, proxy = await task_queue.get()
-        async with semaphore:
-            try:
-                result = await run_task(task, proxy)
-                await ws.send(json.dumps({
-                    "type": "task_result",
-                    "taskId": task["taskId"],
-                    "errorId": 0,
-                    "result": result
-                }))
-            except Exception as e:
-                logger.error(f"❌ 任务执行异常: {e}")
-                logger.debug(traceback.format_exc())
-                await ws.send(json.dumps({
+        # 调度器按类型预算和截止时间出队，出队时已占用执行位
+        item = await scheduler.get()
+        task, proxy = item.task, item.proxy
+        trace = start_trace(task.get("type"), proxy)
+        log_token = set_log_context(task.get("taskId"), task.get("type"), proxy)
+        # 排队等待：接收到排到队首；执行位等待：排到队首后等全局执行位
+        dequeued = time.monotonic()
+        blocked = item.blocked_at or dequeued
+        trace.record("queue_wait", blocked - item.received_at)
+        trace.record("semaphore_wait", dequeued - blocked)
+        # 结果的编码/发送耗时在出站通道中按同样的类型/代理标签记录
+        labels = (trace.task_type, trace.proxy)
+        status = "error"
+        started = time.monotonic()
+        try:
+            # 处理器在独立协程中执行，可被服务端取消或按硬超时中断
+            result = await cancellation.execute(item, execute_task(task, proxy))
+            failed = isinstance(result, dict) and result.get("status") == "failure"
+            status = "failure" if failed else "success"
+            if controller:
+                controller.record(time.monotonic() - started, not failed)
+            if not failed:
+                scheduler.record(task["type"], time.monotonic() - started)
+            journal.add({
+                "type": "task_result",
+                "taskId": task["taskId"],
+                "errorId": 0,
+                "result": result
+            }, labels)
+        except TaskInterrupted as e:
+            status = e.reason
+            # 超时计入自适应并发的失败率，服务端取消不计入
+            if controller and e.reason != CANCELLED:
+                controller.record(time.monotonic() - started, False)
+            if e.reason != CANCELLED:
+                journal.add({
                     "type": "task_result",
                     "taskId": task.get("taskId"),
                     "errorId": -1,
-                    "result": {"error": str(e)}
-                }))
-        task_queue.task_done()
+                    "errorCode": TIMEOUT_ERROR_CODE,
+                    "result": {"error": str(e), "status": "failure"}
+                }, labels)
+        except ProxyUnavailable as e:
+            # 代理问题不计入自适应并发的失败率
+            status = "proxy_error"
+            journal.add({
+                "type": "task_result",
+                "taskId": task.get("taskId"),
+                "errorId": PROXY_ERROR_ID,
+                "errorCode": PROXY_ERROR_CODE,
+                "result": {"error": str(e), "status": "failure"}
+            }, labels)
+        except Exception as e:
+            if controller:
+                controller.record(time.monotonic() - started, False)
+            logger.error(f"❌ 任务执行异常: {e}")
+            logger.debug("任务异常堆栈", exc_info=True)
+            journal.add({
+                "type": "task_result",
+                "taskId": task.get("taskId"),
+                "errorId": -1,
+                "result": {"error": str(e)}
+            }, labels)
+        finally:
+            finish_trace(status)
+            reset_log_context(log_token)
+            active_task_ids.discard(task.get("taskId"))
+            credits.release(task.get("type"))
+            await scheduler.done(item)
+            if status in (CANCELLED, TIMEOUT):
+                # 执行位已释放，立即上报状态
+                cancellation.notify()
+
+def presolve_capacity() -> bool:
+    """只在没有排队任务、且留出 reserve_slots 个执行位时预求解"""
+    reserve = token_pool_cfg.get("reserve_slots", 1)
+    return scheduler.queued() == 0 and limiter.in_use + reserve < limiter.limit
+
+async def presolve(task):
+    # 与正常任务一样占用类型执行位、受硬超时约束，卡住的预求解不会一直占着执行位
+    item = scheduler.try_start(task, None)
+    if item is None:
+        return None
+    try:
+        return await cancellation.execute(item, run_task(task, None))
+    except TaskInterrupted as e:
+        logger.debug("预求解被中断: %s", e)
+        return None
+    finally:
+        await scheduler.done(item)
+
+token_pool = create_token_pool(config, presolve, presolve_capacity)
 
-async def heartbeat(ws):
+def ensure_workers():
+    """任务协程与连接解耦：只启动一次，断线重连期间继续执行"""
+    if not workers:
+        for _ in range(WORKER_COUNT):
+            workers.append(asyncio.create_task(task_worker()))
+
+def build_status() -> dict:
+    running_tasks = limiter.in_use
+    waiting_tasks = scheduler.queued()
+    status = {
+        "type": "status_update",
+        "current_tasks": running_tasks + waiting_tasks,
+        "pending_tasks": running_tasks
+    }
+    browser_pool = pool_stats()
+    if browser_pool is not None:
+        status["browser_pool"] = browser_pool
+    launch_profiles = profile_stats()
+    if launch_profiles is not None:
+        status["launch_profiles"] = launch_profiles
+    classification = classification_stats()
+    if classification is not None:
+        status["classification_cache"] = classification
+    traffic = traffic_stats()
+    if traffic is not None:
+        status["traffic"] = traffic
+    batches = batch_stats()
+    if batches is not None:
+        status["batch"] = batches
+    status["metrics"] = metrics.summary()
+    status["journal"] = journal.stats()
+    status["flow_control"] = credits.stats()
+    status["scheduler"] = scheduler.stats()
+    status["resources"] = watchdog.stats()
+    status["logging"] = logging_stats()
+    status["startup"] = startup_report.stats()
+    status["cancellation"] = cancellation.stats()
+    if proxy_health is not None:
+        status["proxy_health"] = proxy_health.stats()
+    if token_pool is not None:
+        status["token_pool"] = token_pool.stats()
+    return status
+
+async def heartbeat(outbound: OutboundWriter):
     while True:
-        running_tasks = MAX_CONCURRENCY - semaphore._value
-        waiting_tasks = task_queue.qsize()
-        await ws.send(json.dumps({
-            "type": "status_update",
-            "current_tasks": running_tasks + waiting_tasks,
-            "pending_tasks": running_tasks
-        }))
-        await asyncio.sleep(10)
-
-async def receiver(ws):
+        status = build_status()
+        status["outbound"] = outbound.stats()
+        await outbound.send(status)
+        # 任务被取消/超时释放执行位时提前发送
+        await cancellation.wait_freed(10)
+
+async def announce_concurrency(outbound: OutboundWriter, limit: int):
+    logger.info(emoji("TASK", f"最大允许线程数调整为:{limit}"))
+    await outbound.send({
+        "type": "max_concurrency",
+        "max_concurrency": limit
+    })
+    credits.notify()
+    await scheduler.notify()
+
+async def receiver(ws, outbound: OutboundWriter):
     while True:
         msg = await ws.recv()
-        data = json.loads(msg)
+        data = decode_message(msg)
+        if data.get("type") == "register_ack":
+            outbound.configure(codec=data.get("codec"), batch_results=data.get("batch_results"))
+            continue
+        if data.get("type") == "task_cancel":
+            task_id = data.get("taskId")
+            state = cancellation.cancel(task_id)
+            await outbound.send({"type": "task_cancelled", "taskId": task_id, "state": state})
+            continue
         task = data.get("task")
+        if not task:
+            logger.debug("忽略未知消息: %s", data.get("type"))
+            continue
+        problem = scheduler.validate(task)
+        if problem:
+            # 在占用额度、记录 taskId 之前拒绝格式错误的任务
+            task_id = task.get("taskId") if isinstance(task, dict) else None
+            logger.warning(emoji("TASK", f"拒绝无效任务: {problem} - {task_id}"))
+            await outbound.send({"type": "task_rejected", "taskId": task_id, "reason": "invalid_task", "error": problem})
+            continue
         proxy = data.get("proxy")
-        logger.info(emoji("GETTASK", f"接收到任务: {task['type']} - {task['taskId']}"))
-        await task_queue.put((task, proxy))
+        task_id = task.get("taskId")
+        # 重连后服务端可能重复推送仍在执行或已完成的任务
+        if task_id in active_task_ids or journal.seen(task_id):
+            logger.info(emoji("TASK", f"忽略重复任务: {task_id}"))
+            continue
+        pooled = token_pool.take(task) if token_pool is not None else None
+        if pooled is not None:
+            # 预求解池中有新鲜 token，直接返回，不占用额度和执行位
+            logger.info(emoji("GETTASK", f"预求解命中: {task['type']} - {task_id}"))
+            metrics.count_task(task["type"], "pool_hit")
+            journal.add({
+                "type": "task_result",
+                "taskId": task_id,
+                "errorId": 0,
+                "result": pooled
+            })
+            continue
+        if not credits.try_acquire(task["type"]):
+            # 超出授予的额度，直接退回给服务端重新分配
+            logger.info(emoji("TASK", f"额度不足，退回任务: {task['type']} - {task_id}"))
+            await outbound.send({
+                "type": "task_rejected",
+                "taskId": task_id,
+                "reason": "no_credit",
+                "credits": credits.credits()
+            })
+            continue
+        logger.info(emoji("GETTASK", f"接收到任务: {task['type']} - {task_id}"))
+        active_task_ids.add(task_id)
+        try:
+            await scheduler.submit(task, proxy, time.monotonic())
+        except Exception as e:
+            # 入队失败时归还额度，不中断接收循环
+            logger.error(emoji("ERROR", f"任务入队失败: {task_id}: {e}"))
+            active_task_ids.discard(task_id)
+            credits.release(task["type"])
+            journal.add({
+                "type": "task_result",
+                "taskId": task_id,
+                "errorId": -1,
+                "result": {"error": f"任务入队失败: {e}"}
+            })
+
+async def run_session(ws, task_types, uri: str = ""):
+    """在已建立的连接上注册并运行收发/任务协程，连接断开时抛出异常"""
+    tasks = []
+    outbound = OutboundWriter(
+        ws,
+        batch_window=outbound_cfg.get("batch_window_ms", 5) / 1000,
+        max_batch=outbound_cfg.get("max_batch", 50),
+        on_sent=journal.mark_sent,
+    )
+    ensure_workers()
+    credits.set_task_types(task_types)
+    try:
+        tasks.append(asyncio.create_task(outbound.run()))
+        await outbound.send({
+            "type": "register",
+            "task_types": task_types,
+            "max_concurrency": limiter.limit,
+            # 服务端可在 register_ack 中选择编码并开启结果合并
+            "capabilities": {
+                "codecs": [c for c in outbound_cfg.get("codecs", ["json"]) if c in available_codecs()],
+                "batch_results": True,
+                "credits": credits.enabled
+            }
+        })
+        logger.info(emoji("SUCCESS", f"已注册: {uri}"))
+        if startup_report.ready_seconds is None:
+            startup_report.ready()
+
+        tasks.append(asyncio.create_task(heartbeat(outbound)))
+        tasks.append(asyncio.create_task(receiver(ws, outbound)))
+        # 重放断线期间积压的结果，然后持续转发新结果
+        tasks.append(asyncio.create_task(journal.pump(outbound)))
+        tasks.append(asyncio.create_task(credits.run(outbound)))
+        if controller:
+            tasks.append(asyncio.create_task(controller.run(lambda limit: announce_concurrency(outbound, limit))))
+
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
 
 async def worker_main():
     uri = config.get("worker").get("wss_url") + config.get("worker").get("name")
+    # 启动时预加载处理器，加载失败的类型不会注册到服务端
+    # 各处理器在线程中并行导入，然后并行预热进程池和浏览器
+    with startup_report.phase("handlers"):
+        task_types = await registry.preload_parallel(get_solver_config().get("solver_type"))
+    entries = [registry.get(t) for t in task_types]
+    with startup_report.phase("warmup"):
+        _, task_types = await asyncio.gather(
+            engine.warm_up(entries), warm_up_handlers(entries, config, startup_report)
+        )
+    with startup_report.phase("metrics_server"):
+        await start_metrics_server(config)
+    # 后台资源巡检，与连接无关，只启动一次
+    background_tasks.append(asyncio.create_task(watchdog.run()))
+    if token_pool is not None:
+        background_tasks.append(asyncio.create_task(token_pool.run()))
+    ensure_workers()
+    backoff = Backoff(reconnect_cfg.get("base_delay", 1), reconnect_cfg.get("max_delay", 60))
 
     while True:
-        tasks = []
+        connected_at = None
         try:
+            compression = outbound_cfg.get("compression", "deflate")
             if uri.startswith("wss://"):
                 ssl_ctx = ssl._create_unverified_context()
-                ws = await websockets.connect(uri, ssl=ssl_ctx)
+                ws = await websockets.connect(uri, ssl=ssl_ctx, compression=compression)
             else:
-                ws = await websockets.connect(uri)
+                ws = await websockets.connect(uri, compression=compression)
 
+            connected_at = time.monotonic()
             async with ws:
-                await ws.send(json.dumps({
-                    "type": "register",
-                    "task_types": get_solver_config().get("solver_type"),
-                    "max_concurrency": MAX_CONCURRENCY
-                }))
-                logger.info(emoji("SUCCESS", f"已注册: {uri}"))
-
-                tasks.append(asyncio.create_task(heartbeat(ws)))
-                tasks.append(asyncio.create_task(receiver(ws)))
-                for _ in range(MAX_CONCURRENCY):
-                    tasks.append(asyncio.create_task(task_worker(ws)))
-
-                await asyncio.gather(*tasks)
+                await run_session(ws, task_types, uri)
 
         except Exception as e:
             logger.warning(emoji("ERROR", f"连接断开: {e}"))
-            logger.debug(traceback.format_exc())
+            logger.debug("连接断开堆栈", exc_info=True)
         finally:
-            for task in tasks:
-                task.cancel()
-            await asyncio.gather(*tasks, return_exceptions=True)
-            await asyncio.sleep(5)
+            # 连接稳定运行过一段时间才重置退避
+            if connected_at is not None and time.monotonic() - connected_at >= STABLE_CONNECTION_SECONDS:
+                backoff.reset()
+            delay = backoff.next_delay()
+            logger.info(emoji("WAIT", f"{delay:.1f}s 后重连，执行中 {limiter.in_use} 个，排队 {scheduler.queued()} 个，待发送结果 {len(journal.pending)} 个"))
+            await asyncio.sleep(delay)
 
 if __name__ == "__main__":
     asyncio.run(worker_main())
\ No newline at end of file
@@ -0,0 +1,136 @@
+import asyncio
+import contextvars
+import time
+from typing import Awaitable, Callable, Optional
+
+from common.logger import get_logger, emoji
+from common.metrics import record_span
+from framework.browser_pool import proxy_key
+
+logger = get_logger("batch_solver")
+
+
+def batch_key(task: dict, proxy) -> tuple:
+    """(websiteURL, websiteKey, 代理) 相同的任务可以在同一个页面中求解"""
+    return task.get("websiteURL"), task.get("websiteKey"), proxy_key(proxy)
+
+
+class BatchCollector:
+    """
+    把短时间内到达的兼容任务合并为一批求解：
+    - 同一 key 的第一个任务开启 window 秒的收集窗口，凑满 max_size 立即发车
+    - solve_batch(key, items) 返回与 items 等长的结果列表，逐个回填给各自的调用方
+    - 批量求解整体异常时，该批所有任务都以该异常失败；单个结果失败只影响对应任务
+    - 发车前已取消的任务不参与求解
+    """
+
+    def __init__(self, solve_batch: Callable[[tuple, list], Awaitable[list]], window: float = 0.5,
+                 max_size: int = 4):
+        self.solve_batch = solve_batch
+        self.window = window
+        self.max_size = max(1, max_size)
+        self._pending: dict = {}
+        self._timers: dict = {}
+        self._tasks: set = set()
+
+        self.batches = 0
+        self.tasks = 0
+        self.tokens = 0
+        self.largest = 0
+        self.browser_seconds = 0.0
+
+    async def submit(self, key: tuple, item: dict):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        submitted = time.monotonic()
+        batch = self._pending.get(key)
+        if batch is None:
+            batch = self._pending[key] = []
+            self._timers[key] = loop.call_later(self.window, self._flush, key)
+        batch.append((dict(item, submitted=submitted), future))
+        if len(batch) >= self.max_size:
+            self._flush(key)
+        result, started, seconds = await future
+        record_span("batch_wait", started - submitted)
+        record_span("batch_solve", seconds)
+        return result
+
+    def _flush(self, key: tuple):
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._pending.pop(key, None)
+        if not batch:
+            return
+        # 批次不属于任何单个任务：在空上下文中运行，阶段耗时由各调用方自行记录
+        task = contextvars.Context().run(asyncio.create_task, self._run(key, batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, key: tuple, batch: list):
+        batch = [(item, future) for item, future in batch if not future.done()]
+        if not batch:
+            return
+        self.batches += 1
+        self.tasks += len(batch)
+        self.largest = max(self.largest, len(batch))
+        if len(batch) > 1:
+            logger.info(emoji("TASK", f"合并求解 {len(batch)} 个任务: {key[0]}"))
+        started = time.monotonic()
+        try:
+            results = await self.solve_batch(key, [item for item, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            seconds = time.monotonic() - started
+            self.browser_seconds += seconds
+
+        for index, (_, future) in enumerate(batch):
+            if future.done():
+                continue
+            if index >= len(results):
+                # 结果数量不足时缺失的任务单独失败，不让调用方一直等待
+                future.set_exception(RuntimeError("批量求解未返回该任务的结果"))
+                continue
+            if isinstance(results[index], dict) and results[index].get("status") == "success":
+                self.tokens += 1
+            future.set_result((results[index], started, seconds))
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "tasks": self.tasks,
+            "avg_size": round(self.tasks / self.batches, 2) if self.batches else 0.0,
+            "largest": self.largest,
+            "pending": sum(len(batch) for batch in self._pending.values()),
+            "browser_seconds_per_token": round(self.browser_seconds / self.tokens, 2) if self.tokens else None,
+        }
+
+
+_collectors: dict = {}
+
+
+def get_batch_collector(name: str, config_section: dict, solve_batch) -> Optional[BatchCollector]:
+    """按处理器名称返回全局的批量收集器，config_section 中 batch.enabled 未开启时返回 None"""
+    batch_cfg = (config_section or {}).get("batch") or {}
+    if not batch_cfg.get("enabled"):
+        return None
+    collector = _collectors.get(name)
+    if collector is None:
+        collector = _collectors[name] = BatchCollector(
+            solve_batch,
+            window=batch_cfg.get("window_ms", 500) / 1000,
+            max_size=batch_cfg.get("max_size", 4),
+        )
+    # 处理器模块热重载后使用新的求解函数
+    collector.solve_batch = solve_batch
+    return collector
+
+
+def batch_stats() -> Optional[dict]:
+    if not _collectors:
+        return None
+    return {name: collector.stats() for name, collector in _collectors.items()}
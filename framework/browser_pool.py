@@ -0,0 +1,286 @@
+import asyncio
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Optional
+
+import psutil
+
+from common.logger import get_logger, emoji
+from common.metrics import record_span
+
+logger = get_logger("browser_pool")
+
+
+def proxy_key(proxy) -> str:
+    """按代理身份（server + username）区分浏览器，同一代理出口复用同一批浏览器"""
+    if not proxy:
+        return "direct"
+    if isinstance(proxy, dict):
+        return f"{proxy.get('server')}|{proxy.get('username') or ''}"
+    return str(proxy)
+
+
+_launch_listeners: list = []
+
+
+def add_launch_listener(callback):
+    """注册浏览器启动后的回调，在线程中调用（资源巡检据此记录本进程启动的浏览器进程）"""
+    _launch_listeners.append(callback)
+
+
+async def notify_launch():
+    """浏览器启动完成后调用，包括不经过浏览器池的直接启动"""
+    for callback in _launch_listeners:
+        try:
+            await asyncio.to_thread(callback)
+        except Exception as e:
+            logger.debug("浏览器启动回调失败: %s", e)
+
+
+def _options_key(launch_options: dict) -> tuple:
+    return tuple(sorted((k, repr(v)) for k, v in launch_options.items()))
+
+
+class PooledBrowser:
+    def __init__(self, key: tuple, manager, browser, launch_time: float):
+        self.key = key
+        self.manager = manager
+        self.browser = browser
+        self.launch_time = launch_time
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.uses = 0
+
+    def expired(self, max_uses: int, max_age: float) -> bool:
+        if max_uses and self.uses >= max_uses:
+            return True
+        return bool(max_age) and time.monotonic() - self.created_at >= max_age
+
+    def healthy(self) -> bool:
+        try:
+            return self.browser.is_connected()
+        except Exception:
+            return False
+
+
+class BrowserPool:
+    """
+    常驻 Camoufox 浏览器池：
+    - 按代理身份缓存浏览器，每个任务分配独立的 context/page
+    - 使用 N 次或存活 M 分钟后回收
+    - 可用内存不足时按 LRU 淘汰空闲浏览器
+    - 复用前做健康检查
+    """
+
+    def __init__(self, max_browsers: int = 4, max_uses: int = 50, max_age_minutes: float = 30,
+                 min_available_mb: int = 1024):
+        self.max_browsers = max(1, max_browsers)
+        self.max_uses = max_uses
+        self.max_age = max_age_minutes * 60
+        self.min_available_mb = min_available_mb
+
+        self._idle: "OrderedDict[int, PooledBrowser]" = OrderedDict()
+        self._busy = 0
+        self._cond = asyncio.Condition()
+        self._closed = False
+
+        self.hits = 0
+        self.misses = 0
+        self.launches = 0
+        self.launch_failures = 0
+        self.launch_time_total = 0.0
+        self.recycled = 0
+        self.evicted = 0
+
+    def _size(self) -> int:
+        return len(self._idle) + self._busy
+
+    def _memory_pressure(self) -> bool:
+        if not self.min_available_mb:
+            return False
+        return psutil.virtual_memory().available / (1024 ** 2) < self.min_available_mb
+
+    def _take_idle(self, key: tuple) -> Optional[PooledBrowser]:
+        # 优先取最近使用过的同 key 浏览器
+        for entry_id in reversed(self._idle):
+            entry = self._idle[entry_id]
+            if entry.key == key:
+                del self._idle[entry_id]
+                return entry
+        return None
+
+    def _pop_lru(self) -> Optional[PooledBrowser]:
+        if not self._idle:
+            return None
+        _, entry = self._idle.popitem(last=False)
+        return entry
+
+    async def _close(self, entry: PooledBrowser):
+        try:
+            await entry.manager.__aexit__(None, None, None)
+        except Exception as e:
+            logger.debug("关闭浏览器失败: %s", e)
+
+    async def _launch(self, key: tuple, proxy, launch_options: dict) -> PooledBrowser:
+        from camoufox.async_api import AsyncCamoufox
+
+        start = time.perf_counter()
+        manager = AsyncCamoufox(proxy=proxy, **launch_options)
+        browser = await manager.__aenter__()
+        launch_time = time.perf_counter() - start
+        await notify_launch()
+        record_span("browser_launch", launch_time)
+        self.launches += 1
+        self.launch_time_total += launch_time
+        logger.debug("🚀 启动浏览器 %s 耗时 %.2fs", key[0], launch_time)
+        return PooledBrowser(key, manager, browser, launch_time)
+
+    async def acquire(self, proxy, **launch_options) -> PooledBrowser:
+        key = (proxy_key(proxy), _options_key(launch_options))
+        to_close = []
+        try:
+            async with self._cond:
+                while True:
+                    if self._closed:
+                        raise RuntimeError("浏览器池已关闭")
+                    entry = self._take_idle(key)
+                    if entry is not None:
+                        if entry.healthy() and not entry.expired(self.max_uses, self.max_age):
+                            self._busy += 1
+                            self.hits += 1
+                            return entry
+                        self.recycled += 1
+                        to_close.append(entry)
+                        continue
+                    if self._size() < self.max_browsers:
+                        self._busy += 1
+                        self.misses += 1
+                        break
+                    lru = self._pop_lru()
+                    if lru is not None:
+                        self.evicted += 1
+                        to_close.append(lru)
+                        continue
+                    await self._cond.wait()
+        finally:
+            for entry in to_close:
+                await self._close(entry)
+
+        try:
+            return await self._launch(key, proxy, launch_options)
+        except BaseException:
+            self.launch_failures += 1
+            async with self._cond:
+                self._busy -= 1
+                self._cond.notify()
+            raise
+
+    async def release(self, entry: PooledBrowser, healthy: bool = True):
+        entry.uses += 1
+        entry.last_used = time.monotonic()
+        to_close = []
+        async with self._cond:
+            self._busy -= 1
+            if self._closed or not healthy or not entry.healthy() or entry.expired(self.max_uses, self.max_age):
+                self.recycled += 1
+                to_close.append(entry)
+            else:
+                self._idle[id(entry)] = entry
+            # 内存紧张时淘汰最久未使用的空闲浏览器
+            while self._idle and self._memory_pressure():
+                self.evicted += 1
+                to_close.append(self._pop_lru())
+            self._cond.notify_all()
+        for item in to_close:
+            await self._close(item)
+
+    @asynccontextmanager
+    async def page(self, proxy, **launch_options):
+        """借出一个浏览器，并在独立 context 中打开新页面，任务结束后归还"""
+        entry = await self.acquire(proxy, **launch_options)
+        healthy = True
+        context = None
+        try:
+            context = await entry.browser.new_context()
+            yield await context.new_page()
+        except BaseException:
+            healthy = entry.healthy()
+            raise
+        finally:
+            if context is not None:
+                try:
+                    await context.close()
+                except Exception:
+                    healthy = False
+            await self.release(entry, healthy)
+
+    async def close(self):
+        async with self._cond:
+            self._closed = True
+            entries = list(self._idle.values())
+            self._idle.clear()
+            self._cond.notify_all()
+        for entry in entries:
+            await self._close(entry)
+
+    def stats(self) -> dict:
+        requests = self.hits + self.misses
+        return {
+            "browsers": self._size(),
+            "idle": len(self._idle),
+            "busy": self._busy,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / requests, 3) if requests else 0.0,
+            "launches": self.launches,
+            "launch_failures": self.launch_failures,
+            "avg_launch_seconds": round(self.launch_time_total / self.launches, 3) if self.launches else 0.0,
+            "recycled": self.recycled,
+            "evicted": self.evicted,
+        }
+
+
+_pool: Optional[BrowserPool] = None
+
+
+def get_browser_pool(config: dict) -> Optional[BrowserPool]:
+    """根据 config 中的 browser_pool 配置返回全局浏览器池，未开启时返回 None"""
+    global _pool
+    pool_cfg = (config or {}).get("browser_pool") or {}
+    if not pool_cfg.get("enabled"):
+        return None
+    if _pool is None:
+        _pool = BrowserPool(
+            max_browsers=pool_cfg.get("max_browsers", 4),
+            max_uses=pool_cfg.get("max_uses", 50),
+            max_age_minutes=pool_cfg.get("max_age_minutes", 30),
+            min_available_mb=pool_cfg.get("min_available_mb", 1024),
+        )
+        logger.info(emoji("STARTUP", f"浏览器池已启用: 最多 {_pool.max_browsers} 个浏览器"))
+    return _pool
+
+
+async def prelaunch(config: dict, proxy, **launch_options) -> float:
+    """
+    启动时预热：启动一个浏览器并打开一个页面，验证 Camoufox 可用
+    开启浏览器池时浏览器留在池中供第一个任务直接使用；否则启动后关闭，只预热磁盘缓存
+    返回耗时（秒）
+    """
+    started = time.perf_counter()
+    pool = get_browser_pool(config)
+    if pool is not None:
+        async with pool.page(proxy, **launch_options) as page:
+            await page.goto("about:blank")
+    else:
+        from camoufox.async_api import AsyncCamoufox
+
+        async with AsyncCamoufox(proxy=proxy, **launch_options) as browser:
+            await notify_launch()
+            page = await browser.new_page()
+            await page.goto("about:blank")
+    return time.perf_counter() - started
+
+
+def pool_stats() -> Optional[dict]:
+    return _pool.stats() if _pool is not None else None
@@ -0,0 +1,229 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from enum import Enum
+from typing import Callable, Optional
+
+from common.logger import get_logger, emoji
+from common.metrics import record_span
+
+logger = get_logger("classification_cache")
+
+
+def perceptual_hash(image_path) -> str:
+    """dHash：缩放到 9x8 灰度后比较相邻像素，重新编码/轻微缩放后的同一张图得到相同的值"""
+    from PIL import Image
+
+    with Image.open(image_path) as image:
+        pixels = image.convert("L").resize((9, 8), Image.Resampling.LANCZOS).tobytes()
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = (bits << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return f"{bits:016x}"
+
+
+def normalize_prompt(text: Optional[str]) -> str:
+    text = (text or "").lower()
+    text = re.sub(r"[^\w\s]", " ", text)
+    return " ".join(text.split())
+
+
+def _encode(result):
+    if hasattr(result, "model_dump"):
+        return result.model_dump(mode="json")
+    if isinstance(result, Enum):
+        return result.value
+    return result
+
+
+class ClassificationCache:
+    """
+    hCaptcha 模型调用结果缓存：key = 工具 + 模型 + 图片感知哈希 + 归一化的题目
+    - 内存 LRU + SQLite 磁盘存储
+    - 某次求解最终失败时，作废该次用到的所有答案
+    """
+
+    def __init__(self, memory_entries: int = 2048, path: Optional[str] = None, ttl: float = 7 * 86400):
+        self.memory_entries = max(1, memory_entries)
+        self.ttl = ttl
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None,
+                                       timeout=5)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS answers (key TEXT PRIMARY KEY, value TEXT, created_at REAL)"
+            )
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidated = 0
+        self.call_seconds_total = 0.0
+        self.saved_seconds = 0.0
+
+    @staticmethod
+    def key(tool: str, model: Optional[str], image_hash: str, prompt: str) -> str:
+        return f"{tool}|{model or ''}|{image_hash}|{prompt}"
+
+    def _remember(self, key: str, value, created_at: float):
+        self._memory[key] = (value, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None and self._db is not None:
+                row = self._db.execute("SELECT value, created_at FROM answers WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    entry = (json.loads(row[0]), row[1])
+            if entry is None:
+                return None
+            if self.ttl and time.time() - entry[1] > self.ttl:
+                self._forget(key)
+                return None
+            self._remember(key, *entry)
+            return entry[0]
+
+    def put(self, key: str, value):
+        created_at = time.time()
+        with self._lock:
+            self._remember(key, value, created_at)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO answers (key, value, created_at) VALUES (?, ?, ?)",
+                    (key, json.dumps(value, ensure_ascii=False), created_at),
+                )
+
+    def _forget(self, key: str):
+        self._memory.pop(key, None)
+        if self._db is not None:
+            self._db.execute("DELETE FROM answers WHERE key = ?", (key,))
+
+    def invalidate(self, keys):
+        with self._lock:
+            for key in keys:
+                self._forget(key)
+                self.invalidated += 1
+
+    def session(self) -> "CacheSession":
+        return CacheSession(self)
+
+    def stats(self) -> dict:
+        requests = self.hits + self.misses
+        return {
+            "entries": len(self._memory),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / requests, 3) if requests else 0.0,
+            "invalidated": self.invalidated,
+            "avg_call_seconds": round(self.call_seconds_total / self.misses, 3) if self.misses else 0.0,
+            "saved_seconds": round(self.saved_seconds, 1),
+        }
+
+
+class CachedTool:
+    """包装 hcaptcha_challenger 的工具对象（ImageClassifier 等），invoke 时先查缓存"""
+
+    def __init__(self, tool, name: str, session: "CacheSession", result_type: Callable,
+                 prompt: Callable[[], Optional[str]]):
+        self.tool = tool
+        self.name = name
+        self.session = session
+        self.result_type = result_type
+        self.prompt = prompt
+
+    def _decode(self, value):
+        return self.result_type(**value) if isinstance(value, dict) else self.result_type(value)
+
+    def invoke(self, challenge_screenshot, **kwargs):
+        cache = self.session.cache
+        try:
+            image_hash = perceptual_hash(challenge_screenshot)
+        except Exception as e:
+            logger.debug("计算图片哈希失败，跳过缓存: %s", e)
+            return self.tool.invoke(challenge_screenshot=challenge_screenshot, **kwargs)
+        prompt = normalize_prompt(f"{self.prompt() or ''} {kwargs.get('auxiliary_information') or ''}")
+        key = cache.key(self.name, kwargs.get("model"), image_hash, prompt)
+
+        try:
+            value = cache.get(key)
+        except sqlite3.Error as e:
+            logger.debug("读取模型缓存失败: %s", e)
+            value = None
+        if value is not None:
+            try:
+                result = self._decode(value)
+            except Exception:
+                cache.invalidate([key])
+            else:
+                cache.hits += 1
+                if cache.misses:
+                    cache.saved_seconds += cache.call_seconds_total / cache.misses
+                self.session.used.add(key)
+                logger.debug("模型调用缓存命中: %s", self.name)
+                return result
+
+        cache.misses += 1
+        started = time.monotonic()
+        result = self.tool.invoke(challenge_screenshot=challenge_screenshot, **kwargs)
+        seconds = time.monotonic() - started
+        cache.call_seconds_total += seconds
+        record_span("model_call", seconds)
+        try:
+            cache.put(key, _encode(result))
+        except (sqlite3.Error, TypeError) as e:
+            logger.debug("写入模型缓存失败: %s", e)
+        self.session.used.add(key)
+        return result
+
+
+class CacheSession:
+    """单次求解用到的缓存 key，求解失败时整体作废"""
+
+    def __init__(self, cache: ClassificationCache):
+        self.cache = cache
+        self.used: set = set()
+
+    def wrap(self, tool, name: str, result_type: Callable, prompt: Callable[[], Optional[str]]) -> CachedTool:
+        return CachedTool(tool, name, self, result_type, prompt)
+
+    def finish(self, passed: bool):
+        if not passed and self.used:
+            try:
+                self.cache.invalidate(self.used)
+                logger.info(emoji("DB", f"求解失败，作废 {len(self.used)} 个缓存答案"))
+            except sqlite3.Error as e:
+                logger.debug("作废模型缓存失败: %s", e)
+        self.used = set()
+
+
+_cache: Optional[ClassificationCache] = None
+
+
+def get_classification_cache(config: dict) -> Optional[ClassificationCache]:
+    """根据 config 中的 classification_cache 配置返回全局缓存，未开启时返回 None"""
+    global _cache
+    cache_cfg = (config or {}).get("classification_cache") or {}
+    if not cache_cfg.get("enabled"):
+        return None
+    if _cache is None:
+        _cache = ClassificationCache(
+            memory_entries=cache_cfg.get("memory_entries", 2048),
+            path=cache_cfg.get("path"),
+            ttl=cache_cfg.get("ttl_days", 7) * 86400,
+        )
+    return _cache
+
+
+def classification_stats() -> Optional[dict]:
+    return _cache.stats() if _cache is not None else None
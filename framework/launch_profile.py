@@ -0,0 +1,234 @@
+import asyncio
+import dataclasses
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from common.logger import get_logger, emoji
+from common.metrics import record_span
+from framework.browser_pool import proxy_key
+
+logger = get_logger("launch_profile")
+
+
+class LaunchProfile:
+    """同一代理出口的启动参数：出口 IP 和可复用的指纹"""
+
+    def __init__(self, key: str, exit_ip: str, fingerprint, resolve_seconds: float,
+                 created_at: Optional[float] = None):
+        self.key = key
+        self.exit_ip = exit_ip
+        self.fingerprint = fingerprint
+        self.resolve_seconds = resolve_seconds
+        # 出口 IP 的查询时间，TTL 从这里算起
+        self.created_at = created_at or time.time()
+
+    def to_dict(self) -> dict:
+        fingerprint = self.fingerprint
+        if dataclasses.is_dataclass(fingerprint):
+            fingerprint = dataclasses.asdict(fingerprint)
+        return {
+            "key": self.key,
+            "exit_ip": self.exit_ip,
+            "fingerprint": fingerprint,
+            "resolve_seconds": self.resolve_seconds,
+            "created_at": self.created_at,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "LaunchProfile":
+        return cls(data["key"], data["exit_ip"], _fingerprint_from_dict(data["fingerprint"]),
+                   data.get("resolve_seconds", 0.0), data.get("created_at"))
+
+
+def _fingerprint_from_dict(data: dict):
+    """把 JSON 中的指纹还原为 browserforge 的 Fingerprint"""
+    from browserforge.fingerprints import Fingerprint, NavigatorFingerprint, ScreenFingerprint, VideoCard
+
+    data = dict(data, screen=ScreenFingerprint(**data["screen"]), navigator=NavigatorFingerprint(**data["navigator"]))
+    if data.get("videoCard"):
+        data["videoCard"] = VideoCard(**data["videoCard"])
+    return Fingerprint(**data)
+
+
+def _proxy_url(proxy) -> Optional[str]:
+    if not proxy:
+        return None
+    if isinstance(proxy, dict):
+        from camoufox.ip import Proxy
+        return Proxy(**proxy).as_string()
+    return str(proxy)
+
+
+def _resolve(proxy, fingerprint_options: dict, headless, fingerprint=None) -> tuple:
+    """在线程中执行：通过代理查询出口 IP，没有可复用的指纹时生成指纹"""
+    from camoufox.fingerprints import generate_fingerprint
+    from camoufox.ip import public_ip
+    from camoufox.utils import get_screen_cons
+
+    exit_ip = public_ip(_proxy_url(proxy))
+    if fingerprint is not None:
+        return exit_ip, fingerprint
+    if not fingerprint_options.get("screen"):
+        # 与 Camoufox 自行生成指纹时一致：按本机最大显示器的尺寸约束屏幕
+        fingerprint_options = dict(fingerprint_options, screen=get_screen_cons(headless))
+    return exit_ip, generate_fingerprint(**fingerprint_options)
+
+
+class LaunchProfileCache:
+    """
+    按代理缓存 Camoufox 启动前的准备工作（LRU）：
+    - browserforge 指纹按代理一直复用
+    - 出口 IP 只在 TTL 内复用；TTL 为 0 时每次启动都重新查询（轮换 IP 的代理），只省去指纹生成
+    - 以 geoip=<出口 IP> 启动，跳过 geoip=True 的网络查询和指纹生成；
+      地区/时区/经纬度、WebRTC IP 和 IPv6 开关仍由 Camoufox 按该 IP 从本地 GeoIP 库设置
+    - 可选以 JSON 持久化到磁盘，重启后直接命中
+    """
+
+    def __init__(self, max_entries: int = 256, ttl: float = 0, path: Optional[str] = None):
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self.path = path
+        self._profiles: "OrderedDict[str, LaunchProfile]" = OrderedDict()
+        self._locks: dict = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.failures = 0
+        self.saved_seconds = 0.0
+        self.resolve_seconds_total = 0.0
+        if path:
+            self._load()
+
+    # ---------- 磁盘 ----------
+
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                profiles = [LaunchProfile.from_dict(data) for data in json.load(f)]
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            logger.warning(emoji("WARNING", f"启动参数缓存读取失败: {e}"))
+            return
+        for profile in profiles[-self.max_entries:]:
+            self._profiles[profile.key] = profile
+        if self._profiles:
+            logger.info(emoji("DB", f"从磁盘恢复 {len(self._profiles)} 个代理启动参数"))
+
+    def _save(self):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump([profile.to_dict() for profile in self._profiles.values()], f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logger.debug("启动参数缓存写入失败: %s", e)
+
+    # ---------- 缓存 ----------
+
+    def _fresh(self, profile: LaunchProfile) -> bool:
+        """出口 IP 是否还能复用"""
+        return self.ttl > 0 and time.time() - profile.created_at < self.ttl
+
+    def _get(self, key: str) -> Optional[LaunchProfile]:
+        profile = self._profiles.get(key)
+        if profile is not None:
+            self._profiles.move_to_end(key)
+        return profile
+
+    async def profile(self, proxy, fingerprint_options: Optional[dict] = None,
+                      headless=None) -> Optional[LaunchProfile]:
+        key = proxy_key(proxy)
+        profile = self._get(key)
+        if profile is not None and self._fresh(profile):
+            self.hits += 1
+            self.saved_seconds += profile.resolve_seconds
+            return profile
+        # 同一代理并发未命中时只解析一次
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            profile = self._get(key)
+            if profile is not None and self._fresh(profile):
+                self.hits += 1
+                self.saved_seconds += profile.resolve_seconds
+                return profile
+            self.misses += 1
+            started = time.monotonic()
+            try:
+                exit_ip, fingerprint = await asyncio.to_thread(
+                    _resolve, proxy, fingerprint_options or {}, headless, profile.fingerprint if profile else None
+                )
+            except Exception as e:
+                self.failures += 1
+                logger.warning(emoji("WARNING", f"解析代理出口失败，退回 Camoufox 默认流程: {e}"))
+                return None
+            finally:
+                record_span("profile_resolve", time.monotonic() - started)
+            resolve_seconds = time.monotonic() - started
+            self.resolve_seconds_total += resolve_seconds
+            profile = LaunchProfile(key, exit_ip, fingerprint, resolve_seconds)
+            self._profiles[key] = profile
+            while len(self._profiles) > self.max_entries:
+                self._profiles.popitem(last=False)
+            self._locks.pop(key, None)
+        await asyncio.to_thread(self._save)
+        return profile
+
+    async def launch_options(self, proxy, **options) -> dict:
+        """把缓存的出口 IP 和指纹写入启动参数，仅处理 geoip=True 的启动"""
+        if options.get("geoip") is not True:
+            return options
+        # 与 Camoufox 生成指纹时的约束一致：os、screen、window
+        fingerprint_options = {name: options[name] for name in ("os", "screen", "window") if options.get(name)}
+        env = options.get("env") or os.environ
+        profile = await self.profile(proxy, fingerprint_options, options.get("headless") or "DISPLAY" in env)
+        if profile is None:
+            return options
+        return dict(options, geoip=profile.exit_ip, fingerprint=profile.fingerprint)
+
+    def stats(self) -> dict:
+        requests = self.hits + self.misses
+        return {
+            "profiles": len(self._profiles),
+            "hits": self.hits,
+            "misses": self.misses,
+            "failures": self.failures,
+            "hit_rate": round(self.hits / requests, 3) if requests else 0.0,
+            "avg_resolve_seconds": round(self.resolve_seconds_total / self.misses, 3) if self.misses else 0.0,
+            "saved_seconds": round(self.saved_seconds, 1),
+        }
+
+
+_cache: Optional[LaunchProfileCache] = None
+
+
+def get_profile_cache(config: dict) -> Optional[LaunchProfileCache]:
+    """根据 config 中的 launch_profile 配置返回全局缓存，未开启时返回 None"""
+    global _cache
+    profile_cfg = (config or {}).get("launch_profile") or {}
+    if not profile_cfg.get("enabled"):
+        return None
+    if _cache is None:
+        _cache = LaunchProfileCache(
+            max_entries=profile_cfg.get("max_entries", 256),
+            ttl=(profile_cfg.get("ttl_minutes") or 0) * 60,
+            path=profile_cfg.get("path"),
+        )
+    return _cache
+
+
+async def resolve_launch_options(config: dict, proxy, **options) -> dict:
+    cache = get_profile_cache(config)
+    if cache is None:
+        return options
+    return await cache.launch_options(proxy, **options)
+
+
+def profile_stats() -> Optional[dict]:
+    return _cache.stats() if _cache is not None else None
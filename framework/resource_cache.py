@@ -0,0 +1,288 @@
+import asyncio
+import fnmatch
+import hashlib
+import json
+import mimetypes
+import os
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from common.logger import get_logger
+
+logger = get_logger("resource_cache")
+
+DEFAULT_CACHE_PATTERNS = [
+    "https://challenges.cloudflare.com/turnstile/v0/api.js*",
+    "https://js.hcaptcha.com/1/api.js*",
+    "https://newassets.hcaptcha.com/*",
+]
+DEFAULT_BLOCK_PATTERNS = [
+    "*api64.ipify.org*",
+    "*google-analytics.com*",
+    "*googletagmanager.com*",
+    "*doubleclick.net*",
+]
+DEFAULT_BLOCK_RESOURCE_TYPES = ["font"]
+
+# 从缓存返回时不能带上原始的编码/长度头，body 已经是解码后的内容
+_DROP_HEADERS = {"content-encoding", "content-length", "transfer-encoding", "connection"}
+
+
+def _clean_headers(headers: dict) -> dict:
+    return {k.lower(): v for k, v in headers.items() if k.lower() not in _DROP_HEADERS}
+
+
+class CachedResource:
+    def __init__(self, url: str, status: int, headers: dict, body: bytes, fetched_at: float):
+        self.url = url
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.fetched_at = fetched_at
+
+    @property
+    def etag(self) -> Optional[str]:
+        return self.headers.get("etag")
+
+    @property
+    def last_modified(self) -> Optional[str]:
+        return self.headers.get("last-modified")
+
+
+class ResourceCache:
+    """静态资源缓存：内存 LRU + 磁盘，过期后用 ETag / Last-Modified 重新验证"""
+
+    def __init__(self, ttl: float = 3600, memory_entries: int = 256, cache_dir: Optional[str] = "tmp/.resource_cache"):
+        self.ttl = ttl
+        self.memory_entries = memory_entries
+        self.cache_dir = cache_dir
+        self._memory: "OrderedDict[str, CachedResource]" = OrderedDict()
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def _file(self, url: str) -> str:
+        return os.path.join(self.cache_dir, hashlib.sha1(url.encode()).hexdigest())
+
+    def _remember(self, entry: CachedResource):
+        self._memory[entry.url] = entry
+        self._memory.move_to_end(entry.url)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _read_disk(self, url: str) -> Optional[CachedResource]:
+        path = self._file(url)
+        try:
+            with open(path + ".json", "r") as f:
+                meta = json.load(f)
+            with open(path + ".bin", "rb") as f:
+                body = f.read()
+        except (OSError, ValueError):
+            return None
+        return CachedResource(url, meta["status"], meta["headers"], body, meta["fetched_at"])
+
+    def _write_disk(self, entry: CachedResource):
+        path = self._file(entry.url)
+        # 多个分片进程共用缓存目录，先写临时文件再原子替换
+        tmp = f".{os.getpid()}.tmp"
+        try:
+            with open(path + ".bin" + tmp, "wb") as f:
+                f.write(entry.body)
+            with open(path + ".json" + tmp, "w") as f:
+                json.dump({"status": entry.status, "headers": entry.headers, "fetched_at": entry.fetched_at}, f)
+            os.replace(path + ".bin" + tmp, path + ".bin")
+            os.replace(path + ".json" + tmp, path + ".json")
+        except OSError as e:
+            logger.debug("写入资源缓存失败: %s", e)
+
+    async def get(self, url: str) -> Optional[CachedResource]:
+        entry = self._memory.get(url)
+        if entry is None and self.cache_dir:
+            entry = await asyncio.to_thread(self._read_disk, url)
+        if entry is not None:
+            self._remember(entry)
+        return entry
+
+    def fresh(self, entry: CachedResource) -> bool:
+        return time.time() - entry.fetched_at < self.ttl
+
+    async def put(self, url: str, status: int, headers: dict, body: bytes) -> CachedResource:
+        entry = CachedResource(url, status, _clean_headers(headers), body, time.time())
+        self._remember(entry)
+        if self.cache_dir:
+            await asyncio.to_thread(self._write_disk, entry)
+        return entry
+
+    async def touch(self, entry: CachedResource):
+        """304 重新验证成功，刷新时间"""
+        entry.fetched_at = time.time()
+        if self.cache_dir:
+            await asyncio.to_thread(self._write_disk, entry)
+
+
+class TrafficStats:
+    def __init__(self):
+        self.cache_hits = 0
+        self.revalidated = 0
+        self.cache_misses = 0
+        self.blocked = 0
+        self.stubbed = 0
+        self.bytes_saved = 0
+
+    def merge(self, other: "TrafficStats"):
+        for key, value in other.to_dict().items():
+            setattr(self, key, getattr(self, key) + value)
+
+    def to_dict(self) -> dict:
+        return {
+            "cache_hits": self.cache_hits,
+            "revalidated": self.revalidated,
+            "cache_misses": self.cache_misses,
+            "blocked": self.blocked,
+            "stubbed": self.stubbed,
+            "bytes_saved": self.bytes_saved,
+        }
+
+
+class RouteInterceptor:
+    """
+    页面请求拦截层，建立在 page.route 之上：
+    - 命中 cache_patterns 的 GET 请求走共享缓存
+    - 命中 block_patterns / block_resource_types 的请求直接拦截
+    - 命中 stubs 的请求直接返回本地内容（离线压测用的验证码组件替身）
+    之后注册的 page.route（例如 Turnstile 的页面模板）优先级更高，不受影响
+    """
+
+    def __init__(self, cache: ResourceCache, cache_patterns: list, block_patterns: list, block_resource_types: list,
+                 stubs: Optional[list] = None):
+        self.cache = cache
+        self.stubs = stubs or []
+        self.cache_patterns = cache_patterns
+        self.block_patterns = block_patterns
+        self.block_resource_types = set(block_resource_types)
+        self.stats = TrafficStats()
+
+    def _blocked(self, request) -> bool:
+        if request.resource_type in self.block_resource_types:
+            return True
+        return any(fnmatch.fnmatch(request.url, p) for p in self.block_patterns)
+
+    def _cacheable(self, request) -> bool:
+        return request.method == "GET" and any(fnmatch.fnmatch(request.url, p) for p in self.cache_patterns)
+
+    async def _fulfill_cached(self, route, entry: CachedResource):
+        self.stats.bytes_saved += len(entry.body)
+        await route.fulfill(status=entry.status, headers=entry.headers, body=entry.body)
+
+    def _stub(self, request) -> Optional[dict]:
+        for stub in self.stubs:
+            if fnmatch.fnmatch(request.url, stub["pattern"]):
+                return stub
+        return None
+
+    async def _handle(self, route):
+        request = route.request
+        try:
+            stub = self._stub(request)
+            if stub is not None:
+                self.stats.stubbed += 1
+                await route.fulfill(status=stub["status"], content_type=stub["content_type"], body=stub["body"],
+                                    headers={"access-control-allow-origin": "*"})
+                return
+            if self._blocked(request):
+                self.stats.blocked += 1
+                await route.abort()
+                return
+            if not self._cacheable(request):
+                await route.fallback()
+                return
+
+            entry = await self.cache.get(request.url)
+            if entry is not None and self.cache.fresh(entry):
+                self.stats.cache_hits += 1
+                await self._fulfill_cached(route, entry)
+                return
+
+            headers = dict(request.headers)
+            if entry is not None:
+                if entry.etag:
+                    headers["if-none-match"] = entry.etag
+                if entry.last_modified:
+                    headers["if-modified-since"] = entry.last_modified
+            response = await route.fetch(headers=headers)
+
+            if response.status == 304 and entry is not None:
+                self.stats.revalidated += 1
+                await self.cache.touch(entry)
+                await self._fulfill_cached(route, entry)
+                return
+
+            self.stats.cache_misses += 1
+            body = await response.body()
+            if response.status == 200:
+                await self.cache.put(request.url, response.status, response.headers, body)
+            # 与缓存命中时一致：body 已解码，不能带上原始的 content-encoding / content-length
+            await route.fulfill(status=response.status, headers=_clean_headers(response.headers), body=body)
+        except Exception as e:
+            logger.debug("请求拦截失败，回退到正常请求: %s %s", request.url, e)
+            try:
+                await route.fallback()
+            except Exception:
+                pass
+
+    async def attach(self, page):
+        await page.route("**/*", self._handle)
+
+    def finish(self) -> dict:
+        """任务结束时调用，汇总到全局统计并返回本任务的流量数据"""
+        _totals.merge(self.stats)
+        return self.stats.to_dict()
+
+
+_cache: Optional[ResourceCache] = None
+_stubs: Optional[list] = None
+_totals = TrafficStats()
+
+
+def _load_stubs(stub_cfg: list) -> list:
+    """stub_routes 配置 -> [{pattern, status, content_type, body}]，文件只读取一次"""
+    stubs = []
+    for item in stub_cfg or []:
+        if item.get("file"):
+            with open(item["file"], "rb") as f:
+                body = f.read()
+        else:
+            body = (item.get("body") or "").encode()
+        stubs.append({
+            "pattern": item["pattern"],
+            "status": item.get("status", 200),
+            "content_type": item.get("content_type") or mimetypes.guess_type(item.get("file") or "")[0] or "text/plain",
+            "body": body,
+        })
+    return stubs
+
+
+def get_route_interceptor(config: dict) -> Optional[RouteInterceptor]:
+    """每个任务一个拦截器，共享同一个资源缓存；未开启时返回 None"""
+    global _cache, _stubs
+    cache_cfg = (config or {}).get("resource_cache") or {}
+    if not cache_cfg.get("enabled"):
+        return None
+    if _cache is None:
+        _cache = ResourceCache(
+            ttl=cache_cfg.get("ttl", 3600),
+            memory_entries=cache_cfg.get("memory_entries", 256),
+            cache_dir=cache_cfg.get("dir", "tmp/.resource_cache"),
+        )
+        _stubs = _load_stubs(cache_cfg.get("stub_routes"))
+    return RouteInterceptor(
+        _cache,
+        cache_patterns=cache_cfg.get("cache_patterns") or DEFAULT_CACHE_PATTERNS,
+        block_patterns=cache_cfg.get("block_patterns", DEFAULT_BLOCK_PATTERNS),
+        block_resource_types=cache_cfg.get("block_resource_types", DEFAULT_BLOCK_RESOURCE_TYPES),
+        stubs=_stubs,
+    )
+
+
+def traffic_stats() -> Optional[dict]:
+    return _totals.to_dict() if _cache is not None else None
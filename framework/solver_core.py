@@ -1,7 +1,6 @@
-import yaml
+from common.config import load_config
 
-with open("config/config.yaml", "r") as f:
-    config = yaml.safe_load(f)
+config = load_config()
 
 def get_proxy_url():
     proxy_cfg = config.get("proxy")
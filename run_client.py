@@ -1,5 +1,18 @@
 import asyncio
-from core.ws_client import worker_main
+
+from common.config import load_config
 
 if __name__ == "__main__":
-    asyncio.run(worker_main())
+    config = load_config()
+
+    from common.logger import configure_logging
+    configure_logging(config)
+
+    # 分片模式下 spawn 出的子进程也会导入本文件，ws_client 只在需要时才导入
+    from core.supervisor import supervisor_workers
+    if supervisor_workers(config) > 1:
+        from core.supervisor import run_supervisor
+        asyncio.run(run_supervisor(config))
+    else:
+        from core.ws_client import worker_main
+        asyncio.run(worker_main())
@@ -1,17 +1,20 @@
 import asyncio
-import gc
 import json
 import logging
-import os
-import resource
-import sys
 import time
+from contextlib import asynccontextmanager
 from typing import Optional
 
 import yaml
 from camoufox.async_api import AsyncCamoufox
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
 # from patchright.async_api import async_playwright
 from common.logger import get_logger,emoji
+from common.metrics import span, record_span
+from framework.batch_solver import batch_key, get_batch_collector
+from framework.browser_pool import get_browser_pool, notify_launch, prelaunch
+from framework.launch_profile import resolve_launch_options
+from framework.resource_cache import get_route_interceptor
 from dataclasses import dataclass
 logger = get_logger("Anti")
 # with open("config/config.yaml", "r") as f:
@@ -22,6 +25,45 @@ class TurnstileResult:
     elapsed_time_seconds: float
     status: str
     reason: Optional[str] = None
+    attempts: Optional[list] = None
+    traffic: Optional[dict] = None
+
+# 回调或隐藏 input 任一拿到 token 即返回
+TOKEN_PROBE_JS = """
+() => window.__turnstileToken
+    || (document.querySelector('[name=cf-turnstile-response]') || {}).value
+    || null
+"""
+
+# 批量模式：返回 pending 中已拿到 token 或报错的组件 {序号: {token, error}}，都没有时返回 null
+BATCH_PROBE_JS = """
+(pending) => {
+    const done = {};
+    for (const i of pending) {
+        const input = document.querySelector(`#cf-turnstile-${i} [name=cf-turnstile-response]`);
+        const token = window.__turnstileTokens[i] || (input && input.value) || null;
+        const error = window.__turnstileErrors[i] || null;
+        if (token || error) done[i] = {token, error};
+    }
+    return Object.keys(done).length ? done : null;
+}
+"""
+
+# 批量模式：api.js 加载完成后显式渲染每个组件，各自的回调写入独立的槽位
+BATCH_RENDER_SCRIPT = """
+<script>
+    window.__turnstileTokens = {};
+    window.__turnstileErrors = {};
+    (function renderBatch() {
+        if (!window.turnstile) return setTimeout(renderBatch, 50);
+        %s.forEach(function (options, i) {
+            options.callback = function (token) { window.__turnstileTokens[i] = token; };
+            options['error-callback'] = function (code) { window.__turnstileErrors[i] = String(code || 'error'); };
+            window.turnstile.render('#cf-turnstile-' + i, options);
+        });
+    })();
+</script>
+"""
 
 class TurnstileSolver:
     HTML_TEMPLATE = """
@@ -31,6 +73,11 @@ class TurnstileSolver:
         <meta charset="UTF-8">
         <meta name="viewport" content="width=device-width, initial-scale=1.0">
         <title>Turnstile Solver</title>
+        <script>
+            // Turnstile 回调：token 一旦生成立即记录，供 wait_for_function 读取
+            window.__turnstileToken = null;
+            window.onTurnstileToken = function (token) { window.__turnstileToken = token; };
+        </script>
         <script src="https://challenges.cloudflare.com/turnstile/v0/api.js" async></script>
         <script>
             async function fetchIP() {
@@ -62,18 +109,13 @@ class TurnstileSolver:
         if useragent:
             self.browser_args.append(f"--user-agent={useragent}")
 
-    async def _setup_page(self, browser, url: str, sitekey: str, action: str = None, cdata: str = None):
-        if self.browser_type == "chrome":
-            page = browser.pages[0]
-        else:
-            page = await browser.new_page()
-
+    async def _setup_page(self, page, url: str, sitekey: str, action: str = None, cdata: str = None):
         url_with_slash = url + "/" if not url.endswith("/") else url
 
         if self.debug:
-            logger.debug(f"Navigating to URL: {url_with_slash}")
+            logger.debug("Navigating to URL: %s", url_with_slash)
 
-        turnstile_div = f'<div class="cf-turnstile" style="background: white; width: 70px;" data-sitekey="{sitekey}"' + (f' data-action="{action}"' if action else '') + (f' data-cdata="{cdata}"' if cdata else '') + '></div>'
+        turnstile_div = f'<div class="cf-turnstile" style="background: white; width: 70px;" data-sitekey="{sitekey}" data-callback="onTurnstileToken"' + (f' data-action="{action}"' if action else '') + (f' data-cdata="{cdata}"' if cdata else '') + '></div>'
         page_data = self.HTML_TEMPLATE.replace("<!-- cf turnstile -->", turnstile_div)
 
         await page.route(url_with_slash, lambda route: route.fulfill(body=page_data, status=200))
@@ -81,82 +123,280 @@ class TurnstileSolver:
 
         return page, url_with_slash
 
-    async def _get_turnstile_response(self, page, max_attempts: int = 10,config:dict = None) -> Optional[str]:
-        for attempt in range(max_attempts):
+    async def _setup_batch_page(self, page, url: str, sitekey: str, widgets: list):
+        """同一页面渲染多个组件（显式渲染，不带 cf-turnstile class，避免被隐式渲染重复处理）"""
+        url_with_slash = url + "/" if not url.endswith("/") else url
+
+        options = []
+        divs = []
+        for i, widget in enumerate(widgets):
+            option = {"sitekey": sitekey}
+            if widget.get("action"):
+                option["action"] = widget["action"]
+            if widget.get("cdata"):
+                option["cData"] = widget["cdata"]
+            options.append(option)
+            divs.append(f'<div id="cf-turnstile-{i}" style="background: white; width: 70px; margin: 4px 0;"></div>')
+        page_data = self.HTML_TEMPLATE.replace(
+            "<!-- cf turnstile -->", "\n".join(divs) + BATCH_RENDER_SCRIPT % json.dumps(options)
+        )
+
+        await page.route(url_with_slash, lambda route: route.fulfill(body=page_data, status=200))
+        await page.goto(url_with_slash)
+
+        return page, url_with_slash
+
+    async def _new_page(self, browser):
+        if self.browser_type == "chrome":
+            return browser.pages[0]
+        return await browser.new_page()
+
+    async def _wait_for_token(self, page, timeout: float) -> Optional[str]:
+        try:
+            handle = await page.wait_for_function(TOKEN_PROBE_JS, polling=100, timeout=max(1, timeout * 1000))
+            return await handle.json_value()
+        except PlaywrightTimeoutError:
+            return None
+
+    async def _click_if_interactive(self, page, selector: str = ".cf-turnstile") -> bool:
+        """只有组件已渲染出可点击区域时才点击，避免对未加载/非交互模式的组件空点"""
+        widget = page.locator(selector)
+        try:
+            box = await widget.bounding_box(timeout=500)
+            # 组件渲染完成前容器高度为 0
+            if not box or box["height"] <= 0:
+                return False
+            await widget.click(timeout=1000)
+            return True
+        except Exception as e:
+            logger.debug("Click error: %s", e)
+            return False
+
+    async def _get_turnstile_response(self, page, time_budget: float = 30.0, click_interval: float = 3.0):
+        """
+        事件驱动获取 token：页面内回调/轮询在 token 出现的瞬间返回，
+        每轮最多等待 click_interval 秒，未拿到时仅在组件可交互时点击重试，整体受 time_budget 限制
+        返回 (token, attempts)
+        """
+        deadline = time.monotonic() + time_budget
+        attempts = []
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None, attempts
+
+            attempt_start = time.monotonic()
+            token = await self._wait_for_token(page, min(click_interval, remaining))
+            if token:
+                attempts.append({"wait": round(time.monotonic() - attempt_start, 3), "clicked": False, "token": True})
+                return token, attempts
+
+            clicked = await self._click_if_interactive(page)
+            attempts.append({"wait": round(time.monotonic() - attempt_start, 3), "clicked": clicked, "token": False})
             if self.debug:
-                logger.debug(f"Attempt {attempt + 1}: No Turnstile response yet.")
+                logger.debug("Attempt %d: No Turnstile response yet, clicked=%s.", len(attempts), clicked)
 
-            try:
-                turnstile_check = await page.input_value("[name=cf-turnstile-response]")
-                if turnstile_check == "":
-                    await page.click("//div[@class='cf-turnstile']", timeout=3000)
-                    await asyncio.sleep(3)
-                else:
-                    return turnstile_check
-            except Exception as e:
-                logger.debug(f"Click error: {str(e)}")
-                continue
-        return None
-
-    async def solve(self, proxy:json,url: str, sitekey: str, action: str = None, cdata: str = None,config:dict = None):
-        start_time = time.time()
-        logger.debug(f"Attempting to solve URL: {url}")
-        proxy_config = config.get("proxy") or {}
-        # proxy = {
-        #     "server": proxy_config.get("server"),
-        #     "username": proxy_config.get("username"),
-        #     "password": proxy_config.get("password"),
-        # }
-        logger.debug(f"Proxy: {proxy},type:{type(proxy)}")
-        async with AsyncCamoufox(
-                headless=self.headless,
-                geoip=True,
-                proxy=proxy,
-        ) as browser:
-            try:
-                page,url_with_slash = await self._setup_page(browser, url, sitekey, action, cdata)
-                token = await self._get_turnstile_response(page)
-                elapsed = round(time.time() - start_time, 2)
+    async def _wait_for_batch(self, page, pending: list, timeout: float) -> dict:
+        try:
+            handle = await page.wait_for_function(BATCH_PROBE_JS, arg=pending, polling=100,
+                                                  timeout=max(1, timeout * 1000))
+            return await handle.json_value()
+        except PlaywrightTimeoutError:
+            return {}
+
+    async def _get_batch_responses(self, page, count: int, time_budget: float = 30.0, click_interval: float = 3.0):
+        """
+        批量模式下逐个组件收集 token：每个组件有自己的点击计时，
+        超过 click_interval 仍未拿到 token 的组件单独点击，已完成/报错的组件不再处理
+        返回 ({序号: (token, error)}, {序号: attempts})，超时未完成的组件不在第一个结果中
+        """
+        started = time.monotonic()
+        deadline = started + time_budget
+        pending = set(range(count))
+        done = {}
+        attempts = {i: [] for i in range(count)}
+        last_action = dict.fromkeys(pending, started)
+        while pending:
+            now = time.monotonic()
+            if now >= deadline:
+                break
+            for i in sorted(pending):
+                if now - last_action[i] >= click_interval:
+                    clicked = await self._click_if_interactive(page, f"#cf-turnstile-{i}")
+                    attempts[i].append({"wait": round(now - last_action[i], 3), "clicked": clicked, "token": False})
+                    last_action[i] = time.monotonic()
+
+            now = time.monotonic()
+            next_click = min(last_action[i] for i in pending) + click_interval
+            finished = await self._wait_for_batch(page, sorted(pending), min(deadline, next_click) - now)
+            for index, value in (finished or {}).items():
+                i = int(index)
+                done[i] = (value.get("token"), value.get("error"))
+                pending.discard(i)
+                attempts[i].append({"wait": round(time.monotonic() - last_action[i], 3), "clicked": False,
+                                    "token": bool(value.get("token"))})
+        return done, attempts
 
-                if not token:
-                    logger.error("Failed to retrieve Turnstile value.")
-                    return TurnstileResult(None, elapsed, "failure", "No token obtained")
+    async def _solve_on_page(self, page, start_time: float, url: str, sitekey: str, action: str = None, cdata: str = None,
+                             time_budget: float = 30.0, interceptor=None, click_interval: float = 3.0):
+        attempts = []
+        try:
+            if interceptor is not None:
+                await interceptor.attach(page)
+            with span("navigation"):
+                page, url_with_slash = await self._setup_page(page, url, sitekey, action, cdata)
+            # 预算从任务开始计时，扣除启动浏览器和导航的时间
+            remaining = time_budget - (time.time() - start_time)
+            with span("challenge_solve"):
+                token, attempts = await self._get_turnstile_response(page, time_budget=remaining,
+                                                                     click_interval=click_interval)
+            elapsed = round(time.time() - start_time, 2)
 
+            if not token:
+                logger.error("Failed to retrieve Turnstile value.")
+                result = TurnstileResult(None, elapsed, "failure", "No token obtained", attempts)
+            else:
                 logger.info(emoji("SUCCESS", f"Solved Turnstile in {elapsed}s -> {token[:10]}..."))
-                return TurnstileResult(token, elapsed, "success")
-            except Exception as e:
-                logger.error(emoji("ERROR", f"Failed to solve Turnstile: {str(e)}"))
-                return TurnstileResult(None, elapsed, "failure", str(e))
+                result = TurnstileResult(token, elapsed, "success", attempts=attempts)
+        except Exception as e:
+            elapsed = round(time.time() - start_time, 2)
+            logger.error(emoji("ERROR", f"Failed to solve Turnstile: {str(e)}"))
+            result = TurnstileResult(None, elapsed, "failure", str(e), attempts)
+
+        if interceptor is not None:
+            result.traffic = interceptor.finish()
+            logger.debug("📦 流量统计: %s", result.traffic)
+        return result
+
+    async def _solve_batch_on_page(self, page, widgets: list, url: str, sitekey: str, time_budget: float = 30.0,
+                                   interceptor=None, click_interval: float = 3.0) -> list:
+        """一个页面求解多个组件，返回与 widgets 等长的 TurnstileResult 列表；单个组件失败只影响自己"""
+        # 预算从批次中最早的任务开始计时
+        batch_start = min(widget["start_time"] for widget in widgets)
+        done, attempts = {}, {}
+        reason = "No token obtained"
+        try:
+            if interceptor is not None:
+                await interceptor.attach(page)
+            with span("navigation"):
+                await self._setup_batch_page(page, url, sitekey, widgets)
+            remaining = time_budget - (time.time() - batch_start)
+            with span("challenge_solve"):
+                done, attempts = await self._get_batch_responses(page, len(widgets), time_budget=remaining,
+                                                                 click_interval=click_interval)
+        except Exception as e:
+            logger.error(emoji("ERROR", f"Failed to solve Turnstile batch: {str(e)}"))
+            reason = str(e)
+
+        traffic = interceptor.finish() if interceptor is not None else None
+        results = []
+        for i, widget in enumerate(widgets):
+            elapsed = round(time.time() - widget["start_time"], 2)
+            token, error = done.get(i, (None, None))
+            if token:
+                results.append(TurnstileResult(token, elapsed, "success", attempts=attempts.get(i), traffic=traffic))
+            else:
+                results.append(TurnstileResult(None, elapsed, "failure", f"Widget error: {error}" if error else reason,
+                                               attempts.get(i), traffic))
+        solved = sum(1 for result in results if result.turnstile_value)
+        logger.info(emoji("SUCCESS" if solved else "ERROR", f"Batch solved {solved}/{len(widgets)} Turnstile widgets"))
+        return results
+
+    @asynccontextmanager
+    async def _page(self, proxy, config: dict):
+        """浏览器池开启时借用常驻浏览器（独立 context），否则为本次求解启动一个浏览器"""
+        pool = get_browser_pool(config)
+        # 同一代理复用已解析的出口 IP / 地区配置 / 指纹
+        geoip = config.get("camoufox").get("geoip", True)
+        launch_options = await resolve_launch_options(config, proxy, headless=self.headless, geoip=geoip)
+        if pool is not None:
+            async with pool.page(proxy, **launch_options) as page:
+                yield page
+            return
+
+        launch_started = time.monotonic()
+        async with AsyncCamoufox(proxy=proxy, **launch_options) as browser:
+            record_span("browser_launch", time.monotonic() - launch_started)
+            await notify_launch()
+            try:
+                yield await self._new_page(browser)
             finally:
                 await browser.close()
-                # 强制垃圾回收
-                gc.collect()
-                # 打印内存使用情况
-                rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
-                rss_mb = rss_kb / 1024 if sys.platform != "darwin" else rss_kb / (1024 * 1024)  # macOS单位不同
-                logger.debug(f"🧠 内存占用: {rss_mb:.2f} MB")
-                logger.debug(f"对象数量追踪: {len(gc.get_objects())}")
-                try:
-                    open_fds = len(os.listdir(f'/proc/{os.getpid()}/fd'))
-                    logger.debug(f"📎 打开文件描述符数: {open_fds}")
-                except Exception:
-                    pass
-
-async def get_turnstile_token(proxy:json,url: str, sitekey: str, action: str = None, cdata: str = None, debug: bool = False, headless: bool = False, useragent: str = None,config:dict = None) -> Optional[str]:
+
+    async def solve(self, proxy:json,url: str, sitekey: str, action: str = None, cdata: str = None,config:dict = None,
+                    time_budget: float = 30.0, click_interval: float = 3.0, start_time: float = None):
+        start_time = start_time or time.time()
+        logger.debug("Attempting to solve URL: %s", url)
+        logger.debug("Proxy: %s,type:%s", proxy, type(proxy))
+        interceptor = get_route_interceptor(config)
+        async with self._page(proxy, config) as page:
+            return await self._solve_on_page(page, start_time, url, sitekey, action, cdata, time_budget, interceptor, click_interval)
+
+    async def solve_batch(self, proxy: json, url: str, sitekey: str, widgets: list, config: dict = None,
+                          time_budget: float = 30.0, click_interval: float = 3.0) -> list:
+        """widgets: [{"action", "cdata", "start_time"}]，同一 URL / sitekey / 代理的多个任务共用一个浏览器页面"""
+        logger.debug("Attempting to batch solve %d widgets for URL: %s", len(widgets), url)
+        interceptor = get_route_interceptor(config)
+        async with self._page(proxy, config) as page:
+            return await self._solve_batch_on_page(page, widgets, url, sitekey, time_budget, interceptor, click_interval)
+
+async def get_turnstile_token(proxy:json,url: str, sitekey: str, action: str = None, cdata: str = None, debug: bool = False, headless: bool = False, useragent: str = None,config:dict = None,
+                              time_budget: float = 30.0, click_interval: float = 3.0) -> Optional[str]:
     solver = TurnstileSolver(debug=debug, useragent=useragent, headless=headless)
-    logger.debug(f"solver: {solver}")
-    result = await solver.solve(proxy=proxy,url=url, sitekey=sitekey, action=action, cdata=cdata,config=config)
+    logger.debug("solver: %s", solver)
+    result = await solver.solve(proxy=proxy,url=url, sitekey=sitekey, action=action, cdata=cdata,config=config,time_budget=time_budget,
+                                click_interval=click_interval)
     return result.__dict__
 
+def _task_result(res: dict) -> dict:
+    return {
+        "token": res["turnstile_value"],
+        "elapsed": res["elapsed_time_seconds"],
+        "status": "success" if res["turnstile_value"] else "failure",
+        "type": "turnstile"
+    }
+
+
+async def _solve_batch(key: tuple, items: list) -> list:
+    """BatchCollector 的求解函数：同一 (websiteURL, websiteKey, 代理) 的任务在一个页面中求解"""
+    url, sitekey, _ = key
+    first = items[0]
+    config = first["config"]
+    turnstile_cfg = config.get("turnstile") or {}
+    solver = TurnstileSolver(debug=False, useragent=None, headless=first["headless"])
+    kwargs = dict(config=config, time_budget=turnstile_cfg.get("time_budget", 30),
+                  click_interval=turnstile_cfg.get("click_interval", 3))
+    if len(items) == 1:
+        # 窗口内只有一个任务时走原有的单组件流程
+        result = await solver.solve(proxy=first["proxy"], url=url, sitekey=sitekey, action=first["action"],
+                                    start_time=first["start_time"], **kwargs)
+        return [_task_result(result.__dict__)]
+    results = await solver.solve_batch(first["proxy"], url, sitekey, items, **kwargs)
+    return [_task_result(result.__dict__) for result in results]
+
+
 async def run(task_data,proxy,config):
-    logger.debug(f"task_data: {task_data}")
+    logger.debug("task_data: %s", task_data)
     url = task_data["websiteURL"]
     sitekey = task_data["websiteKey"]
     action = task_data.get("metadata", {}).get("action")
-    logger.debug(f"action: {sitekey}")
+    logger.debug("action: %s", sitekey)
     headless_str = config.get("camoufox").get("headless", "true")
     headless = headless_str.lower() == "true"
-    logger.debug(f"headless: {headless}")
+    logger.debug("headless: %s", headless)
+    time_budget = (config.get("turnstile") or {}).get("time_budget", 30)
+    click_interval = (config.get("turnstile") or {}).get("click_interval", 3)
+    collector = get_batch_collector("AntiTurnstileTaskProxyLess", config.get("turnstile"), _solve_batch)
+    if collector is not None:
+        # 同一 URL / sitekey / 代理的任务在短窗口内合并，一个页面渲染多个组件
+        return await collector.submit(batch_key(task_data, proxy), {
+            "proxy": proxy,
+            "action": None,
+            "cdata": None,
+            "headless": headless,
+            "config": config,
+            "start_time": time.time(),
+        })
     res = await get_turnstile_token(
         proxy=proxy,
         url=url,
@@ -166,11 +406,16 @@ async def run(task_data,proxy,config):
         debug=False,
         headless=headless,
         useragent=None,
-        config=config
+        config=config,
+        time_budget=time_budget,
+        click_interval=click_interval
     )
-    return {
-        "token": res["turnstile_value"],
-        "elapsed": res["elapsed_time_seconds"],
-        "status": "success" if res["turnstile_value"] else "failure",
-        "type": "turnstile"
-    }
\ No newline at end of file
+    return _task_result(res)
+
+
+async def warm_up(config, proxy=None):
+    """启动预热：解析启动参数（出口 IP / GeoIP / 指纹）并预先启动一个浏览器"""
+    headless = config.get("camoufox").get("headless", "true").lower() == "true"
+    geoip = config.get("camoufox").get("geoip", True)
+    launch_options = await resolve_launch_options(config, proxy, headless=headless, geoip=geoip)
+    return await prelaunch(config, proxy, **launch_options)
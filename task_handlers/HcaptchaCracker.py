@@ -1,17 +1,22 @@
 import asyncio
-import gc
 import json
 import os
-import resource
-import sys
 import time
 
 import yaml
 from camoufox.async_api import AsyncCamoufox
 from hcaptcha_challenger.agent import AgentV, AgentConfig
-from hcaptcha_challenger.models import CaptchaResponse, ChallengeSignal
+from hcaptcha_challenger.models import (
+    CaptchaResponse, ChallengeSignal, ImageAreaSelectChallenge, ImageBinaryChallenge, ImageDragDropChallenge,
+)
+from hcaptcha_challenger.tools.challenge_classifier import ChallengeTypeEnum
 from hcaptcha_challenger.utils import SiteKey
 from common.logger import get_logger,emoji
+from common.metrics import span, record_span
+from framework.browser_pool import get_browser_pool, notify_launch, prelaunch
+from framework.classification_cache import get_classification_cache
+from framework.launch_profile import resolve_launch_options
+from framework.resource_cache import get_route_interceptor
 
 logger = get_logger("HCaptcha")
 # gemini_key = config.get("apikey").get("gemini_api_key")
@@ -21,89 +26,147 @@ logger = get_logger("HCaptcha")
 # else:
 #     raise RuntimeError("config.yaml 缺少 gemini_api_key")
 
+FAILURE_RESULT = {
+    "token": None,
+    "elapsed": 0,
+    "status": "failure",
+    "type": "hcaptcha"
+}
+
+LAUNCH_ARGS = ["--lang=en-US", "--accept-language=en-US,en;q=0.9"]
+
+# RoboticArm 上的模型工具 -> 返回值类型，用于从缓存还原结果
+CACHED_TOOLS = {
+    "_challenge_classifier": ChallengeTypeEnum,
+    "_image_classifier": ImageBinaryChallenge,
+    "_spatial_point_reasoner": ImageAreaSelectChallenge,
+    "_spatial_path_reasoner": ImageDragDropChallenge,
+}
+
+
+def _requester_question(robotic_arm) -> str:
+    payload = getattr(robotic_arm, "captcha_payload", None)
+    question = getattr(payload, "requester_question", None) or {}
+    if isinstance(question, dict):
+        return question.get("en") or json.dumps(question, sort_keys=True, ensure_ascii=False)
+    return str(question)
+
+
+def _attach_cache(agent, cache):
+    """把 Agent 的模型调用替换为带缓存的版本，返回本次求解的缓存会话"""
+    session = cache.session()
+    robotic_arm = agent.robotic_arm
+    for attr, result_type in CACHED_TOOLS.items():
+        tool = getattr(robotic_arm, attr, None)
+        if tool is not None:
+            setattr(robotic_arm, attr, session.wrap(
+                tool, attr.lstrip("_"), result_type, lambda: _requester_question(robotic_arm),
+            ))
+    return session
+
+
+async def _solve_on_page(page, sitekey, gemini_key, models, start_time, interceptor=None, cache=None):
+    session = None
+    try:
+        if interceptor is not None:
+            await interceptor.attach(page)
+        with span("navigation"):
+            await page.goto(SiteKey.as_site_link(sitekey))
+
+        # 初始化 Agent
+        agent_config = AgentConfig(
+            GEMINI_API_KEY=gemini_key,
+            EXECUTION_TIMEOUT = 300,
+            RESPONSE_TIMEOUT = 30,
+            RETRY_ON_FAILURE = True,
+            CHALLENGE_CLASSIFIER_MODEL=models["CHALLENGE_CLASSIFIER_MODEL"],
+            IMAGE_CLASSIFIER_MODEL=models["IMAGE_CLASSIFIER_MODEL"],
+            SPATIAL_POINT_REASONER_MODEL=models["SPATIAL_POINT_REASONER_MODEL"],
+            SPATIAL_PATH_REASONER_MODEL=models["SPATIAL_PATH_REASONER_MODEL"],
+        )
+        agent = AgentV(page=page, agent_config=agent_config)
+        if cache is not None:
+            session = _attach_cache(agent, cache)
+
+        with span("challenge_solve"):
+            await agent.robotic_arm.click_checkbox()
+
+            # 执行挑战并等待结果
+            await agent.wait_for_challenge()
+        elapsed = round(time.time() - start_time, 2)
+        passed = bool(agent.cr_list) and bool(agent.cr_list[-1].is_pass)
+        if session is not None:
+            session.finish(passed)
+            session = None
+        if agent.cr_list:
+            cr = agent.cr_list[-1]
+            cr_data = cr.model_dump()
+            logger.debug(cr_data)
+            token = cr_data["generated_pass_UUID"] if cr_data.get("is_pass") else None
+            logger.info(emoji("SUCCESS", f"Solved Hcaptcha in {elapsed}s -> {str(token)[:10]}..."))
+            return {
+                "token": token,
+                "elapsed": cr_data.get("expiration", 0),
+                "status": "success" if cr_data.get("is_pass") else "failure",
+                "type": "hcaptcha"
+            }
+        else:
+            return dict(FAILURE_RESULT)
+
+    except Exception as e:
+        if session is not None:
+            session.finish(False)
+        logger.error(emoji("ERROR", f"Failed to solve Hcaptcha: {str(e)}"))
+        return dict(FAILURE_RESULT)
+
+
 async def run(task_data, proxy,config):
     models = config.get("hcaptchaCracker")
     headless_str = config.get("camoufox").get("headless", "true")
     headless = headless_str.lower() == "true"
+    geoip = config.get("camoufox").get("geoip", True)
     url = task_data["websiteURL"]
     sitekey = task_data["websiteKey"]
-    print(task_data)
+    logger.debug("task_data: %s", task_data)
     gemini_key = task_data["clientKey"]
     action = task_data.get("metadata", {}).get("action", "")
     cdata = task_data.get("metadata", {}).get("cdata", "")
 
-    logger.debug(f"🌐 Preparing hCaptcha page at {url}")
+    logger.debug("🌐 Preparing hCaptcha page at %s", url)
     start_time = time.time()
-    async with AsyncCamoufox(
-        headless=headless,
-        proxy=proxy,
-        geoip=True,
-        args=["--lang=en-US", "--accept-language=en-US,en;q=0.9"]
-    ) as browser:
-        try:
+    pool = get_browser_pool(config)
+    interceptor = get_route_interceptor(config)
+    cache = get_classification_cache(config)
+    # 同一代理复用已解析的出口 IP / 地区配置 / 指纹
+    launch_options = await resolve_launch_options(config, proxy, headless=headless, geoip=geoip, args=LAUNCH_ARGS)
+    try:
+        if pool is not None:
+            # 复用浏览器池中的常驻浏览器，每个任务独立 context
+            async with pool.page(proxy, **launch_options) as page:
+                return await _solve_on_page(page, sitekey, gemini_key, models, start_time, interceptor, cache)
+
+        launch_started = time.monotonic()
+        async with AsyncCamoufox(proxy=proxy, **launch_options) as browser:
+            record_span("browser_launch", time.monotonic() - launch_started)
+            await notify_launch()
             page = await browser.new_page()
-            await page.goto(SiteKey.as_site_link(sitekey))
+            try:
+                return await _solve_on_page(page, sitekey, gemini_key, models, start_time, interceptor, cache)
+            finally:
+                await page.close()
+    finally:
+        if interceptor is not None:
+            logger.debug("📦 流量统计: %s", interceptor.finish())
 
-            # 初始化 Agent
-            agent_config = AgentConfig(
-                GEMINI_API_KEY=gemini_key,
-                EXECUTION_TIMEOUT = 300,
-                RESPONSE_TIMEOUT = 30,
-                RETRY_ON_FAILURE = True,
-                CHALLENGE_CLASSIFIER_MODEL=models["CHALLENGE_CLASSIFIER_MODEL"],
-                IMAGE_CLASSIFIER_MODEL=models["IMAGE_CLASSIFIER_MODEL"],
-                SPATIAL_POINT_REASONER_MODEL=models["SPATIAL_POINT_REASONER_MODEL"],
-                SPATIAL_PATH_REASONER_MODEL=models["SPATIAL_PATH_REASONER_MODEL"],
-            )
-            agent = AgentV(page=page, agent_config=agent_config)
 
-            await agent.robotic_arm.click_checkbox()
+async def warm_up(config, proxy=None):
+    """启动预热：解析启动参数（出口 IP / GeoIP / 指纹）并预先启动一个浏览器"""
+    headless = config.get("camoufox").get("headless", "true").lower() == "true"
+    geoip = config.get("camoufox").get("geoip", True)
+    launch_options = await resolve_launch_options(config, proxy, headless=headless, geoip=geoip, args=LAUNCH_ARGS)
+    return await prelaunch(config, proxy, **launch_options)
+
 
-            # 执行挑战并等待结果
-            await agent.wait_for_challenge()
-            elapsed = round(time.time() - start_time, 2)
-            if agent.cr_list:
-                cr = agent.cr_list[-1]
-                cr_data = cr.model_dump()
-                logger.debug(cr_data)
-                token = cr_data["generated_pass_UUID"] if cr_data.get("is_pass") else None
-                logger.info(emoji("SUCCESS", f"Solved Hcaptcha in {elapsed}s -> {token[:10]}..."))
-                return {
-                    "token": token,
-                    "elapsed": cr_data.get("expiration", 0),
-                    "status": "success" if cr_data.get("is_pass") else "failure",
-                    "type": "hcaptcha"
-                }
-            else:
-                return {
-                    "token": None,
-                    "elapsed": 0,
-                    "status": "failure",
-                    "type": "hcaptcha"
-                }
-
-        except Exception as e:
-            logger.error(emoji("ERROR", f"Failed to solve Hcaptcha: {str(e)}"))
-            return {
-                "token": None,
-                "elapsed": 0,
-                "status": "failure",
-                "type": "hcaptcha"
-            }
-        finally:
-            await page.close()
-            # 强制垃圾回收
-            gc.collect()
-            # 打印内存使用情况
-            rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
-            rss_mb = rss_kb / 1024 if sys.platform != "darwin" else rss_kb / (1024 * 1024)  # macOS单位不同
-            logger.debug(f"🧠 内存占用: {rss_mb:.2f} MB")
-            logger.debug(f"对象数量追踪: {len(gc.get_objects())}")
-            try:
-                open_fds = len(os.listdir(f'/proc/{os.getpid()}/fd'))
-                logger.debug(f"📎 打开文件描述符数: {open_fds}")
-            except Exception:
-                pass
 # if __name__ == "__main__":
 #     task_data = {
 #         "websiteURL": "https://faucet.n1stake.com/",
@@ -0,0 +1,9 @@
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# 日志写到临时目录，不污染仓库下的 logs/
+os.environ.setdefault("LOG_DIR", os.path.join(tempfile.gettempdir(), "capsolver-test-logs"))
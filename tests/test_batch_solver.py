@@ -0,0 +1,160 @@
+import asyncio
+import time
+
+import pytest
+
+from common.metrics import _current_trace, record_span, start_trace
+from framework.batch_solver import BatchCollector, batch_key
+
+PROXY_A = {"server": "http://proxy-a:8000", "username": "u"}
+PROXY_B = {"server": "http://proxy-b:8000", "username": "u"}
+
+
+def task(url: str = "https://shop.example", sitekey: str = "0x4AAA") -> dict:
+    return {"websiteURL": url, "websiteKey": sitekey}
+
+
+class FakeSolver:
+    """记录每批的 key 和任务；fail 中的任务返回失败，raise_for 中的 key 整批抛异常"""
+
+    def __init__(self, delay: float = 0.01, fail=(), raise_for=()):
+        self.delay = delay
+        self.fail = set(fail)
+        self.raise_for = set(raise_for)
+        self.batches = []
+
+    async def __call__(self, key, items):
+        self.batches.append((key, [item["id"] for item in items]))
+        # 批次在空上下文中运行，不应记录到任何调用方的 trace 里
+        record_span("inside_batch", 1.0)
+        await asyncio.sleep(self.delay)
+        if key in self.raise_for:
+            raise RuntimeError("page crashed")
+        return [
+            {"status": "failure" if item["id"] in self.fail else "success", "token": f"token-{item['id']}"}
+            for item in items
+        ]
+
+
+def test_batch_key_groups_by_url_sitekey_and_proxy():
+    assert batch_key(task(), PROXY_A) == batch_key(task(), dict(PROXY_A, password="other"))
+    assert batch_key(task(), PROXY_A) != batch_key(task(), PROXY_B)
+    assert batch_key(task(), PROXY_A) != batch_key(task(sitekey="0x4BBB"), PROXY_A)
+    assert batch_key(task(), None) != batch_key(task(url="https://other.example"), None)
+
+
+def test_compatible_tasks_share_a_batch_and_results_fan_out():
+    async def main():
+        solver = FakeSolver(fail={2})
+        collector = BatchCollector(solver, window=0.1, max_size=10)
+        key_a, key_b = batch_key(task(), PROXY_A), batch_key(task(), PROXY_B)
+        submissions = [(key_a, 1), (key_a, 2), (key_b, 3), (key_a, 4)]
+        results = await asyncio.gather(*(collector.submit(key, {"id": i}) for key, i in submissions))
+        return solver, collector, results
+
+    solver, collector, results = asyncio.run(main())
+    assert sorted(solver.batches) == sorted([(batch_key(task(), PROXY_A), [1, 2, 4]),
+                                             (batch_key(task(), PROXY_B), [3])])
+    # 每个调用方拿到自己的结果，失败的组件只影响对应任务
+    assert [r["token"] for r in results] == ["token-1", "token-2", "token-3", "token-4"]
+    assert [r["status"] for r in results] == ["success", "failure", "success", "success"]
+    stats = collector.stats()
+    assert (stats["batches"], stats["tasks"], stats["largest"], stats["pending"]) == (2, 4, 3, 0)
+
+
+def test_flush_when_batch_is_full():
+    async def main():
+        solver = FakeSolver()
+        collector = BatchCollector(solver, window=10, max_size=3)
+        started = time.monotonic()
+        await asyncio.gather(*(collector.submit(("k",), {"id": i}) for i in range(3)))
+        return solver, time.monotonic() - started
+
+    solver, elapsed = asyncio.run(main())
+    assert solver.batches == [(("k",), [0, 1, 2])]
+    assert elapsed < 1
+
+
+def test_flush_when_window_expires():
+    async def main():
+        solver = FakeSolver()
+        collector = BatchCollector(solver, window=0.1, max_size=10)
+        first = asyncio.ensure_future(collector.submit(("k",), {"id": 1}))
+        await asyncio.sleep(0.03)
+        second = asyncio.ensure_future(collector.submit(("k",), {"id": 2}))
+        started = time.monotonic()
+        await asyncio.gather(first, second)
+        # 窗口从第一个任务开始计时，之后到达的任务不会延长窗口
+        return solver, time.monotonic() - started
+
+    solver, elapsed = asyncio.run(main())
+    assert solver.batches == [(("k",), [1, 2])]
+    assert elapsed < 0.2
+
+
+def test_batch_exception_fails_only_that_batch():
+    async def main():
+        solver = FakeSolver(raise_for={("bad",)})
+        collector = BatchCollector(solver, window=0.05, max_size=10)
+        return await asyncio.gather(
+            collector.submit(("bad",), {"id": 1}),
+            collector.submit(("bad",), {"id": 2}),
+            collector.submit(("good",), {"id": 3}),
+            return_exceptions=True,
+        )
+
+    bad_1, bad_2, good = asyncio.run(main())
+    assert isinstance(bad_1, RuntimeError) and isinstance(bad_2, RuntimeError)
+    assert good["status"] == "success"
+
+
+def test_missing_results_fail_the_remaining_tasks():
+    async def main():
+        async def short_solver(key, items):
+            return [{"status": "success"}]
+
+        collector = BatchCollector(short_solver, window=0.05, max_size=2)
+        return await asyncio.gather(*(collector.submit(("k",), {"id": i}) for i in range(2)),
+                                    return_exceptions=True)
+
+    first, second = asyncio.run(main())
+    assert first == {"status": "success"}
+    assert isinstance(second, RuntimeError)
+
+
+def test_cancelled_task_is_dropped_before_flush():
+    async def main():
+        solver = FakeSolver()
+        collector = BatchCollector(solver, window=0.1, max_size=10)
+        kept = asyncio.ensure_future(collector.submit(("k",), {"id": 1}))
+        dropped = asyncio.ensure_future(collector.submit(("k",), {"id": 2}))
+        await asyncio.sleep(0.01)
+        dropped.cancel()
+        result = await kept
+        with pytest.raises(asyncio.CancelledError):
+            await dropped
+        return solver, result
+
+    solver, result = asyncio.run(main())
+    assert solver.batches == [(("k",), [1])]
+    assert result["token"] == "token-1"
+
+
+def test_batch_runs_outside_the_caller_trace():
+    async def main():
+        collector = BatchCollector(FakeSolver(delay=0.05), window=0.05, max_size=2)
+
+        async def caller(i):
+            trace = start_trace("AntiTurnstileTaskProxyLess", None)
+            await collector.submit(("k",), {"id": i})
+            return trace
+
+        traces = await asyncio.gather(caller(1), caller(2))
+        return traces, _current_trace.get()
+
+    traces, outer = asyncio.run(main())
+    assert outer is None
+    for trace in traces:
+        assert "inside_batch" not in trace.spans
+        assert set(trace.spans) == {"batch_wait", "batch_solve"}
+        assert trace.spans["batch_solve"] >= 0.05
@@ -0,0 +1,162 @@
+import asyncio
+import math
+import time
+
+import pytest
+
+from core.cancellation import CANCELLED, TIMEOUT, CancellationManager, TaskInterrupted
+from core.concurrency import ConcurrencyLimiter
+from core.scheduler import DeadlineScheduler, ScheduledTask
+
+
+def make_item(task_id: str, task_type: str = "SlowType", deadline: float = math.inf) -> ScheduledTask:
+    return ScheduledTask(deadline, 0, {"taskId": task_id, "type": task_type}, None, time.monotonic())
+
+
+def make_manager(**kwargs) -> CancellationManager:
+    return CancellationManager(DeadlineScheduler(ConcurrencyLimiter(4)), **kwargs)
+
+
+def test_result_passes_through():
+    async def main():
+        manager = make_manager(hard_timeouts={"SlowType": 1})
+
+        async def handler():
+            return {"status": "success"}
+
+        return await manager.execute(make_item("t1"), handler()), manager
+
+    result, manager = asyncio.run(main())
+    assert result == {"status": "success"}
+    assert manager.running == {}
+
+
+def test_cancel_running_task_runs_teardown():
+    events = []
+
+    async def main():
+        manager = make_manager(hard_timeouts={"SlowType": 5})
+
+        async def handler():
+            try:
+                await asyncio.sleep(10)
+            finally:
+                events.append("teardown")
+
+        worker = asyncio.ensure_future(manager.execute(make_item("t1"), handler()))
+        await asyncio.sleep(0.05)
+        assert manager.cancel("t1") == "running"
+        with pytest.raises(TaskInterrupted) as info:
+            await worker
+        return manager, info.value
+
+    manager, error = asyncio.run(main())
+    assert error.reason == CANCELLED
+    assert events == ["teardown"]
+    stats = manager.stats()
+    assert (stats["cancelled_running"], stats["stuck"], stats["running"]) == (1, 0, 0)
+    assert 4.5 < manager.reclaimed_seconds <= 5
+
+
+def test_cancel_is_bounded_by_grace_when_handler_ignores_it():
+    swallowed = []
+
+    async def main():
+        # 类型没有硬超时：取消后只能靠 grace 释放执行位
+        manager = make_manager(grace=0.2)
+
+        async def stubborn():
+            # 在远超 grace 的时间内吞掉所有取消
+            release_at = time.monotonic() + 0.8
+            while time.monotonic() < release_at:
+                try:
+                    await asyncio.sleep(0.05)
+                except asyncio.CancelledError:
+                    swallowed.append(time.monotonic())
+            return "late"
+
+        runner_done = asyncio.Event()
+        worker = asyncio.ensure_future(manager.execute(make_item("t1"), stubborn()))
+        await asyncio.sleep(0.05)
+        manager.running["t1"].runner.add_done_callback(lambda _: runner_done.set())
+        cancelled_at = time.monotonic()
+        assert manager.cancel("t1") == "running"
+        with pytest.raises(TaskInterrupted) as info:
+            await worker
+        waited = time.monotonic() - cancelled_at
+        # 被放弃的协程稍后自行结束，不影响已释放的执行位
+        await asyncio.wait_for(runner_done.wait(), 2)
+        return manager, info.value, waited
+
+    manager, error, waited = asyncio.run(main())
+    assert error.reason == CANCELLED
+    assert 0.15 < waited < 0.5
+    assert len(swallowed) >= 2
+    stats = manager.stats()
+    assert (stats["stuck"], stats["cancelled_running"], stats["running"]) == (1, 1, 0)
+
+
+def test_hard_timeout_interrupts_handler():
+    async def main():
+        manager = make_manager(hard_timeouts={"SlowType": 0.1}, grace=0.5)
+
+        async def handler():
+            await asyncio.sleep(10)
+
+        started = time.monotonic()
+        with pytest.raises(TaskInterrupted) as info:
+            await manager.execute(make_item("t1"), handler())
+        return manager, info.value, time.monotonic() - started
+
+    manager, error, elapsed = asyncio.run(main())
+    assert error.reason == TIMEOUT
+    assert elapsed < 0.5
+    assert manager.stats()["timeouts"] == 1
+
+
+def test_deadline_caps_hard_timeout():
+    manager = make_manager(hard_timeouts={"SlowType": 300})
+    item = make_item("t1", deadline=time.monotonic() + 2)
+    assert 1 < manager.timeout_for(item) <= 2
+    assert make_manager().timeout_for(make_item("t2")) is None
+
+
+def test_cancel_queued_task_calls_on_dequeue():
+    dequeued = []
+
+    async def main():
+        manager = make_manager(hard_timeouts={"SlowType": 10}, on_dequeue=dequeued.append)
+        await manager.scheduler.submit({"taskId": "t1", "type": "SlowType"}, None)
+        await manager.scheduler.submit({"taskId": "t2", "type": "SlowType"}, None)
+        state = manager.cancel("t1")
+        return manager, state, manager.cancel("missing")
+
+    manager, state, missing = asyncio.run(main())
+    assert (state, missing) == ("queued", "unknown")
+    assert [item.task["taskId"] for item in dequeued] == ["t1"]
+    assert manager.scheduler.queued() == 1
+    assert (manager.cancelled_queued, manager.cancel_misses) == (1, 1)
+    assert manager.reclaimed_seconds == 10
+
+
+def test_hung_presolve_hits_hard_timeout_and_frees_slot():
+    async def main():
+        scheduler = DeadlineScheduler(ConcurrencyLimiter(2))
+        manager = CancellationManager(scheduler, hard_timeouts={"AntiTurnstileTaskProxyLess": 0.1}, grace=0.1)
+
+        async def hung():
+            await asyncio.sleep(10)
+
+        # 与 ws_client.presolve 相同的路径：try_start -> execute -> done
+        item = scheduler.try_start({"taskId": "presolve-0", "type": "AntiTurnstileTaskProxyLess"}, None)
+        in_use = scheduler.limiter.in_use
+        try:
+            with pytest.raises(TaskInterrupted) as excinfo:
+                await manager.execute(item, hung())
+        finally:
+            await scheduler.done(item)
+        return in_use, excinfo.value.reason, scheduler, manager
+
+    in_use, reason, scheduler, manager = asyncio.run(main())
+    assert (in_use, reason, manager.timeouts) == (1, TIMEOUT, 1)
+    assert scheduler.limiter.in_use == 0 and scheduler.running == {}
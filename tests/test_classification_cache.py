@@ -0,0 +1,110 @@
+import random
+import time
+from enum import Enum
+
+from PIL import Image, ImageFilter
+
+from framework.classification_cache import ClassificationCache, normalize_prompt, perceptual_hash
+
+
+class Answer:
+    """模拟 hcaptcha_challenger 的 pydantic 返回值"""
+
+    def __init__(self, labels):
+        self.labels = labels
+
+    def model_dump(self, mode=None):
+        return {"labels": self.labels}
+
+
+class Verdict(Enum):
+    YES = "yes"
+    NO = "no"
+
+
+class FakeTool:
+    def __init__(self, result):
+        self.result = result
+        self.calls = 0
+
+    def invoke(self, challenge_screenshot, **kwargs):
+        self.calls += 1
+        return self.result
+
+
+def challenge_image(path, seed: int = 1, size=(300, 200), fmt="PNG"):
+    """类似照片的挑战图片：随机色块放大后模糊，没有大片纯色"""
+    rnd = random.Random(seed)
+    base = Image.new("RGB", (12, 8))
+    base.putdata([tuple(rnd.randrange(256) for _ in range(3)) for _ in range(96)])
+    image = base.resize((300, 200), Image.Resampling.BICUBIC).filter(ImageFilter.GaussianBlur(3))
+    image.resize(size).save(path, fmt)
+    return path
+
+
+def test_perceptual_hash_survives_reencoding(tmp_path):
+    original = perceptual_hash(challenge_image(tmp_path / "a.png"))
+    # 重新编码为 JPEG 并轻微缩放后哈希不变
+    assert perceptual_hash(challenge_image(tmp_path / "b.jpg", size=(290, 194), fmt="JPEG")) == original
+    assert perceptual_hash(challenge_image(tmp_path / "c.png", seed=2)) != original
+    assert normalize_prompt("  Please click on the CAT! ") == "please click on the cat"
+
+
+def test_hit_miss_and_invalidation(tmp_path):
+    cache = ClassificationCache(path=str(tmp_path / "answers.db"))
+    tool = FakeTool(Answer(["cat"]))
+    image = challenge_image(tmp_path / "a.png")
+    reencoded = challenge_image(tmp_path / "b.jpg", size=(290, 194), fmt="JPEG")
+
+    session = cache.session()
+    cached = session.wrap(tool, "ImageClassifier", Answer, lambda: "Click on the cat")
+    assert cached.invoke(image, model="m1").labels == ["cat"]
+    assert cached.invoke(reencoded, model="m1").labels == ["cat"]
+    assert (tool.calls, cache.hits, cache.misses) == (1, 1, 1)
+    # 模型或题目不同时不命中
+    cached.invoke(image, model="m2")
+    cached.invoke(image, model="m1", auxiliary_information="dogs only")
+    assert (tool.calls, cache.misses) == (3, 3)
+
+    # 求解成功时保留答案
+    session.finish(True)
+    assert cache.invalidated == 0
+    cached.invoke(image, model="m1")
+    assert tool.calls == 3
+
+    # 求解失败时作废本次用到的答案，下次重新调用模型
+    session.finish(False)
+    assert cache.invalidated == 1
+    cached.invoke(image, model="m1")
+    assert (tool.calls, cache.hits, cache.misses) == (4, 2, 4)
+
+
+def test_sqlite_round_trip(tmp_path):
+    path = str(tmp_path / "answers.db")
+    image = challenge_image(tmp_path / "a.png")
+    first = FakeTool(Verdict.YES)
+    ClassificationCache(path=path).session().wrap(first, "BinaryClassifier", Verdict, lambda: "cat").invoke(image)
+
+    # 新进程：内存为空，从 SQLite 读回并还原为原始类型
+    restarted = ClassificationCache(path=path)
+    second = FakeTool(Verdict.NO)
+    session = restarted.session()
+    result = session.wrap(second, "BinaryClassifier", Verdict, lambda: "cat").invoke(image)
+    assert (result, first.calls, second.calls, restarted.hits) == (Verdict.YES, 1, 0, 1)
+
+    # 作废后磁盘上的记录也被删除
+    session.finish(False)
+    assert restarted._db.execute("SELECT COUNT(*) FROM answers").fetchone()[0] == 0
+    ClassificationCache(path=path).session().wrap(second, "BinaryClassifier", Verdict, lambda: "cat").invoke(image)
+    assert second.calls == 1
+
+
+def test_expired_answers_are_not_used(tmp_path):
+    cache = ClassificationCache(ttl=0.01)
+    tool = FakeTool(Verdict.YES)
+    image = challenge_image(tmp_path / "a.png")
+    cached = cache.session().wrap(tool, "BinaryClassifier", Verdict, lambda: "cat")
+    cached.invoke(image)
+    time.sleep(0.05)
+    cached.invoke(image)
+    assert (tool.calls, cache.hits) == (2, 0)
@@ -0,0 +1,44 @@
+from core import concurrency
+from core.concurrency import AdaptiveConcurrency, ConcurrencyLimiter
+from core.system_resources import resource_ceiling
+
+
+def idle_sample(cpu: float) -> dict:
+    return {"cpu_percent": cpu, "available_mb": 8192, "browser_rss_mb": 0,
+            "latency_p50": None, "failure_rate": 0.0}
+
+
+def step(controller: AdaptiveConcurrency, cpu: float) -> int:
+    sample = idle_sample(cpu)
+    sample["cpu_smoothed"] = controller._smooth_cpu(cpu)
+    return controller.next_limit(sample)
+
+
+def test_default_ceiling_is_resource_derived(monkeypatch):
+    monkeypatch.setattr(concurrency, "resource_ceiling", lambda browser_mb, reserve_mb: 12)
+    assert AdaptiveConcurrency(ConcurrencyLimiter(3)).ceiling == 12
+    # 不低于初始并发；显式配置的上限照常生效
+    assert AdaptiveConcurrency(ConcurrencyLimiter(20)).ceiling == 20
+    assert AdaptiveConcurrency(ConcurrencyLimiter(3), ceiling=4).ceiling == 4
+    assert resource_ceiling(browser_mb=512, reserve_mb=0) >= 1
+
+
+def test_controller_grows_past_initial_limit_when_saturated():
+    limiter = ConcurrencyLimiter(2)
+    controller = AdaptiveConcurrency(limiter, ceiling=4)
+    limiter.in_use = limiter.limit
+    assert step(controller, 20) == 3
+    limiter.limit = limiter.in_use = 4
+    assert step(controller, 20) == 4
+
+
+def test_single_cpu_spike_does_not_halve_concurrency():
+    limiter = ConcurrencyLimiter(8)
+    controller = AdaptiveConcurrency(limiter, ceiling=8, max_cpu_percent=90, cpu_smoothing=0.5)
+    assert step(controller, 50) == 8
+    # 单次尖峰：平滑后 75%，不下调
+    assert step(controller, 100) == 8
+    assert step(controller, 50) == 8
+    # 持续高负载：平滑值越过阈值后才按比例下调
+    assert step(controller, 100) == 8
+    assert step(controller, 100) == 4
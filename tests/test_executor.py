@@ -0,0 +1,115 @@
+import asyncio
+import base64
+import os
+import threading
+import types
+
+import pytest
+
+from core import executor
+from core.executor import ExecutionEngine, decode_images
+
+PNG = b"\x89PNG\r\n\x1a\n" + bytes(range(256)) * 8
+
+
+def make_handler(task_type: str, run, mode: str = "thread"):
+    module = types.ModuleType(task_type)
+    module.run = run
+    module.EXECUTOR = mode
+    return types.SimpleNamespace(task_type=task_type, module=module, run=run)
+
+
+def describe(task: dict) -> dict:
+    images = task.get("decoded_images") or []
+    return {
+        "pid": os.getpid(),
+        "thread": threading.current_thread().name,
+        "images": [bytes(image) for image in images],
+        "fields": sorted(k for k in task if k != "decoded_images"),
+    }
+
+
+def crash_once(task: dict) -> dict:
+    marker = task["marker"]
+    if not os.path.exists(marker):
+        open(marker, "w").close()
+        os._exit(1)
+    return describe(task)
+
+
+@pytest.fixture
+def fork_handlers(monkeypatch):
+    """fork 出来的子进程继承这里登记的处理器，不需要在 task_handlers 下放测试模块"""
+    if "fork" not in __import__("multiprocessing").get_all_start_methods():
+        pytest.skip("需要 fork 启动方式")
+    registered = {}
+    monkeypatch.setattr(executor, "_process_handlers", registered)
+    return registered
+
+
+def test_decode_images_accepts_data_urls_and_skips_garbage():
+    encoded = base64.b64encode(PNG).decode()
+    task = {"body": "data:image/png;base64," + encoded, "images": [encoded, 42, "!!not base64!!"]}
+    assert decode_images(task) == [PNG, PNG]
+
+
+def test_thread_mode_runs_in_handler_pool_with_decoded_images():
+    async def main():
+        engine = ExecutionEngine(thread_workers=1)
+        try:
+            handler = make_handler("Echo", describe)
+            return engine.mode_for(handler), await engine.run(handler, {"body": base64.b64encode(PNG).decode()})
+        finally:
+            engine.shutdown()
+
+    mode, result = asyncio.run(main())
+    assert mode == "thread"
+    assert result["pid"] == os.getpid()
+    assert result["thread"].startswith("handler")
+    assert result["images"] == [PNG]
+
+
+def test_config_mode_overrides_module_declaration():
+    engine = ExecutionEngine(handler_modes={"Echo": "process"})
+    assert engine.mode_for(make_handler("Echo", describe, mode="thread")) == "process"
+    assert engine.mode_for(make_handler("Other", describe, mode="process")) == "process"
+    assert engine.mode_for(make_handler("Other", describe, mode="bogus")) == "thread"
+
+
+def test_process_mode_reads_images_from_shared_memory(fork_handlers):
+    handler = make_handler("Echo", describe, mode="process")
+    fork_handlers["Echo"] = handler.module
+
+    async def main():
+        engine = ExecutionEngine(process_workers=1, start_method="fork")
+        try:
+            await engine.warm_up([handler])
+            encoded = base64.b64encode(PNG).decode()
+            return await engine.run(handler, {"taskId": "t1", "body": encoded, "images": [encoded]})
+        finally:
+            engine.shutdown()
+
+    result = asyncio.run(main())
+    assert result["pid"] != os.getpid()
+    assert result["images"] == [PNG, PNG]
+    # 图片原文不再随任务序列化给子进程
+    assert result["fields"] == ["taskId"]
+
+
+def test_broken_process_pool_is_rebuilt_and_task_retried(fork_handlers, tmp_path):
+    handler = make_handler("Crash", crash_once, mode="process")
+    fork_handlers["Crash"] = handler.module
+
+    async def main():
+        engine = ExecutionEngine(process_workers=1, start_method="fork")
+        try:
+            await engine.warm_up([handler])
+            before = engine._process_pool
+            result = await engine.run(handler, {"taskId": "t1", "marker": str(tmp_path / "crashed")})
+            return result, before, engine._process_pool
+        finally:
+            engine.shutdown()
+
+    result, before, after = asyncio.run(main())
+    assert result["pid"] != os.getpid()
+    assert after is not None and after is not before
@@ -0,0 +1,74 @@
+import asyncio
+
+from core.concurrency import ConcurrencyLimiter
+from core.flow_control import CreditManager
+
+TURNSTILE = "AntiTurnstileTaskProxyLess"
+HCAPTCHA = "HcaptchaCracker"
+
+
+class FakeOutbound:
+    def __init__(self):
+        self.messages = []
+
+    async def send(self, message: dict):
+        self.messages.append(message)
+
+
+def make_manager(limit: int = 2, type_limits=None, enabled: bool = True, min_interval: float = 0.1):
+    return CreditManager(ConcurrencyLimiter(limit), [TURNSTILE, HCAPTCHA], type_limits=type_limits,
+                         enabled=enabled, min_interval=min_interval)
+
+
+def test_acquire_rejects_without_credit_and_release_restores_it():
+    manager = make_manager(limit=2, type_limits={HCAPTCHA: 1})
+    assert manager.credits() == {TURNSTILE: 2, HCAPTCHA: 1}
+
+    assert manager.try_acquire(HCAPTCHA)
+    # 类型额度用完，全局还有空位
+    assert not manager.try_acquire(HCAPTCHA)
+    assert manager.credits() == {TURNSTILE: 1, HCAPTCHA: 0}
+    assert manager.try_acquire(TURNSTILE)
+    assert not manager.try_acquire(TURNSTILE)
+    assert manager.rejected == 2
+    # 被拒绝的任务不占用额度
+    assert manager.outstanding == {HCAPTCHA: 1, TURNSTILE: 1}
+
+    manager.release(HCAPTCHA)
+    assert manager.credits() == {TURNSTILE: 1, HCAPTCHA: 1}
+    manager.release(TURNSTILE)
+    assert manager.outstanding == {}
+    assert manager.credits() == {TURNSTILE: 2, HCAPTCHA: 1}
+
+
+def test_push_mode_never_rejects():
+    manager = make_manager(limit=1, enabled=False)
+    assert all(manager.try_acquire(TURNSTILE) for _ in range(3))
+    assert manager.rejected == 0 and manager.outstanding == {TURNSTILE: 3}
+
+
+def test_release_sends_update_immediately_and_acquires_are_coalesced():
+    async def main():
+        manager = make_manager(limit=4, min_interval=0.5)
+        outbound = FakeOutbound()
+        runner = asyncio.create_task(manager.run(outbound))
+        await asyncio.sleep(0.01)
+        # 占用额度的变化在 min_interval 内合并成一次
+        for _ in range(3):
+            manager.try_acquire(TURNSTILE)
+            await asyncio.sleep(0.01)
+        after_acquire = len(outbound.messages)
+        # 释放执行位立即上报，不等 min_interval
+        manager.release(TURNSTILE)
+        await asyncio.sleep(0.05)
+        runner.cancel()
+        await asyncio.gather(runner, return_exceptions=True)
+        return after_acquire, outbound.messages
+
+    after_acquire, messages = asyncio.run(main())
+    # 连接建立后的完整额度
+    assert after_acquire == 1
+    assert messages[0]["credits"] == {TURNSTILE: 4, HCAPTCHA: 4}
+    assert len(messages) == 2
+    assert messages[-1]["credits"] == {TURNSTILE: 2, HCAPTCHA: 2}
+    assert messages[-1]["outstanding"] == 2
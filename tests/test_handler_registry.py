@@ -0,0 +1,94 @@
+import asyncio
+import os
+import sys
+import uuid
+
+import pytest
+
+from core.handler_registry import HandlerRegistry
+
+HANDLER = """
+def run(task):
+    return {"version": %d}
+"""
+
+
+@pytest.fixture
+def handler_dir(tmp_path, monkeypatch):
+    """临时处理器包，包名唯一，不和其他测试共用 sys.modules"""
+    package = f"handlers_{uuid.uuid4().hex[:8]}"
+    path = tmp_path / package
+    path.mkdir()
+    (path / "__init__.py").write_text("")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    yield path
+    for name in [name for name in sys.modules if name.startswith(package)]:
+        del sys.modules[name]
+
+
+def write_handler(path, body: str, mtime_offset: float = 0):
+    path.write_text(body)
+    mtime = os.path.getmtime(path) + mtime_offset
+    os.utime(path, (mtime, mtime))
+
+
+def test_reload_only_when_mtime_changes(handler_dir):
+    handler = handler_dir / "Echo.py"
+    write_handler(handler, HANDLER % 1)
+    registry = HandlerRegistry(str(handler_dir), check_interval=0)
+    first = registry.register("Echo")
+    assert registry.get("Echo") is first
+
+    # 内容变了但 mtime 没变：不重新加载
+    stat = os.stat(handler)
+    handler.write_text(HANDLER % 2)
+    os.utime(handler, (stat.st_atime, stat.st_mtime))
+    assert registry.get("Echo").run({}) == {"version": 1}
+
+    write_handler(handler, HANDLER % 3, mtime_offset=10)
+    reloaded = registry.get("Echo")
+    assert reloaded is not first
+    assert reloaded.run({}) == {"version": 3}
+
+
+def test_broken_reload_keeps_previous_version(handler_dir):
+    handler = handler_dir / "Echo.py"
+    write_handler(handler, HANDLER % 1)
+    registry = HandlerRegistry(str(handler_dir), check_interval=0)
+    registry.register("Echo")
+
+    write_handler(handler, "def run(task):\n    return (\n", mtime_offset=10)
+    entry = registry.get("Echo")
+    assert entry.run({}) == {"version": 1}
+    # 同一个有问题的版本不会每次都重新尝试加载
+    assert entry.mtime == os.path.getmtime(handler)
+
+
+def test_check_interval_throttles_stat_calls(handler_dir):
+    handler = handler_dir / "Echo.py"
+    write_handler(handler, HANDLER % 1)
+    registry = HandlerRegistry(str(handler_dir), check_interval=3600)
+    registry.register("Echo")
+    write_handler(handler, HANDLER % 2, mtime_offset=10)
+    assert registry.get("Echo").run({}) == {"version": 1}
+
+
+def test_preload_parallel_retries_sequentially_and_skips_missing(handler_dir, monkeypatch):
+    for name in ("A", "B"):
+        write_handler(handler_dir / f"{name}.py", HANDLER % 1)
+    registry = HandlerRegistry(str(handler_dir))
+    register = registry.register
+    calls = []
+
+    def flaky_register(task_type):
+        calls.append(task_type)
+        # 模拟并行导入时的模块锁冲突：每个类型第一次失败
+        if calls.count(task_type) == 1:
+            raise RuntimeError(f"模块加载失败: {task_type}: deadlock detected")
+        return register(task_type)
+
+    monkeypatch.setattr(registry, "register", flaky_register)
+    loaded = asyncio.run(registry.preload_parallel(["A", "Missing", "B"]))
+    assert loaded == ["A", "B"]
+    assert sorted(calls) == ["A", "A", "B", "B", "Missing", "Missing"]
+    assert sorted(registry.task_types()) == ["A", "B"]
@@ -0,0 +1,99 @@
+import asyncio
+import json
+
+from core import journal as journal_module
+from core.journal import Backoff, ResultJournal
+from core.outbound import OutboundWriter
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.frames = []
+
+    async def send(self, payload, text=None):
+        self.frames.append(json.loads(payload))
+
+
+def result(task_id: str) -> dict:
+    return {"type": "task_result", "taskId": task_id, "errorId": 0, "result": {"token": "x"}}
+
+
+def connect(journal: ResultJournal, feed=None) -> list:
+    """模拟一次连接：启动出站写者和结果日志的发送循环，返回这次连接发出的帧"""
+    async def main():
+        ws = FakeWebSocket()
+        writer = OutboundWriter(ws, batch_window=0, on_sent=journal.mark_sent)
+        tasks = [asyncio.create_task(writer.run()), asyncio.create_task(journal.pump(writer))]
+        if feed is not None:
+            await feed()
+        await asyncio.sleep(0.05)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        return ws.frames
+
+    return asyncio.run(main())
+
+
+def test_results_completed_while_disconnected_are_replayed():
+    journal = ResultJournal()
+    # 断线期间完成的任务
+    journal.add(result("t1"))
+    journal.add(result("t2"))
+    frames = connect(journal)
+    assert [frame["taskId"] for frame in frames] == ["t1", "t2"]
+    assert journal.stats() == {"pending": 0, "dropped": 0, "replayed": 2}
+
+
+def test_delivered_results_are_not_sent_again():
+    journal = ResultJournal()
+    journal.add(result("t1"))
+    connect(journal)
+    assert journal.seen("t1")
+
+    async def duplicate():
+        # 同一任务重连后又跑完一次（例如服务端重发）
+        journal.add(result("t1"))
+        journal.add(result("t2"))
+
+    frames = connect(journal, duplicate)
+    assert [frame["taskId"] for frame in frames] == ["t2"]
+    assert journal.stats()["pending"] == 0
+
+
+def test_pending_results_survive_restart(tmp_path):
+    path = str(tmp_path / "journal" / "results.jsonl")
+    journal = ResultJournal(path=path)
+    journal.add(result("t1"))
+    journal.add(result("t2"))
+    journal.mark_sent([result("t1")])
+
+    restored = ResultJournal(path=path)
+    assert list(restored.pending) == ["t2"]
+    # 恢复时压缩日志，只保留未送达的结果
+    with open(path) as f:
+        assert [json.loads(line)["message"]["taskId"] for line in f] == ["t2"]
+    assert [frame["taskId"] for frame in connect(restored)] == ["t2"]
+
+
+def test_journal_is_bounded():
+    journal = ResultJournal(max_entries=2)
+    for task_id in ("t1", "t2", "t3"):
+        journal.add(result(task_id))
+    assert list(journal.pending) == ["t2", "t3"]
+    assert journal.dropped == 1
+
+
+def test_backoff_doubles_up_to_maximum_and_resets(monkeypatch):
+    # 取抖动区间的上界，检查退避上限的增长
+    monkeypatch.setattr(journal_module.random, "uniform", lambda low, high: high)
+    backoff = Backoff(base=1, maximum=10)
+    assert [backoff.next_delay() for _ in range(6)] == [1, 2, 4, 8, 10, 10]
+    backoff.reset()
+    assert backoff.next_delay() == 1
+
+
+def test_backoff_jitter_stays_within_bounds():
+    backoff = Backoff(base=0.5, maximum=4)
+    for attempt in range(40):
+        assert 0 <= backoff.next_delay() <= min(4, 0.5 * 2 ** attempt)
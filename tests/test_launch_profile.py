@@ -0,0 +1,94 @@
+import asyncio
+import dataclasses
+import json
+
+from framework import launch_profile
+from framework.launch_profile import LaunchProfileCache
+
+
+@dataclasses.dataclass
+class FakeFingerprint:
+    userAgent: str
+
+
+def test_launch_options_hand_exit_ip_to_camoufox(monkeypatch):
+    calls = []
+
+    def fake_resolve(proxy, fingerprint_options, headless, fingerprint=None):
+        calls.append((fingerprint_options, headless))
+        return "203.0.113.7", {"fingerprint": len(calls)}
+
+    monkeypatch.setattr(launch_profile, "_resolve", fake_resolve)
+    monkeypatch.delenv("DISPLAY", raising=False)
+    proxy = {"server": "http://127.0.0.1:8080"}
+
+    async def main():
+        cache = LaunchProfileCache(ttl=1800)
+        first = await cache.launch_options(proxy, headless=True, geoip=True, os="windows", window=(1280, 720))
+        second = await cache.launch_options(proxy, headless=False, geoip=True)
+        untouched = await cache.launch_options(proxy, headless=True, geoip=False)
+        return cache, first, second, untouched
+
+    cache, first, second, untouched = asyncio.run(main())
+    # 出口 IP 以 geoip=<IP> 交给 Camoufox，地区、WebRTC 和 IPv6 设置走它自己的 geoip 流程
+    assert first["geoip"] == "203.0.113.7"
+    assert first["fingerprint"] == {"fingerprint": 1}
+    assert "i_know_what_im_doing" not in first and "config" not in first
+    assert calls == [({"os": "windows", "window": (1280, 720)}, True)]
+    # 同一代理命中缓存，不再解析
+    assert second["fingerprint"] == first["fingerprint"]
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert untouched == {"headless": True, "geoip": False}
+
+
+def test_resolve_failure_falls_back_to_camoufox(monkeypatch):
+    def failing_resolve(proxy, fingerprint_options, headless, fingerprint=None):
+        raise OSError("proxy unreachable")
+
+    monkeypatch.setattr(launch_profile, "_resolve", failing_resolve)
+    options = asyncio.run(LaunchProfileCache().launch_options(None, headless=True, geoip=True))
+    assert options == {"headless": True, "geoip": True}
+
+
+def test_zero_ttl_requeries_exit_ip_but_keeps_fingerprint(monkeypatch):
+    exit_ips = iter(["203.0.113.7", "198.51.100.9"])
+    reused = []
+
+    def fake_resolve(proxy, fingerprint_options, headless, fingerprint=None):
+        reused.append(fingerprint)
+        return next(exit_ips), fingerprint or FakeFingerprint("ua-1")
+
+    monkeypatch.setattr(launch_profile, "_resolve", fake_resolve)
+    proxy = {"server": "http://127.0.0.1:8080"}
+
+    async def main():
+        # 轮换 IP 的代理：默认不复用出口 IP
+        cache = LaunchProfileCache()
+        first = await cache.launch_options(proxy, headless=True, geoip=True)
+        second = await cache.launch_options(proxy, headless=True, geoip=True)
+        return cache, first, second
+
+    cache, first, second = asyncio.run(main())
+    assert (first["geoip"], second["geoip"]) == ("203.0.113.7", "198.51.100.9")
+    assert reused == [None, FakeFingerprint("ua-1")]
+    assert second["fingerprint"] is first["fingerprint"]
+    assert (cache.hits, cache.misses) == (0, 2)
+
+
+def test_profiles_persist_as_json(monkeypatch, tmp_path):
+    monkeypatch.setattr(launch_profile, "_resolve",
+                        lambda proxy, options, headless, fingerprint=None: ("203.0.113.7", FakeFingerprint("ua-1")))
+    monkeypatch.setattr(launch_profile, "_fingerprint_from_dict", lambda data: FakeFingerprint(**data))
+    path = str(tmp_path / "profiles.json")
+    proxy = {"server": "http://127.0.0.1:8080"}
+
+    asyncio.run(LaunchProfileCache(ttl=1800, path=path).launch_options(proxy, headless=True, geoip=True))
+    with open(path) as f:
+        stored = json.load(f)
+    assert stored[0]["exit_ip"] == "203.0.113.7"
+    assert stored[0]["fingerprint"] == {"userAgent": "ua-1"}
+
+    restored = LaunchProfileCache(ttl=1800, path=path)
+    options = asyncio.run(restored.launch_options(proxy, headless=True, geoip=True))
+    assert options["fingerprint"] == FakeFingerprint("ua-1")
+    assert (restored.hits, restored.misses) == (1, 0)
@@ -0,0 +1,62 @@
+import json
+import logging
+
+from common import logger as logger_module
+from common.logger import (
+    ContextFilter, JsonFormatter, SamplingFilter, TextFormatter, emoji, reset_log_context, set_log_context,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def record(level=logging.WARNING, lineno=10, msg="点击失败"):
+    return logging.LogRecord("Anti", level, "task_handlers/AntiTurnstileTaskProxyLess.py", lineno, msg, None, None)
+
+
+def test_sampling_counts_suppressed_records_per_call_site(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(logger_module.time, "monotonic", clock)
+    sampling = SamplingFilter({logging.WARNING: (1.0, 3.0)})
+
+    passed = [sampling.filter(record()) for _ in range(10)]
+    assert passed.count(True) == 3
+    assert sampling.suppressed_total == 7
+    # 其他调用位置和没有规则的级别不受影响
+    assert sampling.filter(record(lineno=11))
+    assert all(sampling.filter(record(level=logging.ERROR)) for _ in range(10))
+
+    # 一秒后补充一个令牌，放行的记录带上被抑制的条数
+    clock.now += 1
+    released = record()
+    assert sampling.filter(released)
+    assert released.suppressed == 7
+    clock.now += 1
+    following = record()
+    assert sampling.filter(following)
+    assert not hasattr(following, "suppressed")
+    assert sampling.suppressed_total == 7
+
+
+def test_formatters_show_suppressed_count_and_task_context():
+    token = set_log_context("task-1", "AntiTurnstileTaskProxyLess", {"server": "http://user:pw@10.0.0.1:8080"})
+    try:
+        entry = record(msg=emoji("WARNING", "点击失败"))
+        ContextFilter().filter(entry)
+    finally:
+        reset_log_context(token)
+    entry.suppressed = 4
+
+    text = TextFormatter(use_emoji=False).format(entry)
+    assert text.endswith("[task-1] 点击失败 (此处已抑制 4 条)")
+
+    data = json.loads(JsonFormatter().format(entry))
+    assert data["msg"] == "点击失败" and data["tag"] == "WARNING"
+    assert (data["taskId"], data["type"], data["suppressed"]) == ("task-1", "AntiTurnstileTaskProxyLess", 4)
+    # 代理只保留地址，不带用户名密码
+    assert data["proxy"] == "10.0.0.1:8080"
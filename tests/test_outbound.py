@@ -0,0 +1,138 @@
+import asyncio
+
+import pytest
+
+from common.metrics import metrics
+from core.journal import ResultJournal
+from core.outbound import OutboundWriter, decode_message
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.frames = []
+
+    async def send(self, payload, text=None):
+        await asyncio.sleep(0.01)
+        # text=True 的 bytes 按 text 帧发送，对端收到的是 str
+        self.frames.append(payload.decode() if text and isinstance(payload, bytes) else payload)
+
+
+def result(task_id: str) -> dict:
+    return {"type": "task_result", "taskId": task_id, "errorId": 0, "result": {"token": "x"}}
+
+
+def run_writer(batch_results: bool, feed):
+    async def main():
+        ws = FakeWebSocket()
+        journal = ResultJournal()
+        writer = OutboundWriter(ws, batch_window=0.01, on_sent=journal.mark_sent)
+        writer.configure(batch_results=batch_results)
+        runner = asyncio.create_task(writer.run())
+        pump = asyncio.create_task(journal.pump(writer))
+        await feed(journal, writer)
+        await asyncio.sleep(0.1)
+        runner.cancel()
+        pump.cancel()
+        await asyncio.gather(runner, pump, return_exceptions=True)
+        return ws, journal
+
+    metrics.reset()
+    return asyncio.run(main())
+
+
+def observed(phase: str, task_type: str, proxy: str) -> int:
+    histogram = metrics.histograms.get((phase, task_type, proxy))
+    return histogram.count if histogram else 0
+
+
+def test_send_phases_recorded_against_task_labels():
+    async def feed(journal, writer):
+        journal.add(result("t1"), ("HcaptchaCracker", "http://p1:8080"))
+        journal.add(result("t2"), ("AntiTurnstileTaskProxyLess", "direct"))
+        # 没有标签的结果（例如进程重启后从磁盘恢复的）只计入汇总
+        journal.add(result("t3"))
+        await writer.send({"type": "status_update"})
+
+    ws, journal = run_writer(True, feed)
+    assert journal.stats()["pending"] == 0
+    for phase in ("serialization", "send"):
+        assert observed(phase, "HcaptchaCracker", "http://p1:8080") == 1
+        assert observed(phase, "AntiTurnstileTaskProxyLess", "direct") == 1
+    assert metrics.values["outbound_send_seconds"].count == 4
+    assert metrics.histograms[("send", "HcaptchaCracker", "http://p1:8080")].sum >= 0.01
+    # 标签不随结果发出
+    assert all("HcaptchaCracker" not in (frame.decode() if isinstance(frame, bytes) else frame) for frame in ws.frames)
+    assert not journal._labels
+
+
+def test_unbatched_results_keep_labels():
+    async def feed(journal, writer):
+        journal.add(result("t1"), ("HcaptchaCracker", "direct"))
+        journal.add(result("t2"), ("HcaptchaCracker", "direct"))
+
+    ws, _ = run_writer(False, feed)
+    assert len(ws.frames) == 2
+    assert observed("send", "HcaptchaCracker", "direct") == 2
+
+
+def drive(writer: OutboundWriter, feed):
+    async def main():
+        runner = asyncio.create_task(writer.run())
+        await feed(writer)
+        await asyncio.sleep(0.1)
+        runner.cancel()
+        await asyncio.gather(runner, return_exceptions=True)
+
+    asyncio.run(main())
+
+
+def test_results_coalesce_and_control_messages_are_not_merged():
+    ws = FakeWebSocket()
+    sent = []
+    writer = OutboundWriter(ws, batch_window=0.02, max_batch=3, on_sent=sent.append)
+    writer.configure(batch_results=True)
+
+    async def feed(writer):
+        for task_id in ("t1", "t2"):
+            await writer.send_result(result(task_id))
+        await writer.send({"type": "status_update"})
+        for task_id in ("t3", "t4", "t5", "t6"):
+            await writer.send_result(result(task_id))
+
+    drive(writer, feed)
+    frames = [decode_message(frame) for frame in ws.frames]
+    # 控制消息之前的结果先成批发出，之后的结果按 max_batch 分批
+    assert [frame["type"] for frame in frames] == ["task_results", "status_update", "task_results", "task_result"]
+    assert [r["taskId"] for r in frames[0]["results"]] == ["t1", "t2"]
+    assert [r["taskId"] for r in frames[2]["results"]] == ["t3", "t4", "t5"]
+    assert frames[3]["taskId"] == "t6"
+    # 只有结果会回调 on_sent，状态消息不会
+    assert [[m["taskId"] for m in batch] for batch in sent] == [["t1", "t2"], ["t3", "t4", "t5"], ["t6"]]
+    assert (writer.frames_sent, writer.results_sent) == (4, 6)
+
+
+def test_results_sent_individually_until_server_acks_batching():
+    ws = FakeWebSocket()
+    writer = OutboundWriter(ws, batch_window=0.02)
+
+    async def feed(writer):
+        for task_id in ("t1", "t2", "t3"):
+            await writer.send_result(result(task_id))
+
+    drive(writer, feed)
+    assert [decode_message(frame)["taskId"] for frame in ws.frames] == ["t1", "t2", "t3"]
+
+
+def test_msgpack_codec_round_trips_through_decode_message():
+    pytest.importorskip("msgpack")
+    ws = FakeWebSocket()
+    writer = OutboundWriter(ws)
+    writer.configure(codec="msgpack")
+
+    async def feed(writer):
+        await writer.send_result(result("t1"))
+
+    drive(writer, feed)
+    assert isinstance(ws.frames[0], bytes)
+    assert decode_message(ws.frames[0]) == result("t1")
+    assert writer.bytes_sent == len(ws.frames[0])
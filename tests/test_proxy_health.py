@@ -0,0 +1,186 @@
+import asyncio
+import time
+
+import pytest
+
+from core.proxy_health import ProxyHealth, ProxyUnavailable, probe
+
+
+class StubProxy:
+    """本地代理替身：HTTP CONNECT 或 SOCKS5，记录连接数和请求的目标"""
+
+    def __init__(self, kind: str = "http", mode: str = "ok", delay: float = 0.0, credentials=None):
+        self.kind = kind
+        self.mode = mode
+        self.delay = delay
+        self.credentials = credentials
+        self.connections = 0
+        self.targets = []
+        self.server = None
+
+    async def __aenter__(self):
+        self.server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        return self
+
+    async def __aexit__(self, *exc):
+        self.server.close()
+        await self.server.wait_closed()
+
+    @property
+    def url(self) -> str:
+        port = self.server.sockets[0].getsockname()[1]
+        scheme = "socks5" if self.kind == "socks5" else "http"
+        return f"{scheme}://127.0.0.1:{port}"
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        try:
+            if self.delay:
+                await asyncio.sleep(self.delay)
+            if self.kind == "socks5":
+                await self._socks5(reader, writer)
+            else:
+                await self._http(reader, writer)
+            await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _http(self, reader, writer):
+        request = await reader.readuntil(b"\r\n\r\n")
+        self.targets.append(request.split()[1].decode())
+        if self.mode == "close":
+            return
+        status = b"407 Proxy Authentication Required" if self.mode == "auth" else b"200 Connection established"
+        writer.write(b"HTTP/1.1 " + status + b"\r\n\r\n")
+
+    async def _socks5(self, reader, writer):
+        _, count = await reader.readexactly(2)
+        methods = await reader.readexactly(count)
+        if self.credentials:
+            if 0x02 not in methods:
+                writer.write(b"\x05\xff")
+                return
+            writer.write(b"\x05\x02")
+            _, user_len = await reader.readexactly(2)
+            user = await reader.readexactly(user_len)
+            pwd = await reader.readexactly((await reader.readexactly(1))[0])
+            ok = (user.decode(), pwd.decode()) == self.credentials
+            writer.write(b"\x01\x00" if ok else b"\x01\x01")
+            if not ok:
+                return
+        else:
+            writer.write(b"\x05\x00")
+        _, _, _, _, host_len = await reader.readexactly(5)
+        host = await reader.readexactly(host_len)
+        port = int.from_bytes(await reader.readexactly(2), "big")
+        self.targets.append(f"{host.decode()}:{port}")
+        writer.write(b"\x05\x00\x00\x01" + bytes(6))
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_probe_http_success():
+    async def main():
+        async with StubProxy() as stub:
+            latency = await probe(stub.url, "example.com:443", timeout=2)
+            return latency, stub.targets
+
+    latency, targets = run(main())
+    assert latency >= 0
+    assert targets == ["example.com:443"]
+
+
+def test_probe_socks5_with_credentials():
+    async def main():
+        async with StubProxy("socks5", credentials=("user", "secret")) as stub:
+            await probe({"server": stub.url, "username": "user", "password": "secret"}, "example.com:443", 2)
+            with pytest.raises(ProxyUnavailable, match="认证失败"):
+                await probe({"server": stub.url, "username": "user", "password": "wrong"}, "example.com:443", 2)
+            return stub.targets
+
+    assert run(main()) == ["example.com:443"]
+
+
+def test_probe_http_auth_failure():
+    async def main():
+        async with StubProxy(mode="auth") as stub:
+            with pytest.raises(ProxyUnavailable, match="认证失败"):
+                await probe(stub.url, "example.com:443", timeout=2)
+
+    run(main())
+
+
+def test_probe_timeout():
+    async def main():
+        async with StubProxy(delay=1.0) as stub:
+            started = time.monotonic()
+            with pytest.raises(ProxyUnavailable, match="超时"):
+                await probe(stub.url, "example.com:443", timeout=0.2)
+            return time.monotonic() - started
+
+    assert run(main()) < 0.8
+
+
+def test_dead_ttl_backoff():
+    async def main():
+        async with StubProxy(mode="close") as stub:
+            health = ProxyHealth(timeout=1, fail_ttl=0.2, max_fail_ttl=0.3)
+            with pytest.raises(ProxyUnavailable):
+                await health.ensure(stub.url)
+            # 失败 TTL 内直接判定不可用，不再探测
+            with pytest.raises(ProxyUnavailable):
+                await health.ensure(stub.url)
+            assert (health.probes, health.fast_failures, stub.connections) == (1, 1, 1)
+            stats = next(iter(health._proxies.values()))
+            first_ttl = stats.dead_until - time.monotonic()
+
+            await asyncio.sleep(0.25)
+            with pytest.raises(ProxyUnavailable):
+                await health.ensure(stub.url)
+            second_ttl = stats.dead_until - time.monotonic()
+            return health, first_ttl, second_ttl, stub.connections
+
+    health, first_ttl, second_ttl, connections = run(main())
+    assert connections == 2
+    assert first_ttl <= 0.2
+    # 连续失败时加倍，但不超过 max_fail_ttl
+    assert 0.2 < second_ttl <= 0.3
+    assert health.stats()["proxies"][0]["state"] == "dead"
+
+
+def test_concurrent_checks_share_one_probe():
+    async def main():
+        async with StubProxy(delay=0.2) as stub:
+            health = ProxyHealth(timeout=2)
+            await asyncio.gather(*(health.ensure(stub.url) for _ in range(5)))
+            # 成功结果在 ok_ttl 内复用
+            await health.ensure(stub.url)
+            return health.probes, stub.connections
+
+    assert run(main()) == (1, 1)
+
+
+def test_probe_target_per_task_type():
+    async def main():
+        async with StubProxy() as stub:
+            health = ProxyHealth(timeout=2, targets={"HcaptchaCracker": "api.hcaptcha.com:443"})
+            await health.ensure(stub.url, "HcaptchaCracker")
+            await health.ensure(stub.url, "AntiTurnstileTaskProxyLess")
+            return stub.targets
+
+    assert run(main()) == ["api.hcaptcha.com:443", "challenges.cloudflare.com:443"]
+
+
+def test_unsupported_scheme_is_not_probed():
+    async def main():
+        health = ProxyHealth(timeout=0.2)
+        # 不可达的 socks4 代理：不探测，也不判定为不可用
+        await health.ensure("socks4://127.0.0.1:9")
+        return health
+
+    health = run(main())
+    assert (health.probes, health.skipped, health.stats()["tracked"]) == (0, 1, 0)
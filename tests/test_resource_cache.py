@@ -0,0 +1,126 @@
+import asyncio
+import time
+
+from framework.resource_cache import ResourceCache, RouteInterceptor
+
+API_JS = "https://challenges.cloudflare.com/turnstile/v0/api.js"
+
+
+class FakeRequest:
+    def __init__(self, url: str, method: str = "GET", resource_type: str = "script"):
+        self.url = url
+        self.method = method
+        self.resource_type = resource_type
+        self.headers = {"user-agent": "test"}
+
+
+class FakeResponse:
+    def __init__(self, status: int, headers: dict, body: bytes):
+        self.status = status
+        self.headers = headers
+        self._body = body
+
+    async def body(self) -> bytes:
+        return self._body
+
+
+class FakeRoute:
+    def __init__(self, request: FakeRequest, response: FakeResponse = None, error: Exception = None):
+        self.request = request
+        self.response = response
+        self.error = error
+        self.fetched_headers = None
+        self.fulfilled = None
+        self.action = None
+
+    async def fetch(self, headers=None):
+        self.fetched_headers = headers
+        if self.error is not None:
+            raise self.error
+        return self.response
+
+    async def fulfill(self, **kwargs):
+        self.action, self.fulfilled = "fulfill", kwargs
+
+    async def abort(self):
+        self.action = "abort"
+
+    async def fallback(self):
+        self.action = "fallback"
+
+
+def interceptor(cache: ResourceCache, stubs=None) -> RouteInterceptor:
+    return RouteInterceptor(cache, [API_JS + "*"], ["*google-analytics.com*"], ["font"], stubs=stubs)
+
+
+def handle(interceptor: RouteInterceptor, route: FakeRoute) -> FakeRoute:
+    asyncio.run(interceptor._handle(route))
+    return route
+
+
+def gzip_response(body: bytes = b"console.log(1)", status: int = 200) -> FakeResponse:
+    return FakeResponse(status, {"content-type": "application/javascript", "content-encoding": "gzip",
+                                 "content-length": "34", "etag": '"v1"'}, body)
+
+
+def test_miss_then_hit_without_encoding_headers(tmp_path):
+    cache = ResourceCache(cache_dir=str(tmp_path))
+    layer = interceptor(cache)
+
+    miss = handle(layer, FakeRoute(FakeRequest(API_JS), gzip_response()))
+    # body 已经解码，转发给页面时不能再声明 gzip
+    assert miss.fulfilled == {"status": 200, "body": b"console.log(1)",
+                              "headers": {"content-type": "application/javascript", "etag": '"v1"'}}
+
+    hit = handle(layer, FakeRoute(FakeRequest(API_JS)))
+    assert hit.fetched_headers is None
+    assert hit.fulfilled["body"] == b"console.log(1)"
+    assert "content-encoding" not in hit.fulfilled["headers"]
+
+    # 另一个进程从磁盘读到同一份缓存
+    disk_hit = handle(interceptor(ResourceCache(cache_dir=str(tmp_path))), FakeRoute(FakeRequest(API_JS)))
+    assert disk_hit.fulfilled["body"] == b"console.log(1)"
+    assert layer.stats.to_dict() == {"cache_hits": 1, "revalidated": 0, "cache_misses": 1, "blocked": 0,
+                                     "stubbed": 0, "bytes_saved": 14}
+
+
+def test_non_200_is_forwarded_but_not_cached():
+    cache = ResourceCache(cache_dir=None)
+    layer = interceptor(cache)
+    route = handle(layer, FakeRoute(FakeRequest(API_JS), gzip_response(b"oops", status=503)))
+    assert route.fulfilled["status"] == 503
+    assert "content-encoding" not in route.fulfilled["headers"]
+    assert asyncio.run(cache.get(API_JS)) is None
+
+
+def test_expired_entry_is_revalidated_with_304():
+    cache = ResourceCache(ttl=60, cache_dir=None)
+    layer = interceptor(cache)
+    handle(layer, FakeRoute(FakeRequest(API_JS), gzip_response()))
+    entry = asyncio.run(cache.get(API_JS))
+    entry.fetched_at = time.time() - 120
+    entry.headers["last-modified"] = "Wed, 01 Jan 2025 00:00:00 GMT"
+
+    route = handle(layer, FakeRoute(FakeRequest(API_JS), FakeResponse(304, {}, b"")))
+    assert route.fetched_headers["if-none-match"] == '"v1"'
+    assert route.fetched_headers["if-modified-since"] == "Wed, 01 Jan 2025 00:00:00 GMT"
+    assert route.fulfilled["body"] == b"console.log(1)"
+    assert cache.fresh(entry)
+    assert (layer.stats.revalidated, layer.stats.cache_misses) == (1, 1)
+
+
+def test_blocked_stubbed_and_passthrough_requests():
+    stub = {"pattern": "https://js.hcaptcha.com/*", "status": 200, "content_type": "application/javascript",
+            "body": b"window.hcaptcha = {}"}
+    layer = interceptor(ResourceCache(cache_dir=None), stubs=[stub])
+
+    assert handle(layer, FakeRoute(FakeRequest("https://www.google-analytics.com/a.js"))).action == "abort"
+    assert handle(layer, FakeRoute(FakeRequest("https://example.com/x.woff2", resource_type="font"))).action == "abort"
+    stubbed = handle(layer, FakeRoute(FakeRequest("https://js.hcaptcha.com/1/api.js")))
+    assert stubbed.fulfilled["body"] == b"window.hcaptcha = {}"
+    # 非 GET 或不在缓存规则内的请求照常发出
+    assert handle(layer, FakeRoute(FakeRequest(API_JS, method="POST"))).action == "fallback"
+    assert handle(layer, FakeRoute(FakeRequest("https://example.com/"))).action == "fallback"
+    # 拦截层自身出错时回退到正常请求
+    assert handle(layer, FakeRoute(FakeRequest(API_JS), error=RuntimeError("boom"))).action == "fallback"
+    assert (layer.stats.blocked, layer.stats.stubbed) == (2, 1)
@@ -0,0 +1,110 @@
+import asyncio
+import math
+import time
+
+import pytest
+
+from core.concurrency import ConcurrencyLimiter
+from core.scheduler import DeadlineScheduler
+
+
+def make_scheduler(**kwargs) -> DeadlineScheduler:
+    return DeadlineScheduler(ConcurrencyLimiter(2), type_timeouts={"HcaptchaCracker": 300}, **kwargs)
+
+
+@pytest.mark.parametrize("field", ["deadline", "timeout"])
+@pytest.mark.parametrize("value", ["soon", [1], {"at": 1}, "nan", "inf", -5])
+def test_invalid_deadline_falls_back_to_type_default(field, value):
+    scheduler = make_scheduler()
+    now = time.monotonic()
+    task = {"taskId": "t1", "type": "HcaptchaCracker", field: value}
+    assert scheduler.deadline_for(task, now) == pytest.approx(now + 300)
+    assert scheduler.validate(task) is None
+    # 没有类型默认值时不限
+    assert scheduler.deadline_for(dict(task, type="Other"), now) == math.inf
+
+
+def test_valid_deadline_and_timeout():
+    scheduler = make_scheduler()
+    now = time.monotonic()
+    assert scheduler.deadline_for({"type": "HcaptchaCracker", "timeout": "30"}, now) == pytest.approx(now + 30)
+    in_ms = (time.time() + 60) * 1000
+    assert scheduler.deadline_for({"deadline": in_ms}, now) == pytest.approx(now + 60, abs=0.5)
+    assert scheduler.deadline_for({"deadline": str(time.time() + 60)}, now) == pytest.approx(now + 60, abs=0.5)
+
+
+def test_validate_rejects_tasks_without_id_or_type():
+    assert DeadlineScheduler.validate({"type": "HcaptchaCracker"})
+    assert DeadlineScheduler.validate({"taskId": "t1"})
+    assert DeadlineScheduler.validate(["not", "a", "dict"])
+    assert DeadlineScheduler.validate({"taskId": 0, "type": "HcaptchaCracker"}) is None
+
+
+def test_submit_with_invalid_deadline_is_queued():
+    async def main():
+        scheduler = make_scheduler()
+        accepted = await scheduler.submit({"taskId": "t1", "type": "HcaptchaCracker", "deadline": "soon"}, None)
+        item = await scheduler.get()
+        return accepted, item
+
+    accepted, item = asyncio.run(main())
+    assert accepted
+    assert item.task["taskId"] == "t1"
+    assert item.deadline != math.inf
+
+
+def test_blocked_at_marks_wait_for_global_slot():
+    async def main():
+        # 类型预算大于全局上限，第三个任务只卡在全局执行位上
+        scheduler = make_scheduler(type_limits={"HcaptchaCracker": 5})
+        for task_id in ("t1", "t2", "t3"):
+            await scheduler.submit({"taskId": task_id, "type": "HcaptchaCracker"}, None)
+        first, second = await scheduler.get(), await scheduler.get()
+        waiter = asyncio.create_task(scheduler.get())
+        await asyncio.sleep(0.1)
+        await scheduler.done(first)
+        third = await waiter
+        return first, second, third, time.monotonic()
+
+    first, second, third, now = asyncio.run(main())
+    # 有执行位时直接出队，不算执行位等待
+    assert first.blocked_at is None and second.blocked_at is None
+    assert 0.05 < now - third.blocked_at < 1
+
+
+def test_try_start_counts_against_type_budget():
+    async def main():
+        scheduler = make_scheduler(type_limits={"AntiTurnstileTaskProxyLess": 1})
+        task = {"taskId": "presolve-0", "type": "AntiTurnstileTaskProxyLess"}
+        first = scheduler.try_start(task, None)
+        # 类型预算已满
+        second = scheduler.try_start(dict(task, taskId="presolve-1"), None)
+        running = dict(scheduler.running)
+        await scheduler.done(first)
+        return first, second, running, scheduler
+
+    first, second, running, scheduler = asyncio.run(main())
+    assert first is not None and second is None
+    assert running == {"AntiTurnstileTaskProxyLess": 1}
+    assert scheduler.running == {} and scheduler.limiter.in_use == 0
+
+
+def test_idle_get_drops_expired_task_without_wakeup():
+    dropped = []
+
+    async def main():
+        # 执行位被占满，队列里的任务过期时没有 submit / done 来唤醒 get()
+        scheduler = make_scheduler(type_limits={"HcaptchaCracker": 1},
+                                   on_drop=lambda item, reason: dropped.append((item.task["taskId"], reason)))
+        busy = scheduler.try_start({"taskId": "t1", "type": "HcaptchaCracker"}, None)
+        await scheduler.submit({"taskId": "t2", "type": "HcaptchaCracker", "timeout": 0.1}, None)
+        waiter = asyncio.create_task(scheduler.get())
+        await asyncio.sleep(0.3)
+        queued = scheduler.queued()
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        await scheduler.done(busy)
+        return queued
+
+    assert asyncio.run(main()) == 0
+    assert dropped == [("t2", "expired")]
@@ -0,0 +1,58 @@
+import asyncio
+from types import SimpleNamespace
+
+from core.startup import StartupReport, warm_up_handlers
+
+PROXY = {"server": "http://127.0.0.1:8080"}
+
+
+def entry(task_type: str, behaviour=None):
+    calls = []
+
+    async def warm_up(config, proxy=None):
+        calls.append(proxy)
+        if behaviour == "fail":
+            raise RuntimeError("exit ip lookup failed")
+        if behaviour == "hang":
+            await asyncio.sleep(1)
+
+    return SimpleNamespace(task_type=task_type, warm_up=warm_up, calls=calls)
+
+
+def warm(entries, **startup):
+    startup.setdefault("warmup", True)
+    report = StartupReport()
+    types = asyncio.run(warm_up_handlers(entries, {"startup": startup}, report))
+    return types, report
+
+
+def test_failed_warm_up_keeps_type_registered_by_default():
+    ok, failing, slow = entry("A"), entry("B", "fail"), entry("C", "hang")
+    types, report = warm([ok, failing, slow], warmup_proxy=PROXY, warmup_timeout=0.1)
+    assert types == ["A", "B", "C"]
+    assert ok.calls == [PROXY]
+    assert report.warmup["A"].startswith("ok")
+    assert "exit ip lookup failed" in report.warmup["B"]
+    assert report.warmup["C"].startswith("超时")
+
+
+def test_drop_failed_unregisters_failed_types():
+    types, _ = warm([entry("A"), entry("B", "fail")], warmup_proxy=PROXY, drop_failed=True)
+    assert types == ["A"]
+
+
+def test_warm_up_skipped_without_proxy():
+    hooked = entry("A")
+    no_hook = SimpleNamespace(task_type="B", warm_up=None)
+    types, report = warm([hooked, no_hook])
+    # 没有 warmup_proxy 时不预先启动浏览器：direct 浏览器匹配不到带代理的任务
+    assert types == ["A", "B"]
+    assert hooked.calls == []
+    assert report.warmup == {"A": "跳过: 未配置 warmup_proxy"}
+
+
+def test_warm_up_disabled_by_default():
+    hooked = entry("A")
+    report = StartupReport()
+    types = asyncio.run(warm_up_handlers([hooked], {"startup": {"warmup_proxy": PROXY}}, report))
+    assert (types, hooked.calls, report.warmup) == (["A"], [], {})
@@ -0,0 +1,117 @@
+import multiprocessing
+import os
+import time
+import types
+
+import pytest
+
+from core import journal as journal_module
+from core import supervisor as supervisor_module
+from core.shard_worker import apply_shard, shard_share
+from core.supervisor import STABLE_SECONDS, Supervisor
+
+
+def crash_first_run(index, workers, cpus, status_queue, parent_pid, marker):
+    """第一次启动时异常退出，重启后上报一次状态并保持运行"""
+    if not os.path.exists(marker):
+        open(marker, "w").close()
+        os._exit(3)
+    status_queue.put({"shard": index, "pid": os.getpid(), "status": {"current_tasks": 1, "pending_tasks": 1},
+                      "metrics": {}})
+    time.sleep(30)
+
+
+@pytest.fixture
+def no_jitter(monkeypatch):
+    # 退避取抖动区间的上界
+    monkeypatch.setattr(journal_module.random, "uniform", lambda low, high: high)
+
+
+def test_crashed_shard_is_restarted_after_backoff(monkeypatch, tmp_path, no_jitter):
+    if "fork" not in multiprocessing.get_all_start_methods():
+        pytest.skip("需要 fork 启动方式")
+    marker = str(tmp_path / "crashed")
+    monkeypatch.setattr(supervisor_module, "shard_worker", types.SimpleNamespace(
+        run=lambda *args: crash_first_run(*args, marker)))
+    monkeypatch.setattr(supervisor_module, "metrics", types.SimpleNamespace(reset=lambda: None, merge=lambda m: None))
+    supervisor = Supervisor({}, workers=1, pin_cpus=False)
+    # fork 的子进程直接运行替换后的入口，不会导入真正的 worker
+    supervisor._ctx = multiprocessing.get_context("fork")
+    shard = supervisor.shards[0]
+    try:
+        supervisor._start(shard)
+        shard.process.join(10)
+        assert shard.process.exitcode == 3
+
+        supervisor._check(shard)
+        # 第一次退避 1 秒，期间不重启
+        assert shard.restart_at is not None and shard.restarts == 0
+        crashed_pid = shard.process.pid
+        supervisor._check(shard)
+        assert shard.restarts == 0
+
+        shard.restart_at = time.monotonic()
+        supervisor._check(shard)
+        assert shard.restarts == 1
+        assert shard.process.pid != crashed_pid and shard.process.is_alive()
+
+        deadline = time.monotonic() + 10
+        while not supervisor._drain_reports() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        status = supervisor.status()
+        assert (status["alive"], status["restarts"], status["current_tasks"]) == (1, 1, 1)
+    finally:
+        supervisor.stop()
+    assert not shard.process.is_alive()
+
+
+class DeadProcess:
+    pid = 4242
+    exitcode = 1
+
+    def is_alive(self):
+        return False
+
+
+def test_backoff_grows_for_crash_loops_and_resets_after_stable_run(no_jitter):
+    supervisor = Supervisor({}, workers=1, pin_cpus=False)
+    shard = supervisor.shards[0]
+    shard.process = DeadProcess()
+    delays = []
+    for _ in range(3):
+        # 启动后马上退出
+        shard.started_at = time.monotonic()
+        shard.restart_at = None
+        supervisor._check(shard)
+        delays.append(round(shard.restart_at - time.monotonic()))
+    assert delays == [1, 2, 4]
+
+    shard.started_at = time.monotonic() - STABLE_SECONDS
+    shard.restart_at = None
+    supervisor._check(shard)
+    assert round(shard.restart_at - time.monotonic()) == 1
+
+
+def test_shard_share_splits_budget_and_rewrites_config(monkeypatch):
+    config = {
+        "concurrency": 5,
+        "worker": {"name": "box"},
+        "journal": {"path": "tmp/.journal/results.jsonl"},
+        "metrics": {"port": 9108},
+        "type_concurrency": {"HcaptchaCracker": 1},
+    }
+    monkeypatch.setenv("WORKER_SHARDS", "2")
+    shares = []
+    for shard in ("0", "1"):
+        monkeypatch.setenv("WORKER_SHARD", shard)
+        shares.append(shard_share(5))
+    assert shares == [3, 2]
+
+    shard_config = apply_shard(config)
+    assert shard_config["worker"]["name"] == "box-1"
+    assert shard_config["journal"]["path"] == "tmp/.journal/results-1.jsonl"
+    assert shard_config["metrics"]["port"] is None
+    assert shard_config["concurrency"] == 2
+    # 每个分片至少 1
+    assert shard_config["type_concurrency"] == {"HcaptchaCracker": 1}
+    assert config["worker"]["name"] == "box"
@@ -0,0 +1,49 @@
+import asyncio
+
+from core.token_pool import TokenPool
+
+TASK = {"type": "AntiTurnstileTaskProxyLess", "taskId": "t1", "websiteURL": "https://example.com",
+        "websiteKey": "0x4AAA"}
+
+
+def test_key_kept_while_presolve_in_flight():
+    async def main():
+        release = asyncio.Event()
+        solves = []
+
+        async def solve(task):
+            solves.append(task)
+            await release.wait()
+            return {"status": "success", "token": "pre-solved"}
+
+        pool = TokenPool(solve, lambda: True, window=0.05, hot_threshold=1, max_per_key=1)
+        assert pool.take(dict(TASK)) is None
+        pool._refill()
+        await asyncio.sleep(0.1)
+        # 到达记录已过期、库存为空，但预求解仍在进行：key 不能被删除
+        pool._refill()
+        assert len(pool.keys) == 1 and pool.inflight == 1
+
+        release.set()
+        await asyncio.sleep(0.01)
+        result = pool.take(dict(TASK, taskId="t2"))
+        return pool, solves, result
+
+    pool, solves, result = asyncio.run(main())
+    assert len(solves) == 1
+    assert result["token"] == "pre-solved" and result["pooled"]
+    assert (pool.presolved, pool.hits, pool.inflight) == (1, 1, 0)
+
+
+def test_idle_key_is_forgotten():
+    async def main():
+        async def solve(task):
+            return None
+
+        pool = TokenPool(solve, lambda: False, window=0.05, hot_threshold=1)
+        pool.take(dict(TASK))
+        await asyncio.sleep(0.1)
+        pool._refill()
+        return pool
+
+    assert asyncio.run(main()).keys == {}
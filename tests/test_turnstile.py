@@ -0,0 +1,91 @@
+import asyncio
+import time
+
+import pytest
+
+pytest.importorskip("camoufox.async_api")
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
+from task_handlers.AntiTurnstileTaskProxyLess import TurnstileSolver
+
+
+class FakeHandle:
+    def __init__(self, value):
+        self.value = value
+
+    async def json_value(self):
+        return self.value
+
+
+class FakeLocator:
+    def __init__(self, page):
+        self.page = page
+
+    async def bounding_box(self, timeout=None):
+        return {"x": 0, "y": 0, "width": 70, "height": self.page.widget_height}
+
+    async def click(self, timeout=None):
+        self.page.clicks.append(time.monotonic())
+        if self.page.token_after_click is not None:
+            self.page.token_at = time.monotonic() + self.page.token_after_click
+
+
+class FakePage:
+    """模拟 Turnstile 组件：token 在 token_at 时刻出现（回调或隐藏 input），或在点击后 token_after_click 秒出现"""
+
+    def __init__(self, token_in=None, token_after_click=None, widget_height=65):
+        self.token_at = time.monotonic() + token_in if token_in is not None else None
+        self.token_after_click = token_after_click
+        self.widget_height = widget_height
+        self.clicks = []
+        self.polls = []
+
+    async def wait_for_function(self, expression, polling=None, timeout=None):
+        self.polls.append(polling)
+        deadline = time.monotonic() + timeout / 1000
+        while time.monotonic() < deadline:
+            if self.token_at is not None and time.monotonic() >= self.token_at:
+                return FakeHandle("token-1")
+            await asyncio.sleep(0.01)
+        raise PlaywrightTimeoutError("Timeout exceeded")
+
+    def locator(self, selector):
+        return FakeLocator(self)
+
+
+def solve(page, time_budget=5.0, click_interval=3.0):
+    async def main():
+        started = time.monotonic()
+        token, attempts = await TurnstileSolver()._get_turnstile_response(page, time_budget, click_interval)
+        return token, attempts, time.monotonic() - started
+
+    return asyncio.run(main())
+
+
+def test_token_returned_as_soon_as_callback_fires():
+    page = FakePage(token_in=0.2)
+    token, attempts, elapsed = solve(page)
+    # 不等满一个点击间隔
+    assert token == "token-1"
+    assert elapsed < 1
+    assert page.clicks == [] and page.polls == [100]
+    assert [a["token"] for a in attempts] == [True]
+
+
+def test_click_retried_only_after_interval_without_token():
+    page = FakePage(token_after_click=0.1)
+    token, attempts, elapsed = solve(page, click_interval=1.0)
+    assert token == "token-1"
+    assert len(page.clicks) == 1
+    assert [(a["clicked"], a["token"]) for a in attempts] == [(True, False), (False, True)]
+    assert attempts[0]["wait"] >= 1.0
+    assert 1.0 <= elapsed < 2
+
+
+def test_unrendered_widget_is_not_clicked_and_budget_is_respected():
+    page = FakePage(widget_height=0)
+    token, attempts, elapsed = solve(page, time_budget=2.5, click_interval=1.0)
+    assert token is None
+    assert page.clicks == []
+    assert all(not a["clicked"] for a in attempts)
+    assert 2.5 <= elapsed < 3.5
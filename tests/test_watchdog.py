@@ -0,0 +1,88 @@
+import subprocess
+import time
+
+import psutil
+
+from core import watchdog as watchdog_module
+from core.watchdog import ResourceWatchdog
+
+
+def detached_sleep() -> psutil.Process:
+    """启动一个父进程已退出、被 init 收养的进程，模拟 driver 退出后留下的浏览器"""
+    output = subprocess.check_output(["sh", "-c", "sleep 30 >/dev/null 2>&1 & echo $!"])
+    return psutil.Process(int(output))
+
+
+def test_only_tracked_orphans_are_killed(monkeypatch):
+    orphan, stranger, reused = detached_sleep(), detached_sleep(), detached_sleep()
+    try:
+        watchdog = ResourceWatchdog(interval=0)
+        # 启动时 orphan 在本进程树中
+        monkeypatch.setattr(watchdog_module, "browser_processes", lambda: [orphan])
+        assert watchdog.track_browsers() == {orphan.pid: orphan.create_time()}
+        # 同一 pid 但 create_time 不同：pid 已被复用，不是我们启动的进程
+        watchdog._known_browsers[reused.pid] = reused.create_time() - 100
+
+        monkeypatch.setattr(watchdog_module, "browser_processes", lambda: [])
+        first = watchdog.sample()
+        assert first["orphans"] == 1 and orphan.is_running()
+        watchdog.sample()
+        orphan.wait(timeout=5)
+
+        assert watchdog.orphans_killed == 1
+        assert stranger.is_running() and reused.is_running()
+        assert orphan.pid not in watchdog._known_browsers
+    finally:
+        for proc in (orphan, stranger, reused):
+            try:
+                proc.kill()
+            except psutil.Error:
+                pass
+
+
+def test_browser_under_driver_is_left_alone(monkeypatch):
+    # sh 充当 Playwright driver，sleep 充当它启动的浏览器
+    driver = subprocess.Popen(["sh", "-c", "sleep 30; true"])
+    time.sleep(0.2)
+    browser = psutil.Process(driver.pid).children()[0]
+    try:
+        monkeypatch.setattr(watchdog_module, "browser_processes", lambda: [browser])
+        watchdog = ResourceWatchdog(interval=0)
+        watchdog.sample()
+        watchdog.sample()
+        assert browser.is_running() and watchdog.orphans_killed == 0
+    finally:
+        browser.kill()
+        driver.kill()
+        driver.wait()
+
+
+def test_browser_adopted_by_this_process_is_killed(monkeypatch):
+    # 父进程是本进程：driver 已退出、浏览器被本进程收养（容器中本进程为 PID 1 时的情形）
+    child = subprocess.Popen(["sleep", "30"])
+    try:
+        proc = psutil.Process(child.pid)
+        monkeypatch.setattr(watchdog_module, "browser_processes", lambda: [proc])
+        watchdog = ResourceWatchdog(interval=0)
+        watchdog.sample()
+        watchdog.sample()
+        assert child.wait(timeout=5) is not None
+        assert watchdog.orphans_killed == 1
+    finally:
+        child.kill()
+        child.wait()
+
+
+def test_gc_is_opt_in_and_rate_limited(monkeypatch):
+    collections = []
+    monkeypatch.setattr(watchdog_module.gc, "collect", lambda: collections.append(1) or 0)
+    over = {"rss_mb": 2048, "fds": None}
+
+    ResourceWatchdog(kill_orphans=False)._maybe_collect(over)
+    assert collections == []
+
+    watchdog = ResourceWatchdog(gc_enabled=True, gc_rss_mb=1024, gc_min_interval=300, kill_orphans=False)
+    watchdog._maybe_collect({"rss_mb": 512, "fds": None})
+    watchdog._maybe_collect(over)
+    watchdog._maybe_collect(over)
+    assert collections == [1] and watchdog.gc_runs == 1